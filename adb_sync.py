@@ -1,10 +1,20 @@
+import os
 import subprocess
+import sys
+import threading
 import requests
 import json
 import time
 from datetime import datetime
 
-API_URL = "http://localhost:5000/api/sms/bulk"
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+from content_query import iter_rows, iter_stdout
+from poll_scheduler import PollScheduler
+
+INBOX_COLUMNS = ['date', 'address', 'body']
+
+API_URL = "http://localhost:5001/api/sms/bulk"
+BASE_INTERVAL = 10 # Seconds; the scheduler shortens it in bursts and stretches it when idle
 
 def get_sms_from_adb():
     try:
@@ -73,99 +83,82 @@ def get_sms_from_adb():
         return []
 
 def sync_via_adb():
+    """Returns how many inbox rows were read, or None if the sync failed"""
     print("Syncing SMS via ADB...")
     
     # Check if device is connected
     check = subprocess.run(['adb', 'devices'], capture_output=True, text=True)
     if "device\n" not in check.stdout and "device\r" not in check.stdout:
         print("Waiting for device...")
-        return
-
-    cmd = ['adb', 'shell', 'content', 'query', '--uri', 'content://sms/inbox', '--projection', 'date:address:body']
-    
-    try:
-        result = subprocess.run(cmd, capture_output=True, text=True, encoding='utf-8', errors='ignore')
-    except Exception as e:
-        print(f"ADB Execution Error: {e}")
-        return
+        return None
 
-    if result.returncode != 0:
-        print(f"ADB Error: {result.stderr}")
-        return
-        
-    output = result.stdout
+    cmd = ['adb', 'shell', 'content', 'query', '--uri', 'content://sms/inbox', '--projection', ':'.join(INBOX_COLUMNS)]
     
     bulk_data = []
-    import re
-    
-    lines = output.splitlines()
-    debug_count = 0
-    
-    for line in lines:
-        if "Row:" not in line:
-            continue
-            
-        if debug_count < 3:
-            print(f"DEBUG LINE: {line}")
-            debug_count += 1
-            
-        try:
-            # New Projection: date, address, body
-            # Expected formatting: Row: 0 date=173..., address=..., body=...
-            
-            # Extract Date first (safest)
+    try:
+        # Rows are parsed as adb streams them instead of buffering the whole dump
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        # stderr is drained alongside: a full pipe would block adb, and us on stdout
+        errors = []
+        drain = threading.Thread(target=lambda: errors.append(proc.stderr.read()), daemon=True)
+        drain.start()
+        for row in iter_rows(iter_stdout(proc.stdout), INBOX_COLUMNS):
             timestamp = None
-            date_match = re.search(r'date=([0-9]+)', line)
-            if date_match:
-                try:
-                    ts_millis = int(date_match.group(1))
-                    timestamp = datetime.fromtimestamp(ts_millis / 1000.0).isoformat()
-                except:
-                    pass
-            
-            # Extract Address
-            # It should be after date=... so we search for address=...
-            addr_match = re.search(r'address=(.*?)(, body=|$)', line)
-            if not addr_match: continue
-            address = addr_match.group(1).strip()
-            
-            # Extract Body
-            # It is usually last
-            body_match = re.search(r'body=(.*)$', line)
-            message = ""
-            if body_match:
-                message = body_match.group(1).strip()
-                # Remove trailing comma if it exists (artifacts from split or whatever)
-                # But 'body' is typically the rest of the line.
+            try:
+                timestamp = datetime.fromtimestamp(int(row.get('date')) / 1000.0).isoformat()
+            except (TypeError, ValueError):
+                pass
             
+            address = (row.get('address') or '').strip()
             if address:
                 bulk_data.append({
                     "sender": address,
-                    "message": message or "[Boş Mesaj]",
+                    "message": (row.get('body') or '').strip() or "[Boş Mesaj]",
                     "timestamp": timestamp
                 })
-        except Exception as e:
-            print(f"Parse Error on line: {e}")
-            continue
+        proc.wait()
+        drain.join()
+    except Exception as e:
+        print(f"ADB Execution Error: {e}")
+        return None
+
+    if proc.returncode != 0:
+        print(f"ADB Error: {b''.join(errors).decode('utf-8', errors='ignore')}")
+        return None
 
     if bulk_data:
         try:
             print(f"Sending {len(bulk_data)} SMS to backend...")
             resp = requests.post(API_URL, json=bulk_data)
-            if resp.status_code == 201:
-                print("Successfully synced SMS!")
+            if resp.status_code in (200, 201):
+                # 200 means everything was already stored
+                result = resp.json()
+                print(f"Successfully synced SMS! {result['inserted']} new, "
+                      f"{result['duplicate']} duplicate, {result['blocked']} blocked, {result['invalid']} invalid")
             else:
                  print(f"Failed to sync. Backend responded: {resp.status_code}")
         except Exception as e:
             print(f"API Connection Error: {e}")
-            print("Make sure the backend is running at http://localhost:5000")
+            print("Make sure the backend is running at http://localhost:5001")
             
     else:
         print("No SMS found or parsed.")
+    return len(bulk_data)
 
 if __name__ == "__main__":
     print("ADB Sync Tool Started")
     print("Press Ctrl+C to stop")
+    scheduler = PollScheduler()
+    scheduler.set_visible(False) # No window here, idle polls may stretch to the maximum
+    last_count = None
+    errors = 0
     while True:
-        sync_via_adb()
-        time.sleep(10)
+        count = sync_via_adb()
+        if count is None:
+            errors += 1
+            new_messages = 0
+        else:
+            errors = 0
+            new_messages = max(0, count - last_count) if last_count is not None else 0
+            last_count = count
+        time.sleep(scheduler.next_delay('adb_sync', BASE_INTERVAL, new_messages=new_messages, error_count=errors))
@@ -0,0 +1,34 @@
+package com.example.smssender
+
+/**
+ * Process-wide "inbox changed" signal. SmsReceiver and the SMS content
+ * observer bump the version; long-poll requests on the SmsServer block on it
+ * instead of the desktop polling on a timer.
+ */
+object SmsEvents {
+    private val lock = Object()
+    @Volatile
+    private var version = 0L
+
+    fun currentVersion(): Long = version
+
+    fun notifyChanged() {
+        synchronized(lock) {
+            version++
+            lock.notifyAll()
+        }
+    }
+
+    /** Waits until the version moves past [seenVersion] or [timeoutMs] passes. */
+    fun awaitChange(seenVersion: Long, timeoutMs: Long): Long {
+        val deadline = System.currentTimeMillis() + timeoutMs
+        synchronized(lock) {
+            while (version == seenVersion) {
+                val remaining = deadline - System.currentTimeMillis()
+                if (remaining <= 0) break
+                lock.wait(remaining)
+            }
+            return version
+        }
+    }
+}
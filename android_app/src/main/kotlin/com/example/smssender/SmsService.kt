@@ -6,9 +6,13 @@ import android.app.NotificationManager
 import android.app.Service
 import android.content.Context
 import android.content.Intent
+import android.database.ContentObserver
 import android.net.wifi.WifiManager
+import android.os.BatteryManager
 import android.os.Build
+import android.os.Handler
 import android.os.IBinder
+import android.os.Looper
 import android.os.PowerManager
 import androidx.core.app.NotificationCompat
 import fi.iki.elonen.NanoHTTPD
@@ -21,8 +25,21 @@ class SmsService : Service() {
 
     private var server: SmsServer? = null
     private val PORT = 8080
+    private val DEFAULT_PAGE_SIZE = 200
+    private val MAX_PAGE_SIZE = 1000
     private val CHANNEL_ID = "SmsServiceChannel"
     
+    private val LONG_POLL_MAX_SECONDS = 55L
+    // The provider row can land after the SMS broadcast, so waiting requests
+    // re-check at least this often even without a signal
+    private val PROVIDER_RECHECK_MS = 1000L
+
+    private val smsObserver = object : ContentObserver(Handler(Looper.getMainLooper())) {
+        override fun onChange(selfChange: Boolean) {
+            SmsEvents.notifyChanged()
+        }
+    }
+
     private var wakeLock: PowerManager.WakeLock? = null
     private var wifiLock: WifiManager.WifiLock? = null
 
@@ -40,6 +57,8 @@ class SmsService : Service() {
         // WIFI_MODE_FULL_HIGH_PERF is recommended for low latency apps, though deprecated in some versions it's best for servers
         wifiLock = wifiManager.createWifiLock(WifiManager.WIFI_MODE_FULL_HIGH_PERF, "SmsSender::WifiLock")
         wifiLock?.acquire()
+
+        contentResolver.registerContentObserver(android.net.Uri.parse("content://sms"), true, smsObserver)
     }
 
     override fun onStartCommand(intent: Intent?, flags: Int, startId: Int): Int {
@@ -72,6 +91,7 @@ class SmsService : Service() {
     override fun onDestroy() {
         super.onDestroy()
         server?.stop()
+        contentResolver.unregisterContentObserver(smsObserver)
         
         try {
             if (wakeLock?.isHeld == true) wakeLock?.release()
@@ -120,12 +140,48 @@ class SmsService : Service() {
             
             if (session.uri == "/sms") {
                 return try {
-                    val json = readSmsToJson()
+                    val params = session.parameters
+                    val since = params["since"]?.firstOrNull()?.toLongOrNull()
+                    val json = if (since != null) {
+                        // Delta mode: rows after the (date, _id) cursor, oldest first
+                        val sinceId = params["since_id"]?.firstOrNull()?.toLongOrNull()
+                        val limit = (params["limit"]?.firstOrNull()?.toIntOrNull() ?: DEFAULT_PAGE_SIZE)
+                            .coerceIn(1, MAX_PAGE_SIZE)
+                        readSmsSince(since, sinceId, limit).toString()
+                    } else {
+                        readSmsToJson()
+                    }
                     newFixedLengthResponse(Response.Status.OK, "application/json", json)
                 } catch (e: Exception) {
                     newFixedLengthResponse(Response.Status.INTERNAL_ERROR, "text/plain", "Error: ${e.message}")
                 }
             }
+            if (session.uri == "/sms/wait") {
+                // Long-poll: hold the request until something newer than the
+                // cursor exists or the timeout passes, then answer like /sms
+                return try {
+                    val params = session.parameters
+                    val since = params["since"]?.firstOrNull()?.toLongOrNull() ?: 0L
+                    val sinceId = params["since_id"]?.firstOrNull()?.toLongOrNull()
+                    val limit = (params["limit"]?.firstOrNull()?.toIntOrNull() ?: DEFAULT_PAGE_SIZE)
+                        .coerceIn(1, MAX_PAGE_SIZE)
+                    val timeoutMs = (params["timeout"]?.firstOrNull()?.toLongOrNull() ?: 25L)
+                        .coerceIn(1L, LONG_POLL_MAX_SECONDS) * 1000
+                    val deadline = System.currentTimeMillis() + timeoutMs
+
+                    var version = SmsEvents.currentVersion()
+                    var page = readSmsSince(since, sinceId, limit)
+                    while (page.getJSONArray("messages").length() == 0) {
+                        val remaining = deadline - System.currentTimeMillis()
+                        if (remaining <= 0) break
+                        version = SmsEvents.awaitChange(version, minOf(remaining, PROVIDER_RECHECK_MS))
+                        page = readSmsSince(since, sinceId, limit)
+                    }
+                    newFixedLengthResponse(Response.Status.OK, "application/json", page.toString())
+                } catch (e: Exception) {
+                    newFixedLengthResponse(Response.Status.INTERNAL_ERROR, "text/plain", "Error: ${e.message}")
+                }
+            }
             if (session.uri == "/") {
                   return newFixedLengthResponse("<html><body><h1>SMS Server Calisiyor</h1></body></html>")
             }
@@ -133,6 +189,70 @@ class SmsService : Service() {
         }
     }
 
+    /**
+     * Paged delta: messages newer than the (since, sinceId) cursor in ascending
+     * order, so the desktop can walk a backlog page by page and keep the last
+     * row as its next cursor. sinceId breaks ties between rows with the same date.
+     */
+    private fun readSmsSince(since: Long, sinceId: Long?, limit: Int): JSONObject {
+        val messages = JSONArray()
+        val uri = android.net.Uri.parse("content://sms/inbox")
+        val selection: String
+        val args: Array<String>
+        if (sinceId != null) {
+            selection = "date > ? OR (date = ? AND _id > ?)"
+            args = arrayOf(since.toString(), since.toString(), sinceId.toString())
+        } else {
+            selection = "date > ?"
+            args = arrayOf(since.toString())
+        }
+        // One extra row tells us whether another page follows
+        val cursor = contentResolver.query(uri, arrayOf("_id", "address", "body", "date"),
+            selection, args, "date ASC, _id ASC LIMIT ${limit + 1}")
+
+        var hasMore = false
+        var nextSince = since
+        var nextSinceId = sinceId ?: 0L
+        cursor?.use {
+            val idxId = it.getColumnIndex("_id")
+            val idxAddress = it.getColumnIndex("address")
+            val idxBody = it.getColumnIndex("body")
+            val idxDate = it.getColumnIndex("date")
+
+            while (it.moveToNext()) {
+                if (messages.length() == limit) {
+                    hasMore = true
+                    break
+                }
+                val id = if (idxId >= 0) it.getLong(idxId) else 0L
+                val date = if (idxDate >= 0) it.getLong(idxDate) else 0L
+                val jsonObj = JSONObject()
+                jsonObj.put("_id", id)
+                jsonObj.put("address", if (idxAddress >= 0) it.getString(idxAddress) else "Unknown")
+                jsonObj.put("body", if (idxBody >= 0) it.getString(idxBody) else "")
+                jsonObj.put("date", date)
+                messages.put(jsonObj)
+                nextSince = date
+                nextSinceId = id
+            }
+        }
+
+        return JSONObject()
+            .put("messages", messages)
+            .put("next_since", nextSince)
+            .put("next_since_id", nextSinceId)
+            .put("has_more", hasMore)
+            .put("battery", batteryInfo())
+    }
+
+    /** Battery hint for the desktop's poll scheduler: it polls less on a low, unplugged phone */
+    private fun batteryInfo(): JSONObject {
+        val bm = getSystemService(Context.BATTERY_SERVICE) as BatteryManager
+        return JSONObject()
+            .put("level", bm.getIntProperty(BatteryManager.BATTERY_PROPERTY_CAPACITY))
+            .put("charging", bm.isCharging)
+    }
+
     private fun readSmsToJson(): String {
         val jsonArray = JSONArray()
         val uri = android.net.Uri.parse("content://sms/inbox")
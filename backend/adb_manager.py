@@ -1,31 +1,47 @@
+import logging
 import subprocess
 import time
 from datetime import datetime
-import re
 import threading
 
 import os
 
-class ADBSyncer:
-    def __init__(self, app_context, save_callback):
-        self.active = False
-        self.device_serial = None
-        self.thread = None
-        self.save_callback = save_callback # Function to save SMS to DB
-        self.app_context = app_context
-    
-    def _get_subprocess_kwargs(self):
-        """Returns kwargs to suppress console window on Windows"""
-        kwargs = {}
-        if os.name == 'nt':
-            # 0x08000000 is CREATE_NO_WINDOW
-            kwargs['creationflags'] = 0x08000000 
-        return kwargs
+from adb_shell import ADBShellPool
+from blocklist import Blocklist
+from content_query import aiter_rows
 
-    def get_devices(self):
-        """Returns list of connected devices"""
+log = logging.getLogger(__name__)
+
+CURSOR_KEY = 'adb_cursor:'
+DEVICES_TTL = 2.0 # Seconds to reuse the last `adb devices` answer
+INBOX_COLUMNS = ['_id', 'date', 'address', 'body']
+BLOCKED_COLUMNS = ['original_number']
+CHUNK_SIZE = 500 # Rows per save_callback call while a query is streaming
+BATTERY_REFRESH = 300 # Seconds between `dumpsys battery` reads
+# The phone's blocked list changes rarely; re-read it this often (seconds),
+# or right away after invalidate_blocked()
+BLOCKED_REFRESH = 600
+
+_devices_cache = (0.0, []) # Shared by every ADBSyncer, `adb devices` lists them all
+_devices_lock = threading.Lock()
+
+def _get_subprocess_kwargs():
+    """Returns kwargs to suppress console window on Windows"""
+    kwargs = {}
+    if os.name == 'nt':
+        # 0x08000000 is CREATE_NO_WINDOW
+        kwargs['creationflags'] = 0x08000000 
+    return kwargs
+
+def list_devices():
+    """Returns list of connected devices"""
+    global _devices_cache
+    with _devices_lock:
+        fetched_at, cached = _devices_cache
+        if time.monotonic() - fetched_at < DEVICES_TTL:
+            return cached
         try:
-            result = subprocess.run(['adb', 'devices'], capture_output=True, text=True, **self._get_subprocess_kwargs())
+            result = subprocess.run(['adb', 'devices'], capture_output=True, text=True, **_get_subprocess_kwargs())
             lines = result.stdout.splitlines()
             devices = []
             for line in lines[1:]:
@@ -36,132 +52,191 @@ class ADBSyncer:
                             'serial': parts[0],
                             'state': parts[1]
                         })
+            _devices_cache = (time.monotonic(), devices)
             return devices
         except Exception as e:
-            print(f"ADB Error: {e}")
+            log.warning("ADB Error: %s", e)
             return []
 
-    def start_sync(self, serial):
+class ADBSyncer:
+    """Syncs one USB device. Its I/O runs on the sync engine's loop;
+    DeviceManager schedules poll_once() and cancels it to stop."""
+
+    def __init__(self, app_context, save_callback, state_store=None, poll_interval=5.0, shell_pool=None):
+        self.active = False
+        self.device_serial = None
+        self.save_callback = save_callback # Coroutine that stores a batch (rows, final=...)
+        self.app_context = app_context
+        self.state_store = state_store # Persists the per-device high-water mark
+        self.cursors = {} # Used instead when there is no state_store
+        self.full_resync = False
+        self.poll_interval = poll_interval
+        self.battery = None # {'level', 'charging'} for the poll scheduler
+        self._battery_read_at = 0.0
+        self.device_blocklist = Blocklist() # The phone's own blocked numbers
+        self.device_blocked = frozenset()
+        self._blocked_read_at = None
+        self.on_blocked_changed = None # Called with (serial, numbers) when the phone's list changes
+        # One persistent `adb shell` per device; DeviceManager passes a shared pool
+        self.shell_pool = shell_pool or ADBShellPool()
+
+    def get_devices(self):
+        return list_devices()
+
+    def attach(self, serial, full_resync=False, poll_interval=None):
+        """Points the syncer at a device"""
+        if self.device_serial and self.device_serial != serial:
+            self.shell_pool.close(self.device_serial)
         self.device_serial = serial
+        self.full_resync = full_resync or self.get_cursor(serial) is None
+        if poll_interval: self.poll_interval = poll_interval
         self.active = True
-        if self.thread is None or not self.thread.is_alive():
-            self.thread = threading.Thread(target=self._sync_loop, daemon=True)
-            self.thread.start()
 
     def stop_sync(self):
+        """Kills the device's shell; the caller cancels the running task"""
         self.active = False
+        if self.device_serial:
+            self.shell_pool.close(self.device_serial)
 
-    def _sync_loop(self):
-        print(f"Starting sync for {self.device_serial}")
-        while self.active:
-            try:
-                self._fetch_and_save()
-            except Exception as e:
-                print(f"Sync Error: {e}")
-            
-            # Sleep 
-            for _ in range(50): # Check active status every 100ms
-                if not self.active: break
-                time.sleep(0.1)
-
-    def get_blocked_numbers(self):
-        """Fetches blocked numbers from the device"""
+    def get_metrics(self):
+        return self.shell_pool.get_metrics()
+
+    def get_cursor(self, serial):
+        """Last synced inbox row for a device: {'id': _id, 'date': millis} or None"""
+        if not self.state_store: return self.cursors.get(serial)
+        return self.state_store.get_meta(CURSOR_KEY + serial)
+
+    def set_cursor(self, serial, cursor):
+        if self.state_store:
+            self.state_store.set_meta(CURSOR_KEY + serial, cursor)
+        else:
+            self.cursors[serial] = cursor
+
+    def reset_cursors(self):
+        """Forget every device's high-water mark so the next connect does a full resync"""
+        self.cursors.clear()
+        if self.state_store:
+            self.state_store.delete_meta(CURSOR_KEY, prefix=True)
+
+    def poll_delay(self):
+        """Seconds until the next pass"""
+        return self.poll_interval
+
+    async def get_blocked_numbers(self):
+        """Fetches blocked numbers from the device, None if the query failed"""
         blocked = set()
         # Some devices use 'original_number', others 'column1', but let's try standard provider FIRST.
-        cmd = ['adb', '-s', self.device_serial, 'shell', 'content', 'query', '--uri', 'content://com.android.blockednumber/blocked', '--projection', 'original_number']
+        cmd = "content query --uri content://com.android.blockednumber/blocked --projection original_number"
         try:
-            result = subprocess.run(cmd, capture_output=True, text=True, encoding='utf-8', errors='ignore', **self._get_subprocess_kwargs())
-            for line in result.stdout.splitlines():
-                # Format: Row: 0 original_number=123456...
-                # Regex to grab the number
-                match = re.search(r'original_number=(.*?)($|,)', line)
-                if match:
-                    num = match.group(1).strip()
-                    if num: blocked.add(num)
+            async for row in aiter_rows(self.shell_pool.stream(self.device_serial, cmd), BLOCKED_COLUMNS):
+                num = (row.get('original_number') or '').strip()
+                if num: blocked.add(num)
         except Exception:
-            pass
+            return None
         return blocked
 
-    def _fetch_and_save(self):
-        # Local import to prevent scope issues
-        import re
+    def invalidate_blocked(self):
+        """Re-read the phone's blocked numbers on the next poll"""
+        self._blocked_read_at = None
+
+    async def refresh_blocked(self):
+        """Re-reads the phone's blocked numbers every BLOCKED_REFRESH seconds.
+        The blocklist is only recompiled (and reported) when the set changed."""
+        if self._blocked_read_at is not None and time.monotonic() - self._blocked_read_at < BLOCKED_REFRESH:
+            return
+        numbers = await self.get_blocked_numbers()
+        if numbers is None:
+            return # Keep the last list, try again next poll
+        self._blocked_read_at = time.monotonic()
+        numbers = frozenset(numbers)
+        if numbers == self.device_blocked:
+            return
+        self.device_blocked = numbers
+        # Compared in E.164 form, so 0555... on the phone blocks +90555...
+        self.device_blocklist = Blocklist(numbers)
+        log.info("%s: %d blocked numbers on the phone", self.device_serial, len(numbers))
+        if self.on_blocked_changed:
+            self.on_blocked_changed(self.device_serial, numbers)
+
+    async def read_battery(self):
+        """Refreshes self.battery from `dumpsys battery` every BATTERY_REFRESH seconds"""
+        if time.monotonic() - self._battery_read_at < BATTERY_REFRESH:
+            return self.battery
+        self._battery_read_at = time.monotonic()
+        try:
+            _, output = await self.shell_pool.run(self.device_serial, "dumpsys battery", timeout=5, retries=0)
+        except Exception:
+            return self.battery
+        info = {}
+        for line in output.splitlines():
+            key, _, value = line.strip().partition(':')
+            info[key.strip()] = value.strip()
+        if 'level' in info:
+            self.battery = {
+                'level': int(info['level']) if info['level'].isdigit() else None,
+                'charging': any(info.get(k) == 'true' for k in ('AC powered', 'USB powered', 'Wireless powered'))
+            }
+        return self.battery
+
+    async def poll_once(self):
+        """One incremental pass over the inbox, raises on failure"""
+        serial = self.device_serial
+        cursor = None if self.full_resync else self.get_cursor(serial)
+        cmd = "content query --uri content://sms/inbox --projection " + ":".join(INBOX_COLUMNS)
+        if cursor:
+            # Quoted so the device shell doesn't read '>' as a redirect
+            cmd += f" --where '_id>{int(cursor['id'])}'"
         
-        cmd = ['adb', '-s', self.device_serial, 'shell', 'content', 'query', '--uri', 'content://sms/inbox', '--projection', 'date:address:body']
+        # 1. Blocked numbers and battery state, both only now and then
+        await self.refresh_blocked()
+        await self.read_battery()
+
+        # 2. Stream the query over the device's persistent shell; rows are
+        # handed to the callback in chunks while adb is still sending
+        bulk_data = []
+        max_id = cursor['id'] if cursor else 0
+        max_date = cursor['date'] if cursor else 0
         
-        try:
-            # 1. Get blocked numbers first
-            blocked_numbers = self.get_blocked_numbers()
-            # print(f"DEBUG: Found {len(blocked_numbers)} blocked numbers")
-
-            # 2. Run ADB
-            result = subprocess.run(cmd, capture_output=True, text=True, encoding='utf-8', errors='ignore', **self._get_subprocess_kwargs())
-            if result.returncode != 0: 
-                return
-
-            output = result.stdout
-            lines = output.splitlines()
-            # print(f"DEBUG: ADB returned {len(lines)} lines")
-            
-            bulk_data = []
-            
-            debug_count = 0
-            for i, line in enumerate(lines):
-                if not line.strip(): continue
-                
-                # Debug first few lines
-                # if debug_count < 3:
-                #      print(f"DEBUG LINE: {line}")
-                #      debug_count += 1
+        async for row in aiter_rows(self.shell_pool.stream(serial, cmd), INBOX_COLUMNS):
+            try:
+                # Track the high-water mark even for rows we skip below
+                if row.get('_id'):
+                    max_id = max(max_id, int(row['_id']))
+
+                timestamp = None
+                if row.get('date'):
+                    ts_millis = int(row['date'])
+                    max_date = max(max_date, ts_millis)
+                    try:
+                        timestamp = datetime.fromtimestamp(ts_millis / 1000.0).isoformat()
+                    except: pass
                 
-                if "address=" not in line: continue
-
-                try:
-                    # Extract timestamp
-                    timestamp = None
-                    # Use explicit re module from local import
-                    date_match = re.search(r'date=([0-9]+)', line)
-                    if date_match:
-                        ts_millis = int(date_match.group(1))
-                        try:
-                            timestamp = datetime.fromtimestamp(ts_millis / 1000.0).isoformat()
-                        except: pass
-                    
-                    # Extract Address
-                    addr_match = re.search(r'address=(.*?)(, body=|, date=|$)', line)
-                    
-                    if not addr_match: 
-                        continue
-
-                    address = addr_match.group(1).strip()
-                    if not address: continue 
-                    
-                    # Ensure clean string for blocking check
-                    address = address.strip() 
-
-                    # CHECK IF BLOCKED
-                    if address in blocked_numbers:
-                        continue
-                    
-                    # Extract Body
-                    body_match = re.search(r'body=(.*)$', line)
-                    message = ""
-                    if body_match:
-                        message = body_match.group(1).strip()
-                    
-                    bulk_data.append({
-                        "sender": address,
-                        "message": message or "[Boş Mesaj]",
-                        "timestamp": timestamp
-                    })
-                except Exception as inner_e:
-                    print(f"Parse Error at line {i}: {inner_e}")
+                address = (row.get('address') or '').strip()
+                if not address: continue 
+
+                # CHECK IF BLOCKED
+                if self.device_blocklist.sender_blocked(address):
                     continue
-            
-            # Save via Callback
-            if bulk_data:
-                self.save_callback(bulk_data)
                 
-        except Exception as e:
-            import traceback
-            print(f"Fetch Error: {e}")
-            traceback.print_exc()
+                message = (row.get('body') or '').strip()
+                bulk_data.append({
+                    "sender": address,
+                    "message": message or "[Boş Mesaj]",
+                    "timestamp": timestamp,
+                    "device": serial
+                })
+            except ValueError as inner_e:
+                log.warning("Parse Error in row %s: %s", row.get('_id'), inner_e)
+                continue
+
+            if len(bulk_data) >= CHUNK_SIZE:
+                await self.save_callback(bulk_data, final=False)
+                bulk_data = []
+        
+        # Save via Callback
+        await self.save_callback(bulk_data, final=True)
+
+        # Only advance the cursor once the rows are stored
+        if max_id and (not cursor or max_id > cursor['id']):
+            self.set_cursor(serial, {'id': max_id, 'date': max_date})
+        self.full_resync = False
@@ -0,0 +1,190 @@
+import asyncio
+import os
+import time
+import uuid
+
+# A body can be long, but a single line of it shouldn't exceed this
+LINE_LIMIT = 4 * 1024 * 1024
+
+
+class ADBShellError(Exception):
+    pass
+
+
+class ADBShellSession:
+    """One long-lived `adb -s <serial> shell` process, driven from the sync engine's loop.
+
+    Commands are written to the shell's stdin one at a time and followed by a
+    unique sentinel line carrying the exit status, so the output of each
+    command can be cut out of the shared stdout stream without spawning a new
+    adb process per query.
+    """
+
+    def __init__(self, serial, adb_path='adb', popen_kwargs=None):
+        self.serial = serial
+        self.adb_path = adb_path
+        self.popen_kwargs = popen_kwargs or {}
+        self.proc = None
+        self.killed = None # Last process close() killed, aclose() reaps it
+        self.lock = asyncio.Lock()
+        self.token = f"__SMS_SYNC_{uuid.uuid4().hex}__"
+        self.last_status = None
+        self.metrics = {
+            'commands': 0,
+            'errors': 0,
+            'restarts': 0,
+            'total_time': 0.0,
+            'last_time': 0.0,
+            'started_at': None
+        }
+
+    def is_alive(self):
+        return self.proc is not None and self.proc.returncode is None
+
+    async def start(self):
+        if self.metrics['started_at'] is not None:
+            self.metrics['restarts'] += 1
+        self.close()
+        self.proc = await asyncio.create_subprocess_exec(
+            self.adb_path, '-s', self.serial, 'shell',
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+            limit=LINE_LIMIT,
+            **self.popen_kwargs)
+        self.metrics['started_at'] = time.time()
+
+    async def _readline(self, deadline, command, timeout):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise ADBShellError(f"Timed out after {timeout}s: {command}")
+        try:
+            raw = await asyncio.wait_for(self.proc.stdout.readline(), remaining)
+        except asyncio.TimeoutError:
+            raise ADBShellError(f"Timed out after {timeout}s: {command}")
+        if not raw:
+            raise ADBShellError("adb shell exited")
+        return raw.decode('utf-8', errors='ignore').rstrip('\r\n')
+
+    async def stream(self, command, timeout=30):
+        """Runs a shell command and yields its output lines as they arrive.
+
+        The exit status is available as `self.last_status` once the generator
+        is exhausted. The session lock is held for the whole iteration.
+        """
+        async with self.lock:
+            if not self.is_alive():
+                await self.start()
+            started = time.perf_counter()
+            self.last_status = None
+            try:
+                self.proc.stdin.write(f"{command}; printf '\\n{self.token} %d\\n' $?\n".encode('utf-8'))
+                await self.proc.stdin.drain()
+
+                deadline = time.monotonic() + timeout
+                pending = None # Held back one line: the sentinel is preceded by an extra newline
+                while True:
+                    line = await self._readline(deadline, command, timeout)
+                    if line.startswith(self.token):
+                        self.last_status = int(line.split()[-1])
+                        if pending: yield pending
+                        break
+                    if pending is not None: yield pending
+                    pending = line
+            except (GeneratorExit, asyncio.CancelledError):
+                # Caller stopped early, the rest of the output is still in the pipe
+                self.close()
+                raise
+            except (ADBShellError, OSError, ValueError):
+                self.metrics['errors'] += 1
+                # Output framing can't be trusted any more, restart on next use
+                self.close()
+                raise
+            finally:
+                elapsed = time.perf_counter() - started
+                self.metrics['commands'] += 1
+                self.metrics['total_time'] += elapsed
+                self.metrics['last_time'] = elapsed
+
+    async def run(self, command, timeout=30):
+        """Runs a shell command, returns (exit_status, output)"""
+        lines = [line async for line in self.stream(command, timeout=timeout)]
+        return self.last_status, "\n".join(lines)
+
+    def close(self):
+        proc, self.proc = self.proc, None
+        if proc is None or proc.returncode is not None: return
+        self.killed = proc
+        try:
+            proc.stdin.close()
+        except Exception: pass
+        try:
+            proc.kill()
+        except Exception: pass
+
+    async def aclose(self):
+        """close() and wait for the process, so no transport outlives the loop"""
+        self.close()
+        proc, self.killed = self.killed, None
+        if proc is not None:
+            try:
+                await asyncio.wait_for(proc.wait(), 2)
+            except Exception: pass
+
+
+class ADBShellPool:
+    """Keeps one ADBShellSession per device serial. Only used from the loop thread."""
+
+    def __init__(self, adb_path='adb'):
+        self.adb_path = adb_path
+        self.sessions = {}
+
+    def _popen_kwargs(self):
+        if os.name == 'nt':
+            # 0x08000000 is CREATE_NO_WINDOW
+            return {'creationflags': 0x08000000}
+        return {}
+
+    def get(self, serial):
+        session = self.sessions.get(serial)
+        if session is None:
+            session = ADBShellSession(serial, self.adb_path, self._popen_kwargs())
+            self.sessions[serial] = session
+        return session
+
+    async def run(self, serial, command, timeout=30, retries=1):
+        """Runs a command on the device's session, restarting the shell once if it died"""
+        for attempt in range(retries + 1):
+            try:
+                return await self.get(serial).run(command, timeout=timeout)
+            except ADBShellError:
+                if attempt == retries: raise
+
+    def stream(self, serial, command, timeout=30):
+        return self.get(serial).stream(command, timeout=timeout)
+
+    def close(self, serial):
+        session = self.sessions.pop(serial, None)
+        if session: session.close()
+
+    def close_all(self):
+        for serial in list(self.sessions):
+            self.close(serial)
+
+    async def aclose(self, serial):
+        session = self.sessions.pop(serial, None)
+        if session: await session.aclose()
+
+    async def aclose_all(self):
+        sessions, self.sessions = list(self.sessions.values()), {}
+        for session in sessions:
+            await session.aclose()
+
+    def get_metrics(self):
+        result = {}
+        for serial, session in list(self.sessions.items()):
+            m = dict(session.metrics)
+            m['alive'] = session.is_alive()
+            m['avg_time'] = m['total_time'] / m['commands'] if m['commands'] else 0.0
+            result[serial] = m
+        return result
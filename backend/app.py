@@ -1,21 +1,33 @@
-from flask import Flask, request, jsonify, send_from_directory
+# Times every import below, see /api/debug/startup
+import startup_report
+startup_report.install()
+
+from flask import Flask, Response, request, jsonify, send_from_directory, stream_with_context
 from flask_cors import CORS
 from datetime import datetime
+import atexit
 import json
+import logging
 import os
 import sys
-import re
-import winsound
 import threading
-import webview
-import pystray
-from PIL import Image
-import subprocess
-from win11toast import toast
 
 # Add current directory to path for import
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-from adb_manager import ADBSyncer
+from device_manager import DeviceManager
+from poll_scheduler import CLIENT_TTL, PollScheduler
+from sms_store import SQLiteSMSStore, normalize_sender, normalize_timestamp
+from event_bus import EventBus
+from app_state import AppState
+from blocklist import BlocklistError
+from dedupe import dedupe_key
+import debug_log
+from connection_log import ConnectionLog
+from ingest import IngestQueue, iter_json_items, iter_ndjson_items
+from http_cache import ResponseCache
+from notifier import NotificationDispatcher, SoundPlayer
+# Window, tray and toasts are an adapter that loads its libraries when started
+from platform_ui import DesktopUI, HeadlessUI, desktop_available
 
 # Paths & Configuration
 if getattr(sys, 'frozen', False):
@@ -36,8 +48,9 @@ if getattr(sys, 'frozen', False):
     
     # User Data (Persistent)
     SMS_STORAGE_FILE = os.path.join(EXE_DIR, 'sms_storage.json')
+    SMS_DB_FILE = os.path.join(EXE_DIR, 'sms_storage.db')
     CONFIG_FILE = os.path.join(EXE_DIR, 'config.json')
-    LOGS_FILE = os.path.join(EXE_DIR, 'connection_logs.json')
+    LOGS_FILE = os.path.join(EXE_DIR, 'connection_logs.jsonl')
     LOG_PATH = os.path.join(EXE_DIR, 'sms_debug.txt')
     
 else:
@@ -47,10 +60,13 @@ else:
     FRONTEND_DIST = os.path.join(os.path.dirname(BASE_DIR), 'frontend', 'dist')
     ICON_PATH = os.path.join(os.path.dirname(BASE_DIR), 'app_icon.ico')
     
-    SMS_STORAGE_FILE = os.path.join(BASE_DIR, 'sms_storage.json')
-    CONFIG_FILE = os.path.join(BASE_DIR, 'config.json')
-    LOGS_FILE = os.path.join(BASE_DIR, 'connection_logs.json')
-    LOG_PATH = os.path.join(BASE_DIR, 'sms_debug.txt')
+    # User data next to the code, unless SMS_SYNC_DATA_DIR points elsewhere (tests)
+    DATA_DIR = os.environ.get('SMS_SYNC_DATA_DIR') or BASE_DIR
+    SMS_STORAGE_FILE = os.path.join(DATA_DIR, 'sms_storage.json')
+    SMS_DB_FILE = os.path.join(DATA_DIR, 'sms_storage.db')
+    CONFIG_FILE = os.path.join(DATA_DIR, 'config.json')
+    LOGS_FILE = os.path.join(DATA_DIR, 'connection_logs.jsonl')
+    LOG_PATH = os.path.join(DATA_DIR, 'sms_debug.txt')
 
 # Ensure we can find the ringtone later
 RINGTONE_PATH = os.path.join(ASSET_DIR, 'ringtone.mp3')
@@ -58,372 +74,636 @@ RINGTONE_PATH = os.path.join(ASSET_DIR, 'ringtone.mp3')
 app = Flask(__name__, static_folder=os.path.join(FRONTEND_DIST, 'assets'))
 CORS(app)
 
-# Global variables for Window and Tray
-window = None
-tray_icon = None
-is_running_in_tray = False
-
-class Logger(object):
-    def __init__(self):
-        self.terminal = sys.stdout
-        self.log = open(LOG_PATH, "a", encoding='utf-8', buffering=1)
+# Change events for /api/events subscribers (UI, desktop notifier)
+event_bus = EventBus()
 
-    def write(self, message):
-        try: self.terminal.write(message)
-        except: pass
-        try: self.log.write(message)
-        except: pass
+# ETag / 304 and prebuilt JSON for the endpoints clients poll
+response_cache = ResponseCache()
 
-    def flush(self):
-        try: self.terminal.flush()
-        except: pass
+# Desktop (window, tray, toasts) or headless; swapped in by the entry point
+ui = HeadlessUI()
 
-sys.stdout = Logger()
-sys.stderr = sys.stdout
+# Queue-backed, rotated debug log; levels are applied from config below
+debug_log.setup(LOG_PATH)
+log = logging.getLogger('app')
 
 # --- SMS STORAGE & LOGS ---
 
-def load_sms():
-    if os.path.exists(SMS_STORAGE_FILE):
-        try:
-            with open(SMS_STORAGE_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except: return []
-    return []
-
-def save_sms(sms_list):
-    with open(SMS_STORAGE_FILE, 'w', encoding='utf-8') as f:
-        json.dump(sms_list, f, ensure_ascii=False, indent=2)
-
-def load_logs():
-    if os.path.exists(LOGS_FILE):
-        try: 
-            with open(LOGS_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except: return []
-    return []
+# sms_storage.json is only read once to migrate into the SQLite store
+with startup_report.phase('open store'):
+    store = SQLiteSMSStore(SMS_DB_FILE)
+    store.migrate_from_json(SMS_STORAGE_FILE)
+
+# Connect/disconnect history, one appended line per event (rotated, see connection_log.py)
+connection_log = ConnectionLog(LOGS_FILE)
+connection_log.migrate_from_json(os.path.splitext(LOGS_FILE)[0] + '.json')
 
 def save_logs(log_entry):
-    logs = load_logs()
-    logs.append(log_entry)
-    with open(LOGS_FILE, 'w', encoding='utf-8') as f:
-        json.dump(logs, f, ensure_ascii=False, indent=2)
+    connection_log.append(log_entry)
 
-# ... (Blocked Logic Same as Before) ...
 BLOCKED_FILE = os.path.join(os.path.dirname(SMS_STORAGE_FILE), 'blocked_senders.json')
-def load_blocked():
-    if os.path.exists(BLOCKED_FILE):
-        try:
-            with open(BLOCKED_FILE, 'r', encoding='utf-8') as f:
-                return set(json.load(f))
-        except: return set()
-    return set()
-def save_blocked(blocked_set):
-    with open(BLOCKED_FILE, 'w', encoding='utf-8') as f:
-        json.dump(list(blocked_set), f, ensure_ascii=False, indent=2)
-
-def normalize_sender(s):
-    if not s: return ""
-    return re.sub(r'[^a-zA-Z0-9]', '', str(s)).lower()
 
 # --- CONFIG ---
 DEFAULT_CONFIG = {
     'sound_enabled': True,
-    'notification_enabled': True
+    'notification_enabled': True,
+    'adb_poll_interval': 5.0, # Seconds, sub-second values are fine with the persistent shell
+    'max_sync_workers': 8, # Polls running at once across all connected phones
+    # Bounds for the adaptive poll interval: bursts poll at the minimum, an
+    # idle phone with the window hidden in the tray stretches to the maximum
+    'poll_min_interval': 1.0,
+    'poll_max_interval': 60.0,
+    # Debug log (sms_debug.txt) verbosity; log_levels overrides it per
+    # module, e.g. {"adb_manager": "DEBUG", "werkzeug": "WARNING"}
+    'log_level': 'INFO',
+    'log_levels': {},
+    # No toast or sound in between, e.g. {"start": "23:00", "end": "08:00"}
+    'quiet_hours': None
+}
+
+# (type, minimum, maximum) of the numeric settings, checked on /api/config
+CONFIG_LIMITS = {
+    'adb_poll_interval': (float, 0.2, 3600.0),
+    'max_sync_workers': (int, 1, 64),
+    'poll_min_interval': (float, 0.2, 3600.0),
+    'poll_max_interval': (float, 0.2, 86400.0),
 }
 
+# Everything below reads from memory; the writer thread persists changes
+state = AppState(store, CONFIG_FILE, BLOCKED_FILE, DEFAULT_CONFIG)
+with startup_report.phase('load state'):
+    state.load()
+atexit.register(state.close)
+debug_log.apply_levels(state.get_config().get('log_level'), state.get_config().get('log_levels'))
+# Blocking is applied at ingest, so reads never filter; drop anything stored
+# before its rule existed (e.g. blocked_senders.json edited by hand)
+purged = state.delete_blocked()
+if purged: log.info("Removed %d stored messages matching the blocklist", purged)
+
 def load_config():
-    print(f"Loading config from: {CONFIG_FILE}")
-    if os.path.exists(CONFIG_FILE):
-        try: 
-            with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                print(f"Config loaded: {data}")
-                return {**DEFAULT_CONFIG, **data}
-        except Exception as e: 
-            print(f"Config load error: {e}")
-            return DEFAULT_CONFIG
-    print("Config file not found, using defaults.")
-    return DEFAULT_CONFIG
+    return state.get_config()
+
+def validate_config(new_config):
+    """Checks a posted config, returns (config, error); numbers given as
+    strings or out of CONFIG_LIMITS are an error, not silently dropped"""
+    if not isinstance(new_config, dict):
+        return None, 'config must be an object'
+    config = dict(new_config)
+    for key, (kind, low, high) in CONFIG_LIMITS.items():
+        if key not in config: continue
+        value = config[key]
+        if isinstance(value, bool) or not isinstance(value, (int, float)) \
+                or not low <= value <= high or (kind is int and value != int(value)):
+            return None, f"{key} must be a number from {low} to {high}" + (" (whole)" if kind is int else "")
+        config[key] = kind(value)
+    merged = {**DEFAULT_CONFIG, **config}
+    if merged['poll_max_interval'] < merged['poll_min_interval']:
+        return None, 'poll_max_interval must not be below poll_min_interval'
+    return config, None
 
 def save_config(new_config):
-    print(f"Saving config to: {CONFIG_FILE} : {new_config}")
-    try:
-        with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-            json.dump(new_config, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        print(f"Config save error: {e}")
+    log.debug("Saving config: %s", new_config)
+    config = state.set_config(new_config)
+    poll_scheduler.configure(config.get('poll_min_interval'), config.get('poll_max_interval'))
+    debug_log.apply_levels(config.get('log_level'), config.get('log_levels'))
+    return config
 
 # --- NOTIFICATION ---
 
-def restore_window():
-    global window
-    if window:
-        if window.minimized:
-            window.restore()
-        window.show()
-        # Bring to front hack
-        try:
-            import ctypes
-            hwnd = window.get_hwnd() # pywebview 5.0+? Or simply window reference
-            # Note: pywebview doesn't expose HWND easily in all versions, 
-            # but usually window.show() works.
-        except: pass
-
-def play_custom_sound():
-    config = load_config()
-    if not config.get('sound_enabled', True):
-        return
-        
-    try:
-        if os.path.exists(RINGTONE_PATH):
-            print(f"Playing sound from: {RINGTONE_PATH}")
-            # Normalize path for PowerShell (forward slashes are safer to avoid escape issues)
-            safe_path = RINGTONE_PATH.replace('\\', '/')
-            
-            # Use PowerShell with MediaPlayer for MP3 support
-            # Add-Type -AssemblyName PresentationCore is required for MediaPlayer
-            cmd = f'''powershell -c "Add-Type -AssemblyName PresentationCore; $p = New-Object System.Windows.Media.MediaPlayer; $p.Open((New-Object System.Uri('{safe_path}'))); $p.Play(); Start-Sleep -s 5;"'''
-            
-            subprocess.Popen(cmd, shell=True, creationflags=subprocess.CREATE_NO_WINDOW)
-        else:
-            print("Ringtone not found, using default beep.")
-            winsound.MessageBeep()
-    except Exception as e:
-        print(f"Sound Error: {e}")
+def show_notification(title, message):
+    """Called on the notifier's worker thread only"""
+    ui.notify(title, message)
+
+# One worker shows every toast and plays every sound (bursts are coalesced,
+# see notifier.py); sound_enabled / notification_enabled are checked there
+notifier = NotificationDispatcher(show_notification, SoundPlayer(RINGTONE_PATH), load_config)
 
 @app.route('/api/test_notification', methods=['POST'])
 def test_notification():
-    show_notification("Test Bildirimi", "Bu bir test mesajıdır.")
-    play_custom_sound()
+    notifier.notify_now("Test Bildirimi", "Bu bir test mesajıdır.")
     return jsonify({'success': True})
 
-def show_notification(title, message):
-    config = load_config()
-    print(f"Triggering Notification: {title} | Config: {config}")
-    
-    if not config.get('notification_enabled', True):
-        print("Notification disabled in config.")
-        return
-
-    # 1. Try Tray Notification first (Most reliable for tray apps)
-    global tray_icon
-    if tray_icon:
-        try:
-            print("Attempting Tray Notification...")
-            tray_icon.notify(message, title)
-            return
-        except Exception as e:
-            print(f"Tray notification failed: {e}")
-    else:
-        print("Tray icon not initialized, skipping tray notify.")
-
-    # 2. Fallback to win11toast
-    try:
-        print("Attempting Win11Toast Notification...")
-        icon_abs = os.path.abspath(ICON_PATH) if os.path.exists(ICON_PATH) else None
-        
-        def _notify():
-            try:
-                toast(
-                    title, 
-                    message, 
-                    icon=icon_abs,
-                    duration='short', 
-                    app_id='SMS Sync',
-                    on_click=restore_window
-                )
-                print("Win11Toast sent.")
-            except Exception as e: print(f"Win11Toast fail: {e}")
-        
-        threading.Thread(target=_notify, daemon=True).start()
-
-    except Exception as e:
-        print(f"Notification Error: {e}")
-
-IS_FIRST_SYNC = True
-
-def on_sms_received(new_sms_data_list):
-    global IS_FIRST_SYNC
-    current_list = load_sms()
-    blocked = load_blocked()
-    blocked_normalized = {normalize_sender(b) for b in blocked}
+def ingest_batches(batches):
+    """IngestQueue handler: stores every queued batch (syncers and
+    /api/sms/bulk alike) with one insert_batch, i.e. one write-behind
+    transaction, and returns each batch's per-row results:
+    {'status': 'inserted', 'id'}, {'status': 'duplicate'}, {'status': 'blocked'}
+    or {'status': 'invalid', 'error'}.
+    Batch options: final=False while a long first import is still
+    streaming, initial=True until a device's first import is done (no
+    notifications)."""
+    blocklist = state.blocklist
     
-    existing_keys = {f"{s.get('sender')}|{s.get('message')}" for s in current_list}
-    updates = []
+    batch_keys = set()
+    new_rows = []
+    pending = [] # (results, index, notify) of each new row, filled in after the insert
+    all_results = []
     
-    for item in new_sms_data_list:
-        sender_clean = item['sender'].strip()
-        if normalize_sender(sender_clean) in blocked_normalized:
-            continue
-            
-        key = f"{sender_clean}|{item['message']}"
-        if key not in existing_keys:
-            sms_obj = {
-                'id': len(current_list) + len(updates) + 1,
+    for batch in batches:
+        results = []
+        notify = not batch.options.get('initial', False)
+        for raw in batch.rows:
+            # Syncer rows are checked like uploads, a bad one is just reported back
+            item, invalid = validate_sms(raw)
+            if invalid:
+                results.append({'status': 'invalid', 'error': invalid})
+                continue
+            sender_clean = item['sender'].strip()
+            if blocklist.matches(sender_clean, item['message']):
+                results.append({'status': 'blocked'})
+                continue
+                
+            # Hash of (device, sender, original timestamp, body): repeats of the
+            # same text on another day are kept, re-polled rows are not. A row
+            # without a timestamp gets the arrival time, hashed as stored.
+            device = item.get('device') or ''
+            timestamp = item['timestamp'] or datetime.now().isoformat()
+            key = dedupe_key(device, sender_clean, timestamp, item['message'])
+            if key in batch_keys or state.exists(key):
+                results.append({'status': 'duplicate'})
+                continue
+            # Rows stored before the device was known are keyed with an empty
+            # device; the first resync fills it in instead of storing them twice
+            if device and state.claim_device(dedupe_key('', sender_clean, timestamp, item['message']), device, key):
+                results.append({'status': 'duplicate'})
+                continue
+            new_rows.append({
                 'sender': sender_clean,
                 'message': item['message'],
-                'timestamp': item['timestamp'] or datetime.now().isoformat(),
-                'read': False
-            }
-            updates.append(sms_obj)
-            existing_keys.add(key)
+                'timestamp': timestamp,
+                'read': False,
+                'device': device,
+                'dedupe_key': key
+            })
+            batch_keys.add(key)
+            pending.append((results, len(results), notify))
+            results.append(None)
+        all_results.append(results)
     
-    if updates:
-        current_list.extend(updates)
-        save_sms(current_list)
-        print(f"Synced {len(updates)} new messages.")
-        
-        if not IS_FIRST_SYNC:
-            # Play Sound checks config inside
-            play_custom_sound()
-            # Show Notification checks config inside
-            last_msg = updates[-1]
-            show_notification(f"New SMS from {last_msg['sender']}", last_msg['message'][:50])
-            
-    if IS_FIRST_SYNC: IS_FIRST_SYNC = False
+    if new_rows:
+        updates = state.insert_batch(new_rows)
+        announce = []
+        for (results, index, notify), sms in zip(pending, updates):
+            results[index] = {'status': 'inserted', 'id': sms['id']}
+            if notify: announce.append(sms)
+        log.info("Synced %d new messages.", len(updates))
+        event_bus.publish('sms', {'messages': updates})
+        # Queued only; the notifier coalesces bursts into one toast and sound
+        notifier.notify(announce)
+    return all_results
+
+# One writer for every syncer and bulk upload; concurrent batches share a transaction
+ingest_queue = IngestQueue(ingest_batches)
 
 # --- SYNCERS ---
-from wifi_syncer import WiFiSyncer
-adb_syncer = ADBSyncer(app, on_sms_received)
-wifi_syncer = WiFiSyncer(app, on_sms_received)
-ACTIVE_MODE = "none" # none, adb, wifi
-CURRENT_CONNECTION_START = None
-CURRENT_IP_OR_SERIAL = None
+# Any number of phones (ADB and WiFi mixed) sync side by side
+poll_scheduler = PollScheduler(load_config().get('poll_min_interval'), load_config().get('poll_max_interval'))
+devices = DeviceManager(app, ingest_queue, state_store=state,
+                        max_workers=load_config().get('max_sync_workers') or 8,
+                        scheduler=poll_scheduler)
 
 @app.route('/api/config', methods=['GET', 'POST'])
 def handle_config():
     if request.method == 'POST':
-        new_conf = request.json
-        save_config(new_conf)
-        return jsonify({'success': True, 'config': load_config()})
+        new_conf, error = validate_config(request.get_json(silent=True))
+        if error:
+            return jsonify({'error': error}), 400
+        return jsonify({'success': True, 'config': save_config(new_conf)})
     else:
         return jsonify(load_config())
 
+@app.route('/api/ui/visibility', methods=['POST'])
+def ui_visibility():
+    """Every open frontend reports its document visibility (client: an id
+    per tab, repeated within CLIENT_TTL), so the phones' poll intervals
+    stretch like with the tray once no tab is being looked at"""
+    data = request.get_json(silent=True) or {}
+    client = str(data.get('client') or request.remote_addr)
+    devices.set_visible(bool(data.get('visible', True)), 'tab:' + client, CLIENT_TTL)
+    return jsonify({'success': True, 'visible': poll_scheduler.visible})
+
 @app.route('/api/connect', methods=['POST'])
 def connect_device():
-    global ACTIVE_MODE, CURRENT_CONNECTION_START, CURRENT_IP_OR_SERIAL
+    """Adds a phone to the synced set; phones already connected keep syncing"""
     data = request.json
     ip = data.get('ip')
     serial = data.get('serial')
     
     if ip:
-        adb_syncer.stop_sync()
-        wifi_syncer.start_sync(ip)
-        ACTIVE_MODE = "wifi"
-        CURRENT_IP_OR_SERIAL = ip
-        CURRENT_CONNECTION_START = datetime.now().isoformat()
-        save_logs({'type': 'connect', 'mode': 'wifi', 'target': ip, 'time': CURRENT_CONNECTION_START})
-        return jsonify({'success': True, 'mode': 'wifi', 'ip': ip})
-
-    if serial:
-        wifi_syncer.stop_sync()
-        adb_syncer.start_sync(serial)
-        ACTIVE_MODE = "adb"
-        CURRENT_IP_OR_SERIAL = serial
-        CURRENT_CONNECTION_START = datetime.now().isoformat()
-        save_logs({'type': 'connect', 'mode': 'adb', 'target': serial, 'time': CURRENT_CONNECTION_START})
-        return jsonify({'success': True, 'mode': 'adb', 'serial': serial})
-
-    return jsonify({'error': 'IP or Serial required'}), 400
+        device, created = devices.add_wifi(ip)
+        mode, target = 'wifi', ip
+    elif serial:
+        device, created = devices.add_adb(serial, full_resync=bool(data.get('full_resync')),
+                                          poll_interval=float(load_config().get('adb_poll_interval') or 5.0))
+        mode, target = 'adb', serial
+    else:
+        return jsonify({'error': 'IP or Serial required'}), 400
+
+    if created:
+        save_logs({'type': 'connect', 'mode': mode, 'target': target, 'time': device.connected_at})
+    event_bus.publish('status', {'mode': mode, 'target': target})
+    return jsonify({'success': True, 'mode': mode, ('ip' if ip else 'serial'): target})
+
+def log_disconnect(device, end_time):
+    save_logs({
+        'type': 'disconnect', 
+        'mode': device.kind, 
+        'target': device.target, 
+        'start_time': device.connected_at,
+        'end_time': end_time
+    })
 
 @app.route('/api/disconnect', methods=['POST'])
 def disconnect_device():
-    global ACTIVE_MODE, CURRENT_CONNECTION_START, CURRENT_IP_OR_SERIAL
-    
-    # 1. Stop Syncers
-    if ACTIVE_MODE == "wifi":
-        wifi_syncer.stop_sync()
-    elif ACTIVE_MODE == "adb":
-        adb_syncer.stop_sync()
-    
+    """With {ip} or {serial} only that phone stops syncing and its messages
+    stay. Without a target every phone is disconnected and the store cleared."""
+    data = request.get_json(silent=True) or {}
+    target = data.get('ip') or data.get('serial')
     end_time = datetime.now().isoformat()
+
+    if target:
+        device = devices.remove(target)
+        if not device:
+            return jsonify({'error': 'Device not connected'}), 404
+        log_disconnect(device, end_time)
+        event_bus.publish('status', {'mode': device.kind, 'target': target, 'active': False})
+        return jsonify({'success': True})
+
+    # 1. Stop Syncers and log each disconnect
+    for device in devices.remove_all():
+        if device: log_disconnect(device, end_time)
     
-    # 2. Log Disconnect
-    if ACTIVE_MODE != "none":
-        save_logs({
-            'type': 'disconnect', 
-            'mode': ACTIVE_MODE, 
-            'target': CURRENT_IP_OR_SERIAL, 
-            'start_time': CURRENT_CONNECTION_START,
-            'end_time': end_time
-        })
-
-    ACTIVE_MODE = "none"
-    CURRENT_CONNECTION_START = None
-    CURRENT_IP_OR_SERIAL = None
-    
-    # 3. Clear Messages
-    save_sms([])
-    global IS_FIRST_SYNC
-    IS_FIRST_SYNC = True
+    # 2. Clear Messages (and sync cursors, so the next connect re-imports everything)
+    state.clear()
+    devices.reset_cursors()
+    event_bus.publish('clear')
     
     return jsonify({'success': True})
 
+MAX_LOG_PAGE = 1000
+
 @app.route('/api/logs', methods=['GET'])
 def get_logs():
-    return jsonify({'logs': load_logs()})
+    """Newest first: limit, since/until (ISO times), type, target.
+    Pass next_cursor back as cursor for the next page."""
+    args = request.args
+    try:
+        limit = max(1, min(int_arg('limit', 100), MAX_LOG_PAGE))
+        cursor = parse_cursor(args.get('cursor'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    def build():
+        logs, after = connection_log.query(limit=limit, since=args.get('since'), until=args.get('until'),
+                                           type=args.get('type'), target=args.get('target'), cursor=cursor)
+        return {'logs': logs, 'next_cursor': f"{after[0]}|{after[1]}" if after else None}
+    return response_cache.respond(connection_log.version, build)
 
 # ... (Original API Routes for SMS/Stats) ...
 @app.route('/api/devices', methods=['GET'])
-def list_devices(): return jsonify(adb_syncer.get_devices())
+def list_devices(): return jsonify(devices.list_adb_devices())
+
+@app.route('/api/adb/blocklist/refresh', methods=['POST'])
+def refresh_phone_blocklist():
+    """Re-reads the phones' own blocked numbers now instead of at the next
+    BLOCKED_REFRESH; {serial} for one device, nothing for all of them"""
+    serial = (request.get_json(silent=True) or {}).get('serial')
+    refreshed = devices.refresh_blocklists(serial)
+    if serial and not refreshed:
+        return jsonify({'error': 'Device not connected'}), 404
+    return jsonify({'success': True, 'devices': refreshed})
+
+@app.route('/api/adb/metrics', methods=['GET'])
+def adb_metrics(): return jsonify(devices.get_adb_metrics())
 
 @app.route('/api/status', methods=['GET'])
 def connection_status():
-    if ACTIVE_MODE == "wifi": return jsonify(wifi_syncer.get_status())
-    elif ACTIVE_MODE == "adb": return {'active': adb_syncer.active, 'device': adb_syncer.device_serial, 'type': 'adb'}
-    else: return jsonify({'active': False, 'device': None, 'type': 'none'})
+    """Per-device status (lag, errors, push) in 'devices'; the top-level
+    fields describe the most recently connected one, as before"""
+    statuses = devices.get_status()
+    if not statuses: return jsonify({'active': False, 'device': None, 'type': 'none', 'devices': []})
+    latest = statuses[-1]
+    return jsonify({'active': True, 'device': latest['device'], 'type': latest['type'], 'devices': statuses})
+
+MAX_PAGE_SIZE = 1000
+
+def int_arg(name, default=None):
+    """An integer query arg; ValueError if it is there but not a number.
+    Args are checked before response_cache.respond(), whose 304 skips build()."""
+    value = request.args.get(name)
+    if value is None or value == '':
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"Invalid {name}")
+
+def parse_cursor(value, name='cursor'):
+    """Cursor strings are '<timestamp>|<number>' as returned in next_cursor
+    (the message id for /api/sms, the position among same-time entries for /api/logs)"""
+    if not value: return None
+    timestamp, _, sms_id = value.rpartition('|')
+    try:
+        return (timestamp, int(sms_id))
+    except ValueError:
+        raise ValueError(f"Invalid {name}")
+
+def format_cursor(sms):
+    return f"{sms['timestamp']}|{sms['id']}"
+
+def query_sms(unread_only=False):
+    """Parses the page args (limit, before, after, sender, unread_only,
+    since_id), raising ValueError for a malformed one, and returns the
+    function that builds the page"""
+    args = request.args
+    limit = int_arg('limit')
+    if limit is not None:
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+    query = dict(
+        limit=limit,
+        before=parse_cursor(args.get('before'), 'before'),
+        after=parse_cursor(args.get('after'), 'after'),
+        sender_norm=normalize_sender(args.get('sender')) or None,
+        unread_only=unread_only or args.get('unread_only') in ('1', 'true'),
+        since_id=int_arg('since_id'))
+
+    def build():
+        sms_list = state.page(**query)
+        result = {'sms_list': sms_list}
+        if limit is not None:
+            # next_cursor pages further into history, newest_cursor is for later `after=` deltas
+            result['next_cursor'] = format_cursor(sms_list[-1]) if len(sms_list) == limit else None
+            result['newest_cursor'] = format_cursor(sms_list[0]) if sms_list else args.get('after')
+        return result
+    return build
 
 @app.route('/api/sms', methods=['GET'])
 def get_sms_route():
-    sms_list = load_sms()
-    blocked = load_blocked()
-    blocked_normalized = {normalize_sender(b) for b in blocked}
-    sms_list = [s for s in sms_list if normalize_sender(s.get('sender')) not in blocked_normalized]
-    sms_list = sorted(sms_list, key=lambda x: x.get('timestamp', '') or '', reverse=True)
-    return jsonify({'sms_list': sms_list})
+    try:
+        build = query_sms()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    # The whole inbox (no limit) is too big to keep around, only pages are cached
+    return response_cache.respond(state.version, build, store=request.args.get('limit') is not None)
     
 @app.route('/api/sms/unread', methods=['GET'])
 def get_unread():
-    # Similar impl
-    sms_list = get_sms_route().get_json()['sms_list']
-    unread = [s for s in sms_list if not s.get('read')]
-    return jsonify({'sms_list': unread})
+    try:
+        build = query_sms(unread_only=True)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return response_cache.respond(state.version, build, store=request.args.get('limit') is not None)
+
+@app.route('/api/conversations', methods=['GET'])
+def get_conversations():
+    """One entry per sender, latest first: sender, sender_norm, count,
+    unread, last_message. limit, offset, unread_only=1."""
+    args = request.args
+    try:
+        limit = int_arg('limit')
+        offset = max(0, int_arg('offset', 0))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if limit is not None:
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    def build():
+        total, conversations = state.conversations(limit=limit, offset=offset,
+                                                   unread_only=args.get('unread_only') in ('1', 'true'))
+        next_offset = offset + limit if limit and offset + limit < total else None
+        return {'total': total, 'conversations': conversations, 'next_offset': next_offset}
+    return response_cache.respond(state.version, build)
+
+@app.route('/api/search', methods=['GET'])
+def search_sms():
+    """Full-text search: q (words or word prefixes, all must match; case,
+    Turkish letters and accents don't matter), limit, offset, sender"""
+    args = request.args
+    query = (args.get('q') or '').strip()
+    if not query:
+        return jsonify({'error': 'q required'}), 400
+    limit = max(1, min(args.get('limit', 50, type=int), MAX_PAGE_SIZE))
+    offset = max(0, args.get('offset', 0, type=int))
+    total, sms_list = state.search(query, limit=limit, offset=offset,
+                                   sender_norm=normalize_sender(args.get('sender')) or None)
+    return jsonify({'query': query, 'total': total, 'sms_list': sms_list,
+                    'next_offset': offset + limit if offset + limit < total else None})
+
+BULK_CHUNK = 1000 # Rows queued at a time while the body is still being read
+BULK_TIMEOUT = 120
+
+def validate_sms(item):
+    """Checks one uploaded row, returns (row, error)"""
+    if not isinstance(item, dict):
+        return None, 'not an object'
+    sender = item.get('sender')
+    if not isinstance(sender, str) or not sender.strip():
+        return None, 'sender required'
+    message = item.get('message')
+    if not isinstance(message, str):
+        return None, 'message must be a string'
+    timestamp = item.get('timestamp')
+    if isinstance(timestamp, bool) or (timestamp is not None and not isinstance(timestamp, (str, int, float))):
+        return None, 'invalid timestamp'
+    device = item.get('device')
+    if device is not None and not isinstance(device, str):
+        return None, 'invalid device'
+    return {
+        'sender': sender,
+        'message': message,
+        'timestamp': str(normalize_timestamp(timestamp)) if timestamp is not None else None,
+        'device': device or ''
+    }, None
+
+@app.route('/api/sms/bulk', methods=['POST'])
+def bulk_insert():
+    """Imports a JSON array of {sender, message, timestamp, device?}, or one
+    object per line with Content-Type application/x-ndjson. The body is
+    decoded as it arrives and queued in chunks; results[i] is the status of
+    row i. Uploads count as history (no notifications) unless ?notify=1."""
+    notify = request.args.get('notify') in ('1', 'true')
+    ndjson = (request.mimetype or '').endswith('ndjson')
+    items = iter_ndjson_items(request.stream) if ndjson else iter_json_items(request.stream)
+
+    results = [] # Per row: a result dict, or an index into the queued chunk
+    futures = []
+    chunk = []
+    chunk_slots = []
+    error = None
+
+    def flush():
+        futures.append((ingest_queue.submit(chunk[:], initial=not notify), chunk_slots[:]))
+        chunk.clear()
+        chunk_slots.clear()
+
+    try:
+        for item in items:
+            row, invalid = validate_sms(item)
+            if invalid:
+                results.append({'status': 'invalid', 'error': invalid})
+                continue
+            chunk_slots.append(len(results))
+            results.append(None)
+            chunk.append(row)
+            if len(chunk) >= BULK_CHUNK: flush()
+    except ValueError as e:
+        # Rows before the broken spot are still stored
+        error = f"Malformed body: {e}"
+    if chunk: flush()
+
+    for future, slots in futures:
+        try:
+            for slot, result in zip(slots, future.result(BULK_TIMEOUT)):
+                results[slot] = result
+        except Exception as e:
+            log.error("Bulk ingest error: %s", e)
+            for slot in slots:
+                results[slot] = {'status': 'error', 'error': str(e)}
+
+    counts = {}
+    for result in results:
+        counts[result['status']] = counts.get(result['status'], 0) + 1
+    summary = {
+        'received': len(results),
+        'inserted': counts.get('inserted', 0),
+        'duplicate': counts.get('duplicate', 0),
+        'blocked': counts.get('blocked', 0),
+        'invalid': counts.get('invalid', 0),
+        'results': results
+    }
+    if error:
+        summary['error'] = error
+        return jsonify(summary), 400
+    return jsonify(summary), 201 if summary['inserted'] else 200
+
+@app.route('/api/events', methods=['GET'])
+def events_stream():
+    """Server-Sent Events feed of store changes. Reconnecting clients send
+    Last-Event-ID and only receive what they missed; if that is no longer in
+    the buffer they get a 'resync' event and should refetch /api/sms."""
+    try:
+        last_id = int(request.headers.get('Last-Event-ID') or request.args.get('last_event_id') or event_bus.last_id)
+    except ValueError:
+        last_id = event_bus.last_id
+
+    def format_event(event_id, event_type, data):
+        return f"id: {event_id}\nevent: {event_type}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    def generate():
+        cursor = last_id
+        if cursor > event_bus.last_id:
+            # Id from before a backend restart
+            cursor = event_bus.last_id
+            yield format_event(cursor, 'resync', {})
+        yield "retry: 3000\n\n"
+        while not event_bus.closed:
+            events = event_bus.wait(cursor, timeout=15)
+            if events is None:
+                cursor = event_bus.last_id
+                yield format_event(cursor, 'resync', {})
+            elif not events:
+                yield ": keepalive\n\n"
+            for e in events or []:
+                cursor = e['id']
+                yield format_event(e['id'], e['type'], e['data'])
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @app.route('/api/block', methods=['POST'])
 def block_sender():
+    """Blocks a sender ({sender}) or adds any blocklist rule ({rule}, e.g.
+    'prefix:0850', '*kampanya*', 're:...', 'body:...'). Stored messages
+    the rule matches are deleted."""
     data = request.json
-    sender = data.get('sender')
-    if not sender: return jsonify({'error': 'Sender required'}), 400
-    blocked = load_blocked()
-    blocked.add(sender.strip())
-    save_blocked(blocked)
-    target_norm = normalize_sender(sender)
-    all_sms = load_sms()
-    new_sms_list = [s for s in all_sms if normalize_sender(s.get('sender')) != target_norm]
-    if len(all_sms) != len(new_sms_list): save_sms(new_sms_list)
-    return jsonify({'success': True})
+    rule = data.get('rule') or data.get('sender')
+    if not rule: return jsonify({'error': 'Sender required'}), 400
+    try:
+        rule = state.add_blocked(rule)
+    except BlocklistError as e:
+        return jsonify({'error': str(e)}), 400
+    removed = state.delete_blocked()
+    event_bus.publish('block', {'sender': rule})
+    return jsonify({'success': True, 'rule': rule, 'removed': removed})
+
+@app.route('/api/blocked', methods=['GET'])
+def list_blocked():
+    return jsonify({'rules': sorted(state.get_blocked())})
+
+@app.route('/api/unblock', methods=['POST'])
+def unblock_senders():
+    """Removes block rules, {rule} (or {sender}) or {rules: [...]}, in one
+    write and one 'unblock' event. Dropped messages don't come back."""
+    data = request.get_json(silent=True) or {}
+    rules = data.get('rules') if 'rules' in data else [data.get('rule') or data.get('sender')]
+    if not isinstance(rules, list) or not rules or not all(isinstance(r, str) and r.strip() for r in rules):
+        return jsonify({'error': 'Rule required'}), 400
+    removed = state.remove_blocked(rules)
+    if removed: event_bus.publish('unblock', {'rules': removed})
+    return jsonify({'success': True, 'removed': removed})
+
+def select_bulk(data, unread_only=False, allow_all=False):
+    """Ids a bulk mutation applies to: {ids: [...]}, or any mix of sender,
+    after (inclusive) and before (exclusive) timestamps, or {all: true}.
+    Raises ValueError when nothing is selected."""
+    if 'ids' in data:
+        ids = data['ids']
+        if not isinstance(ids, list) or not all(isinstance(i, int) and not isinstance(i, bool) for i in ids):
+            raise ValueError('ids must be a list of integers')
+        return ids
+    sender = normalize_sender(data.get('sender')) or None
+    after, before = data.get('after'), data.get('before')
+    if (after is not None and not isinstance(after, str)) or (before is not None and not isinstance(before, str)):
+        raise ValueError('after/before must be timestamps')
+    if not (sender or after or before or (allow_all and data.get('all') is True)):
+        raise ValueError('ids, sender or after/before required' + (' (or all)' if allow_all else ''))
+    return state.select(sender_norm=sender, after=after, before=before, unread_only=unread_only)
+
+@app.route('/api/sms/read', methods=['POST'])
+def mark_many_read():
+    """Marks messages read (unread with read=false) in one write and one
+    'read' event: {ids}, {sender}, {before}, {sender, before}, {all: true}..."""
+    data = request.get_json(silent=True) or {}
+    read = data.get('read', True) is not False
+    try:
+        ids = select_bulk(data, unread_only=read, allow_all=True)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    found, changed = state.set_read(ids, read=read)
+    if changed: event_bus.publish('read', {'ids': changed, 'read': read})
+    return jsonify({'success': True, 'matched': found, 'changed': len(changed)})
+
+@app.route('/api/sms/delete', methods=['POST'])
+def delete_many():
+    """Deletes messages in one write and one 'delete' event: {ids},
+    {sender}, {after, before} or a sender within a range"""
+    data = request.get_json(silent=True) or {}
+    try:
+        ids = select_bulk(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    deleted = state.delete_ids(ids)
+    if deleted: event_bus.publish('delete', {'ids': deleted})
+    return jsonify({'success': True, 'deleted': len(deleted)})
 
 @app.route('/api/sms/<int:sms_id>/read', methods=['POST'])
 def mark_read(sms_id):
-    sms_list = load_sms()
-    found = False
-    for sms in sms_list:
-        if sms['id'] == sms_id:
-            sms['read'] = True
-            found = True
-            break
-    if found:
-        save_sms(sms_list)
+    if state.update_flags([sms_id], read=True):
+        event_bus.publish('read', {'ids': [sms_id]})
         return jsonify({'success': True})
     return jsonify({'error': 'Not found'}), 404
 
 @app.route('/api/stats', methods=['GET'])
 def stats():
-    sms_list = load_sms()
-    blocked = load_blocked()
-    valid_list = [s for s in sms_list if s.get('sender') not in blocked]
-    return jsonify({'total': len(valid_list), 'unread': len([s for s in valid_list if not s.get('read')])})
+    def build():
+        total, unread = state.count()
+        conversations, unread_conversations = state.conversation_count()
+        return {'total': total, 'unread': unread, 'conversations': conversations,
+                'unread_conversations': unread_conversations,
+                'ingest': ingest, 'notifications': notifications}
+    ingest, notifications = dict(ingest_queue.metrics), dict(notifier.metrics)
+    version = (state.version, tuple(ingest.values()), tuple(notifications.values()))
+    return response_cache.respond(version, build)
 
 # --- FRONTEND ---
 @app.route('/')
@@ -434,63 +714,36 @@ def serve_static(path):
     if os.path.exists(full_path): return send_from_directory(FRONTEND_DIST, path)
     return send_from_directory(FRONTEND_DIST, 'index.html')
 
-# --- TRAY & WINDOW MANAGEMENT ---
+# --- DEBUG ---
+@app.route('/api/debug/startup', methods=['GET'])
+def debug_startup():
+    """Import times (like python -X importtime) and startup phases"""
+    return jsonify({**startup_report.report(), 'ui': ui.status()})
 
-def setup_tray():
-    global tray_icon
-    try:
-        if os.path.exists(ICON_PATH):
-            image = Image.open(ICON_PATH)
-        else:
-            # Fallback (create a colored square)
-            image = Image.new('RGB', (64, 64), color = (73, 109, 137))
-        
-        def on_exit(icon, item):
-            icon.stop()
-            if window: window.destroy()
-            os._exit(0) # Force kill
-            
-        def on_open(icon, item):
-            restore_window()
-
-        menu = pystray.Menu(
-            pystray.MenuItem('Open', on_open, default=True),
-            pystray.MenuItem('Exit', on_exit)
-        )
-        
-        tray_icon = pystray.Icon("SMS Sync", image, "SMS Sync", menu)
-        tray_icon.run() 
-    except Exception as e:
-        print(f"Tray Error: {e}")
-
-def on_closing():
-    # This is called when user clicks X
-    # We want to minimize to tray instead of closing
-    print("Minimizing to tray...")
-    window.hide()
-    
-    # If using pystray, we can optionally notify user
-    # but win11toast handles system notifications
-    return False # returning False cancels the close event in pywebview
+# --- SHUTDOWN & ENTRY POINT ---
+
+def shutdown():
+    """Stops the syncers and writes out everything still queued"""
+    devices.close()
+    ingest_queue.close()
+    notifier.close()
+    state.close() # os._exit skips atexit handlers
 
-def start_flask():
-    app.run(host='127.0.0.1', port=5001, debug=False, use_reloader=False)
+startup_report.finish()
 
 if __name__ == '__main__':
-    # 1. Start Flask
-    t = threading.Thread(target=start_flask, daemon=True)
-    t.start()
-    
-    # 2. Start Tray (in separate thread because it blocks?)
-    # pystray run() blocks, so usually we run it in a thread OR main thread.
-    # pywebview start() ALSO blocks.
-    # We must run tray in a thread if we want pywebview in main, or vice versa.
-    # pywebview recommends main thread for GUI.
-    
-    tray_thread = threading.Thread(target=setup_tray, daemon=True)
-    tray_thread.start()
-    
-    # 3. Start Window
-    window = webview.create_window('SMS Sync', 'http://127.0.0.1:5001', width=1200, height=800)
-    window.events.closing += on_closing
-    webview.start(debug=True)
+    import server
+    args = server.parse_args()
+    # --headless (or a machine without pywebview/pystray): API and syncers
+    # only, on the bind address given; see server.py
+    if args.headless or not desktop_available():
+        server.serve(app, args.host, args.port, args.threads,
+                     stopping=event_bus.close, stopped=shutdown)
+    else:
+        # The windowed exe has no console, keep library output in the log
+        debug_log.capture_output()
+        ui = DesktopUI(f'http://127.0.0.1:{args.port}', ICON_PATH, devices.set_visible, shutdown)
+        # The server in the background, pywebview needs the main thread
+        threading.Thread(target=server.serve, args=(app, args.host, args.port, args.threads),
+                         kwargs={'signals': False}, name='server', daemon=True).start()
+        ui.run()
@@ -0,0 +1,617 @@
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left, bisect_right, insort
+
+from blocklist import Blocklist
+from sms_store import normalize_sender, normalize_timestamp
+from dedupe import Deduper, dedupe_key
+from search_index import SearchIndex, SENDER_BOOST
+
+log = logging.getLogger(__name__)
+
+BULK_INDEX_THRESHOLD = 64 # Rows per insert_batch above which indexes are re-sorted instead of insort
+FLUSH_RETRIES = 5 # Failed store writes retried (with backoff) before their rows leave the queue
+FLUSH_BACKOFF_CAP = 60.0
+
+
+def atomic_write_json(path, data):
+    """Write to a temp file, fsync it and rename over the target, so a crash
+    never leaves a half-written file behind."""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _public(sms):
+    """Copy of a message as the API returns it"""
+    return {k: v for k, v in sms.items() if k != 'dedupe_key'}
+
+
+class _SortedKeys:
+    """(timestamp, id) keys (or plain ids) kept sorted so pages can be cut with bisect"""
+
+    def __init__(self):
+        self.keys = []
+
+    def add(self, key):
+        insort(self.keys, key)
+
+    def add_many(self, keys):
+        """Adds a batch of keys. Keys past the current end (an inbox imported
+        in date order) are appended; a batch that is large next to the list
+        is merged with one sort; anything else is cheaper with insort."""
+        keys = sorted(keys)
+        if not keys: return
+        if not self.keys or keys[0] >= self.keys[-1]:
+            self.keys.extend(keys)
+        elif len(keys) * 16 >= len(self.keys):
+            self.keys.extend(keys)
+            self.keys.sort()
+        else:
+            for key in keys: insort(self.keys, key)
+
+    def remove(self, key):
+        i = bisect_left(self.keys, key)
+        if i < len(self.keys) and self.keys[i] == key:
+            del self.keys[i]
+
+    def __len__(self):
+        return len(self.keys)
+
+
+class AppState:
+    """Process-wide in-memory state: messages, blocked senders, config and
+    sync cursors. Loaded once at startup; every read is served from memory.
+
+    Writes update memory immediately and mark the affected rows dirty; a
+    background writer flushes them to the store (and the JSON files) after
+    `flush_delay` seconds of quiet (at most 5x that), in one transaction.
+    """
+
+    def __init__(self, store, config_file, blocked_file, default_config, flush_delay=1.0):
+        self.store = store
+        self.config_file = config_file
+        self.blocked_file = blocked_file
+        self.default_config = default_config
+        self.flush_delay = flush_delay
+        self.lock = threading.RLock()
+
+        self.messages = {}      # id -> message dict
+        self.version = 0        # Bumped by every change to the messages (HTTP validators)
+        self.deduper = Deduper()
+        self.order = _SortedKeys()
+        self.ids = _SortedKeys() # Message ids, for since_id
+        self.unread = _SortedKeys()
+        self.by_sender = {}     # normalized sender -> _SortedKeys
+        self.sender_unread = {} # normalized sender -> unread count (absent when 0)
+        self.search_index = SearchIndex()
+        self.next_id = 1
+        self.blocked = set()
+        self.blocklist = Blocklist() # Compiled from blocked, replaced whole on change
+        self.device_blocked = {} # Device -> numbers blocked on the phone itself (not persisted)
+        self.config = dict(default_config)
+        self.meta = {}
+
+        self._dirty_ids = set()
+        self._deleted_ids = set()
+        self._cleared = False
+        self._dirty_meta = set()
+        self._deleted_meta = set()
+        self._config_dirty = False
+        self._blocked_dirty = False
+        self._flush_failures = 0 # Store writes failed in a row
+
+        self._wake = threading.Event()
+        self._stopping = False
+        self._writer = None
+
+    # --- LIFECYCLE ---
+
+    def load(self):
+        with self.lock:
+            loaded = self.store.load_all()
+            for sms in loaded:
+                timestamp = normalize_timestamp(sms['timestamp'])
+                if timestamp != sms['timestamp']:
+                    # Epoch millis stored by older WiFi syncs, re-keyed as ISO once
+                    sms['timestamp'] = timestamp
+                    sms['dedupe_key'] = None
+                if not sms.get('dedupe_key'):
+                    # Rows from before content hashing (or re-dated above), keyed once
+                    sms['dedupe_key'] = dedupe_key(sms['device'], sms['sender'], sms['timestamp'], sms['message'])
+                    self._dirty_ids.add(sms['id'])
+            self._index_many(loaded)
+            self.meta = self.store.load_meta()
+            self.blocked = self._read_json(self.blocked_file, [], set)
+            self._compile_blocklist()
+            config = self._read_json(self.config_file, {}, dict)
+            self.config = {**self.default_config, **config}
+        log.info("State loaded: %d messages, %d blocked senders", len(self.messages), len(self.blocked))
+        if self._dirty_ids: self._mark_dirty()
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+
+    def _read_json(self, path, default, cast):
+        if not os.path.exists(path):
+            return cast(default)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return cast(json.load(f))
+        except Exception as e:
+            log.warning("Could not read %s: %s", path, e)
+            return cast(default)
+
+    def close(self):
+        """Stops the writer and flushes whatever is still pending"""
+        self._stopping = True
+        self._wake.set()
+        if self._writer:
+            self._writer.join(timeout=5)
+        self.flush()
+
+    # --- WRITE-BEHIND ---
+
+    def _mark_dirty(self):
+        self._wake.set()
+
+    def _write_loop(self):
+        while not self._stopping:
+            self._wake.wait()
+            if self._stopping: break
+            # Debounce: keep absorbing changes until things go quiet, but
+            # never hold them longer than max_delay under a steady stream
+            deadline = time.monotonic() + self.flush_delay * 5
+            while True:
+                self._wake.clear()
+                remaining = deadline - time.monotonic()
+                if self._stopping or remaining <= 0 or not self._wake.wait(min(self.flush_delay, remaining)):
+                    break
+            try:
+                self.flush()
+            except Exception as e:
+                log.error("State flush error: %s", e)
+                # Retry, backing off while the failures last (new changes still wake us)
+                self._wake.wait(min(FLUSH_BACKOFF_CAP, self.flush_delay * 2 ** self._flush_failures))
+                self._wake.set()
+
+    def flush(self):
+        with self.lock:
+            upserts = [dict(self.messages[i]) for i in self._dirty_ids if i in self.messages]
+            deletes = list(self._deleted_ids)
+            cleared = self._cleared
+            meta_set = {k: self.meta[k] for k in self._dirty_meta if k in self.meta}
+            meta_delete = list(self._deleted_meta)
+            config = dict(self.config) if self._config_dirty else None
+            blocked = list(self.blocked) if self._blocked_dirty else None
+            self._dirty_ids, self._deleted_ids, self._cleared = set(), set(), False
+            self._dirty_meta, self._deleted_meta = set(), set()
+            self._config_dirty = self._blocked_dirty = False
+
+        # Each part on its own, so a failing database doesn't hold back the JSON files
+        error = None
+        if upserts or deletes or cleared or meta_set or meta_delete:
+            try:
+                rejected = self.store.apply_changes(upserts=upserts, deletes=deletes, clear=cleared,
+                                                    meta_set=meta_set, meta_delete=meta_delete)
+                self._flush_failures = 0
+                for sms_id, e in rejected:
+                    # Kept in memory, never retried: it would fail the same way
+                    log.error("Message %s could not be stored, dropped from the write queue: %s", sms_id, e)
+            except Exception as e:
+                error = e
+                self._flush_failures += 1
+                if self._flush_failures > FLUSH_RETRIES:
+                    log.error("Store writes failed %d times, dropping %d rows, %d deletes and %d meta changes from the queue",
+                              self._flush_failures, len(upserts), len(deletes), len(meta_set) + len(meta_delete))
+                    self._flush_failures = 0
+                else:
+                    # Put it back so the next flush retries it
+                    with self.lock:
+                        self._dirty_ids.update(r['id'] for r in upserts)
+                        self._deleted_ids.update(deletes)
+                        self._cleared = self._cleared or cleared
+                        self._dirty_meta.update(meta_set)
+                        self._deleted_meta.update(meta_delete)
+        if config is not None:
+            try:
+                atomic_write_json(self.config_file, config)
+            except Exception as e:
+                error = error or e
+                with self.lock: self._config_dirty = True
+        if blocked is not None:
+            try:
+                atomic_write_json(self.blocked_file, blocked)
+            except Exception as e:
+                error = error or e
+                with self.lock: self._blocked_dirty = True
+        if error is not None:
+            raise error
+
+    # --- MESSAGES ---
+
+    def _index(self, sms):
+        key = (sms['timestamp'], sms['id'])
+        self.version += 1
+        self.messages[sms['id']] = sms
+        self.deduper.add(sms['dedupe_key'], sms['id'])
+        self.order.add(key)
+        self.ids.add(sms['id'])
+        norm = normalize_sender(sms['sender'])
+        if not sms['read']:
+            self.unread.add(key)
+            self.sender_unread[norm] = self.sender_unread.get(norm, 0) + 1
+        self.by_sender.setdefault(norm, _SortedKeys()).add(key)
+        self.search_index.add(sms['id'], sms['sender'], sms['message'])
+        self.next_id = max(self.next_id, sms['id'] + 1)
+
+    def _index_many(self, batch):
+        """_index for a large batch: one sort per index instead of one insort per row"""
+        keys, unread, by_sender = [], [], {}
+        self.version += 1
+        for sms in batch:
+            key = (sms['timestamp'], sms['id'])
+            self.messages[sms['id']] = sms
+            self.deduper.add(sms['dedupe_key'], sms['id'])
+            keys.append(key)
+            norm = normalize_sender(sms['sender'])
+            if not sms['read']:
+                unread.append(key)
+                self.sender_unread[norm] = self.sender_unread.get(norm, 0) + 1
+            by_sender.setdefault(norm, []).append(key)
+            self.next_id = max(self.next_id, sms['id'] + 1)
+        self.order.add_many(keys)
+        self.ids.add_many(sms_id for _, sms_id in keys)
+        self.unread.add_many(unread)
+        for norm, sender_keys in by_sender.items():
+            bucket = self.by_sender.setdefault(norm, _SortedKeys())
+            bucket.add_many(sender_keys)
+        self.search_index.add_many((sms['id'], sms['sender'], sms['message']) for sms in batch)
+
+    def _unindex(self, sms):
+        key = (sms['timestamp'], sms['id'])
+        self.version += 1
+        del self.messages[sms['id']]
+        self.deduper.remove(sms['dedupe_key'])
+        self.order.remove(key)
+        self.ids.remove(sms['id'])
+        self.unread.remove(key)
+        self.search_index.remove(sms['id'], sms['sender'], sms['message'])
+        norm = normalize_sender(sms['sender'])
+        if not sms['read']: self._count_unread(norm, -1)
+        bucket = self.by_sender.get(norm)
+        if bucket is not None:
+            bucket.remove(key)
+            if not len(bucket): del self.by_sender[norm]
+
+    def _count_unread(self, norm, delta):
+        unread = self.sender_unread.get(norm, 0) + delta
+        if unread > 0: self.sender_unread[norm] = unread
+        else: self.sender_unread.pop(norm, None)
+
+    def insert_batch(self, rows):
+        inserted = []
+        with self.lock:
+            batch = []
+            for row in rows:
+                sms = {
+                    'id': self.next_id + len(batch),
+                    'sender': row['sender'],
+                    'message': row['message'],
+                    'timestamp': row['timestamp'],
+                    'read': bool(row.get('read')),
+                    'device': row.get('device') or '',
+                    'dedupe_key': row['dedupe_key']
+                }
+                batch.append(sms)
+                self._dirty_ids.add(sms['id'])
+                inserted.append(_public(sms))
+            if len(batch) > BULK_INDEX_THRESHOLD:
+                self._index_many(batch)
+            else:
+                for sms in batch: self._index(sms)
+        if inserted: self._mark_dirty()
+        return inserted
+
+    def exists(self, key):
+        return self.deduper.contains(key)
+
+    def claim_device(self, legacy_key, device, key):
+        """If a row stored without a device (migrated from JSON, or from
+        before devices were tracked) has legacy_key, it becomes `device`'s
+        and is re-keyed to key. True if there was such a row."""
+        if not self.deduper.contains(legacy_key):
+            return False
+        with self.lock:
+            sms = self.messages.get(self.deduper.get(legacy_key))
+            if sms is None or sms['device'] or sms['dedupe_key'] != legacy_key:
+                return False
+            self.deduper.remove(legacy_key)
+            sms['device'] = device
+            sms['dedupe_key'] = key
+            self.deduper.add(key, sms['id'])
+            self.version += 1
+            self._dirty_ids.add(sms['id'])
+        self._mark_dirty()
+        return True
+
+    def get(self, sms_id):
+        with self.lock:
+            sms = self.messages.get(sms_id)
+            return _public(sms) if sms else None
+
+    def page(self, limit=None, before=None, after=None, sender_norm=None,
+             unread_only=False, since_id=None):
+        """Newest-first messages, served from the sorted key lists. `before`/
+        `after` are (timestamp, id) keyset cursors; with `after` the page
+        closest to the cursor is returned."""
+        with self.lock:
+            # Start from the narrowest index available
+            if sender_norm:
+                keys = self.by_sender.get(sender_norm, _SortedKeys()).keys
+            elif unread_only:
+                keys = self.unread.keys
+            else:
+                keys = self.order.keys
+            sender_check = None
+            if since_id is not None:
+                newer = self.ids.keys[bisect_right(self.ids.keys, since_id):]
+                if len(newer) < len(keys):
+                    # Usually a handful of new ids: sort just those instead of walking the index
+                    keys = sorted((self.messages[i]['timestamp'], i) for i in newer)
+                    sender_check = sender_norm
+
+            lo, hi = 0, len(keys)
+            if after:
+                lo = bisect_left(keys, (after[0], after[1] + 1))
+            if before:
+                hi = bisect_left(keys, tuple(before))
+            # Walk indexes, not a slice copy, so cost is bounded by the page size
+            positions = range(lo, hi) if after else range(hi - 1, lo - 1, -1)
+
+            result = []
+            for pos in positions:
+                sms_id = keys[pos][1]
+                sms = self.messages[sms_id]
+                if unread_only and sms['read']: continue
+                if since_id is not None and sms_id <= since_id: continue
+                if sender_check and normalize_sender(sms['sender']) != sender_check: continue
+                result.append(_public(sms))
+                if limit and len(result) >= limit: break
+            if after:
+                result.reverse()
+            return result
+
+    def search(self, query, limit=50, offset=0, sender_norm=None):
+        """Full-text search over sender and body, best match first (newer
+        first among equals). Returns (total matches, page of messages with
+        their 'score')."""
+        with self.lock:
+            scores = self.search_index.search(query)
+            senders = {} # sender -> weight (0 = filtered out), worked out once per sender
+            ranked = []
+            for sms_id, score in scores.items():
+                sms = self.messages[sms_id]
+                weight = senders.get(sms['sender'])
+                if weight is None:
+                    if sender_norm and normalize_sender(sms['sender']) != sender_norm:
+                        weight = 0
+                    elif self.search_index.sender_matches(query, sms['sender']):
+                        weight = SENDER_BOOST
+                    else:
+                        weight = 1
+                    senders[sms['sender']] = weight
+                if weight:
+                    ranked.append((score * weight, sms['timestamp'], sms_id))
+            # Ties in score are common and ids arrive roughly in date order;
+            # sort() handles those runs in near linear time where a heap doesn't
+            ranked.sort(reverse=True)
+            result = []
+            for score, _, sms_id in ranked[offset:offset + limit] if limit else ranked[offset:]:
+                sms = _public(self.messages[sms_id])
+                sms['score'] = round(score, 3)
+                result.append(sms)
+            return len(ranked), result
+
+    def select(self, sender_norm=None, after=None, before=None, unread_only=False):
+        """Ids of the messages from sender_norm with after <= timestamp <
+        before (either may be None), oldest first, cut from the narrowest index"""
+        with self.lock:
+            if sender_norm:
+                keys = self.by_sender.get(sender_norm, _SortedKeys()).keys
+            elif unread_only:
+                keys = self.unread.keys
+            else:
+                keys = self.order.keys
+            lo = bisect_left(keys, (after,)) if after else 0
+            hi = bisect_left(keys, (before,)) if before else len(keys)
+            return [sms_id for _, sms_id in keys[lo:hi]
+                    if not (unread_only and self.messages[sms_id]['read'])]
+
+    def update_flags(self, ids, read=True):
+        """Set the read flag on the given ids, returns how many exist"""
+        return self.set_read(ids, read)[0]
+
+    def set_read(self, ids, read=True):
+        """Like update_flags, all in one flush; returns (found, ids whose flag changed)"""
+        found, changed = 0, []
+        with self.lock:
+            for sms_id in ids:
+                sms = self.messages.get(sms_id)
+                if sms is None: continue
+                found += 1
+                if sms['read'] == read: continue
+                sms['read'] = read
+                changed.append(sms_id)
+                self.version += 1
+                key = (sms['timestamp'], sms_id)
+                if read: self.unread.remove(key)
+                else: self.unread.add(key)
+                self._count_unread(normalize_sender(sms['sender']), -1 if read else 1)
+                self._dirty_ids.add(sms_id)
+        if changed: self._mark_dirty()
+        return found, changed
+
+    def delete_ids(self, ids):
+        """Deletes the given messages in one flush, returns the ids that existed"""
+        deleted = []
+        with self.lock:
+            for sms_id in ids:
+                sms = self.messages.get(sms_id)
+                if sms is None: continue
+                self._unindex(sms)
+                self._dirty_ids.discard(sms_id)
+                self._deleted_ids.add(sms_id)
+                deleted.append(sms_id)
+        if deleted: self._mark_dirty()
+        return deleted
+
+    def count(self):
+        """(total, unread)"""
+        with self.lock:
+            return len(self.order), len(self.unread)
+
+    def conversation_count(self):
+        """(senders, senders with unread messages)"""
+        with self.lock:
+            return len(self.by_sender), len(self.sender_unread)
+
+    def conversations(self, limit=None, offset=0, unread_only=False):
+        """One summary per sender, latest conversation first: count, unread
+        and the last message. Read off the per-sender indexes, O(senders).
+        Returns (total conversations, page)."""
+        with self.lock:
+            latest = []
+            for norm, bucket in self.by_sender.items():
+                if unread_only and norm not in self.sender_unread: continue
+                latest.append((bucket.keys[-1], norm))
+            latest.sort(reverse=True)
+            page = latest[offset:offset + limit] if limit else latest[offset:]
+            result = []
+            for (timestamp, last_id), norm in page:
+                last = self.messages[last_id]
+                result.append({
+                    'sender': last['sender'],
+                    'sender_norm': norm,
+                    'count': len(self.by_sender[norm]),
+                    'unread': self.sender_unread.get(norm, 0),
+                    'last_message': _public(last)
+                })
+            return len(latest), result
+
+    def clear(self):
+        with self.lock:
+            self.messages.clear()
+            self.deduper.clear()
+            self.order, self.unread, self.by_sender = _SortedKeys(), _SortedKeys(), {}
+            self.ids = _SortedKeys()
+            self.sender_unread = {}
+            self.search_index.clear()
+            self.version += 1
+            self._dirty_ids.clear()
+            self._deleted_ids.clear()
+            self._cleared = True
+        self._mark_dirty()
+
+    # --- BLOCKED SENDERS ---
+
+    def get_blocked(self):
+        with self.lock:
+            return set(self.blocked)
+
+    def add_blocked(self, rule):
+        """Adds a block rule (see blocklist.py), raises BlocklistError if it doesn't compile"""
+        rule = Blocklist.validate(rule)
+        with self.lock:
+            # Compiled before anything changes, so a failure leaves the state as it was
+            blocklist = self._build_blocklist(self.blocked | {rule})
+            self.blocked.add(rule)
+            self.blocklist = blocklist
+            self._blocked_dirty = True
+        self._mark_dirty()
+        return rule
+
+    def remove_blocked(self, rules):
+        """Removes block rules, returns the ones that were there. Messages
+        they dropped at ingest are not brought back."""
+        with self.lock:
+            removed = [rule for rule in dict.fromkeys(r.strip() for r in rules) if rule in self.blocked]
+            if not removed: return []
+            self.blocked.difference_update(removed)
+            self._compile_blocklist()
+            self._blocked_dirty = True
+        self._mark_dirty()
+        return removed
+
+    def set_device_blocked(self, device, numbers):
+        """Merges a phone's own blocked numbers into the blocklist, so they are
+        dropped whichever device or upload a message comes in by. Messages
+        already stored are kept; empty numbers remove the device's entry."""
+        with self.lock:
+            if numbers: self.device_blocked[device] = set(numbers)
+            else: self.device_blocked.pop(device, None)
+            self._compile_blocklist()
+
+    def _build_blocklist(self, blocked):
+        rules = set(blocked)
+        for numbers in self.device_blocked.values():
+            rules.update(numbers)
+        return Blocklist(rules)
+
+    def _compile_blocklist(self):
+        self.blocklist = self._build_blocklist(self.blocked)
+
+    def delete_blocked(self):
+        """Deletes stored messages the desktop rules match (not the phones'
+        own lists), returns how many. Blocked messages are dropped at
+        ingest, so this only runs when rules change."""
+        with self.lock:
+            if not self.blocked: return 0
+            blocklist = Blocklist(self.blocked)
+            doomed = [sms for sms in self.messages.values() if blocklist.matches(sms['sender'], sms['message'])]
+            for sms in doomed:
+                self._unindex(sms)
+                self._dirty_ids.discard(sms['id'])
+                self._deleted_ids.add(sms['id'])
+        if doomed: self._mark_dirty()
+        return len(doomed)
+
+    # --- CONFIG ---
+
+    def get_config(self):
+        with self.lock:
+            return dict(self.config)
+
+    def set_config(self, new_config):
+        with self.lock:
+            self.config = {**self.default_config, **new_config}
+            self._config_dirty = True
+        self._mark_dirty()
+        return self.get_config()
+
+    # --- META (sync cursors etc.) ---
+
+    def get_meta(self, key, default=None):
+        with self.lock:
+            return self.meta.get(key, default)
+
+    def set_meta(self, key, value):
+        with self.lock:
+            self.meta[key] = value
+            self._dirty_meta.add(key)
+            self._deleted_meta.discard(key)
+        self._mark_dirty()
+
+    def delete_meta(self, key, prefix=False):
+        with self.lock:
+            keys = [k for k in self.meta if k.startswith(key)] if prefix else [key]
+            for k in keys:
+                self.meta.pop(k, None)
+                self._dirty_meta.discard(k)
+                self._deleted_meta.add(k)
+        self._mark_dirty()
@@ -0,0 +1,82 @@
+"""Benchmark: streaming content_query parser vs. the old per-line regex loop.
+
+    python bench_content_query.py [rows]
+
+Generates a synthetic `content query` dump (default 100k rows, a few with
+multi-line bodies and bodies containing ", body=") and times both parsers.
+"""
+import io
+import re
+import sys
+import time
+from datetime import datetime
+
+from content_query import iter_rows
+
+COLUMNS = ['_id', 'date', 'address', 'body']
+
+
+def make_dump(rows):
+    out = []
+    for i in range(rows):
+        body = f"Doğrulama kodunuz {100000 + i}. Kimseyle paylaşmayın, body=örnek"
+        if i % 50 == 0:
+            body += "\nikinci satır\nüçüncü satır"
+        out.append(f"Row: {i} _id={i + 1}, date={1700000000000 + i * 1000}, address=+90555{i:07d}, body={body}\n")
+    return "".join(out)
+
+
+def legacy_parse(output):
+    """The loop ADBSyncer._fetch_and_save used before content_query.py"""
+    bulk_data = []
+    for line in output.splitlines():
+        if not line.strip(): continue
+        if "address=" not in line: continue
+        timestamp = None
+        date_match = re.search(r'date=([0-9]+)', line)
+        if date_match:
+            timestamp = datetime.fromtimestamp(int(date_match.group(1)) / 1000.0).isoformat()
+        addr_match = re.search(r'address=(.*?)(, body=|, date=|$)', line)
+        if not addr_match: continue
+        address = addr_match.group(1).strip()
+        if not address: continue
+        body_match = re.search(r'body=(.*)$', line)
+        message = body_match.group(1).strip() if body_match else ""
+        bulk_data.append({"sender": address, "message": message, "timestamp": timestamp})
+    return bulk_data
+
+
+def streaming_parse(output):
+    bulk_data = []
+    for row in iter_rows(io.StringIO(output), COLUMNS):
+        timestamp = datetime.fromtimestamp(int(row['date']) / 1000.0).isoformat()
+        bulk_data.append({"sender": row['address'].strip(), "message": row['body'].strip(), "timestamp": timestamp})
+    return bulk_data
+
+
+def first_row_latency(output):
+    """How long until the streaming parser hands over its first row; the
+    legacy loop has nothing before the whole dump is parsed"""
+    stream = io.StringIO(output)
+    started = time.perf_counter()
+    next(iter_rows(stream, COLUMNS))
+    return time.perf_counter() - started
+
+
+def bench(name, func, output):
+    started = time.perf_counter()
+    result = func(output)
+    elapsed = time.perf_counter() - started
+    print(f"{name:<10} {elapsed * 1000:8.1f} ms  {len(result):>7} rows")
+    return result
+
+
+if __name__ == '__main__':
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    output = make_dump(rows)
+    print(f"Synthetic dump: {rows} rows, {len(output) / 1e6:.1f} MB")
+    legacy = bench("legacy", legacy_parse, output)
+    streamed = bench("streaming", streaming_parse, output)
+    print(f"first row  {first_row_latency(output) * 1000:8.3f} ms (streaming)")
+    broken = sum(1 for a, b in zip(legacy, streamed) if a['message'] != b['message'])
+    print(f"Bodies the legacy parser truncated or mangled: {broken}")
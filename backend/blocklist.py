@@ -0,0 +1,207 @@
+"""One blocklist engine for every path a message can come in by.
+
+Rules are plain strings (blocked_senders.json keeps working as is):
+
+    Akbank, +90 555 111 22 33   the sender, compared normalized and, for
+                                phone numbers, in E.164 form, so 0555...,
+                                555... and +90555... are the same number
+    prefix:0850                 senders (or numbers) starting with it
+    *kampanya*, BANKA?          shell-style wildcard on the sender
+    re:^TR\\d+$                  regular expression on the sender
+    body:kazandınız             word or phrase anywhere in the message
+
+Rules are compiled into sets keyed the way messages are looked up, so an
+exact, number, prefix or body-keyword check costs the same with 5 rules or
+5000. All wildcards compile into one pattern, all regexes into another. A
+sender's verdict is cached until the rules change.
+"""
+import fnmatch
+import logging
+import re
+
+from search_index import fold, tokenize
+from sms_store import normalize_sender
+
+log = logging.getLogger(__name__)
+
+DEFAULT_COUNTRY = '90'
+SENDER_CACHE_SIZE = 50000
+_NUMBER_RE = re.compile(r'\+?[\d\s\-().]+')
+_GLOBAL_FLAGS_RE = re.compile(r'\(\?([aiLmsux]+)\)')
+
+
+def normalize_number(value, country=DEFAULT_COUNTRY):
+    """E.164 form of a phone number ("0555 111 22 33" -> "+905551112233"),
+    digits only for short codes, None for alphanumeric senders"""
+    value = (value or '').strip()
+    if not value or not _NUMBER_RE.fullmatch(value):
+        return None
+    digits = re.sub(r'\D', '', value)
+    if not digits:
+        return None
+    if value.startswith('+'):
+        return '+' + digits
+    if digits.startswith('00'):
+        return '+' + digits[2:]
+    if len(digits) == 11 and digits.startswith('0'):
+        return '+' + country + digits[1:]
+    if len(digits) == 10:
+        return '+' + country + digits
+    return digits
+
+
+def _number_prefix(value, country=DEFAULT_COUNTRY):
+    """Like normalize_number, for the start of a number ("0850" -> "+90850")"""
+    value = (value or '').strip()
+    if not value or not _NUMBER_RE.fullmatch(value):
+        return None
+    digits = re.sub(r'\D', '', value)
+    if value.startswith('+'):
+        return '+' + digits
+    if digits.startswith('00'):
+        return '+' + digits[2:]
+    if digits.startswith('0'):
+        return '+' + country + digits[1:]
+    return digits
+
+
+class BlocklistError(ValueError):
+    pass
+
+
+class Blocklist:
+    def __init__(self, rules=()):
+        self.rules = []
+        self._senders = set()    # normalize_sender() of exact rules
+        self._numbers = set()    # E.164 of exact rules
+        self._prefixes = {}      # length -> set of prefixes
+        self._wildcard = None    # All wildcards, one alternation
+        self._regex = None       # All regexes, one alternation
+        self._phrases = {}       # word count -> set of folded word tuples
+        self._cache = {}         # sender -> bool
+        self.update(rules)
+
+    @staticmethod
+    def validate(rule):
+        """Raises BlocklistError if the rule can't be compiled"""
+        rule = (rule or '').strip()
+        kind, _, value = rule.partition(':')
+        if not rule or (kind in ('prefix', 're', 'body') and not value.strip()):
+            raise BlocklistError("Empty rule")
+        if kind == 're':
+            try:
+                # The way update() compiles it, next to the other regexes
+                re.compile(Blocklist._join([value]), re.IGNORECASE)
+            except re.error as e:
+                raise BlocklistError(f"Invalid regex: {e}")
+        return rule
+
+    def update(self, rules):
+        """Recompiles from scratch; rules that don't compile are skipped"""
+        senders, numbers, prefixes, wildcards, regexes, phrases = set(), set(), {}, [], [], {}
+        kept = []
+        for rule in rules:
+            try:
+                rule = self.validate(rule)
+            except BlocklistError as e:
+                log.warning("Skipping block rule %r: %s", rule, e)
+                continue
+            kept.append(rule)
+            kind, _, value = rule.partition(':')
+            value = value.strip()
+            if kind == 'prefix':
+                prefix = _number_prefix(value) or normalize_sender(value)
+                if prefix: prefixes.setdefault(len(prefix), set()).add(prefix)
+            elif kind == 're':
+                regexes.append(value)
+            elif kind == 'body':
+                words = tuple(tokenize(value))
+                if words: phrases.setdefault(len(words), set()).add(words)
+            elif '*' in rule or '?' in rule:
+                wildcards.append(fnmatch.translate(fold(rule)))
+            else:
+                number = normalize_number(rule)
+                if number: numbers.add(number)
+                norm = normalize_sender(rule)
+                if norm: senders.add(norm)
+
+        self.rules = kept
+        self._senders, self._numbers, self._prefixes, self._phrases = senders, numbers, prefixes, phrases
+        self._wildcard = self._compile(wildcards)
+        self._regex = self._compile(regexes)
+        self._cache = {}
+
+    @staticmethod
+    def _scoped(pattern):
+        """Leading global flags ("(?i)spam") are only allowed at the start of
+        the whole pattern; turn them into a group of their own ("(?i:spam)")"""
+        flags = ''
+        while True:
+            match = _GLOBAL_FLAGS_RE.match(pattern)
+            if not match: break
+            flags += match.group(1)
+            pattern = pattern[match.end():]
+        if not flags:
+            return f'(?:{pattern})'
+        # In verbose mode a trailing comment would swallow the closing paren
+        return f'(?{flags}:{pattern}\n)' if 'x' in flags else f'(?{flags}:{pattern})'
+
+    @staticmethod
+    def _join(patterns):
+        return '|'.join(Blocklist._scoped(p) for p in patterns)
+
+    @staticmethod
+    def _compile(patterns):
+        """One alternation of all patterns. If that doesn't compile, the
+        patterns that do compile on their own are kept (never raises)."""
+        if not patterns:
+            return None
+        try:
+            return re.compile(Blocklist._join(patterns), re.IGNORECASE)
+        except re.error as e:
+            log.warning("Block patterns don't compile together (%s), checking one by one", e)
+        kept = []
+        for pattern in patterns:
+            try:
+                re.compile(Blocklist._join([pattern]), re.IGNORECASE)
+                kept.append(pattern)
+            except re.error as e:
+                log.warning("Skipping block pattern %r: %s", pattern, e)
+        return re.compile(Blocklist._join(kept), re.IGNORECASE) if kept else None
+
+    def __len__(self):
+        return len(self.rules)
+
+    def sender_blocked(self, sender):
+        blocked = self._cache.get(sender)
+        if blocked is None:
+            if len(self._cache) >= SENDER_CACHE_SIZE: self._cache.clear()
+            blocked = self._cache[sender] = self._check_sender(sender)
+        return blocked
+
+    def _check_sender(self, sender):
+        sender = (sender or '').strip()
+        norm = normalize_sender(sender)
+        number = normalize_number(sender)
+        if norm in self._senders or (number and number in self._numbers):
+            return True
+        for length, prefixes in self._prefixes.items():
+            if (number and number[:length] in prefixes) or norm[:length] in prefixes:
+                return True
+        if self._wildcard is not None and self._wildcard.match(fold(sender)):
+            return True
+        return self._regex is not None and bool(self._regex.search(sender))
+
+    def body_blocked(self, message):
+        if not self._phrases or not message:
+            return False
+        words = tokenize(message)
+        for size, phrases in self._phrases.items():
+            for i in range(len(words) - size + 1):
+                if tuple(words[i:i + size]) in phrases:
+                    return True
+        return False
+
+    def matches(self, sender, message=None):
+        """True if a message from sender (with this body) is blocked"""
+        return self.sender_blocked(sender) or self.body_blocked(message)
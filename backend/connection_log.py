@@ -0,0 +1,172 @@
+"""Append-only connection log (JSON Lines) with rotation.
+
+Every connect/disconnect is one line appended to connection_logs.jsonl, so
+a write costs the same on day one and after a year of a flapping WiFi
+phone. When the file passes MAX_BYTES, or its first entry is older than
+MAX_AGE days, it is moved aside as connection_logs.<time>.jsonl.gz (or plain
+.jsonl with compress=False); only the newest KEEP archives are kept.
+"""
+import glob
+import gzip
+import json
+import logging
+import os
+import shutil
+import threading
+from datetime import datetime, timedelta
+
+log = logging.getLogger(__name__)
+
+MAX_BYTES = 1024 * 1024
+MAX_AGE = 30 # Days
+KEEP = 5 # Archives
+READ_BLOCK = 64 * 1024
+
+
+def _reverse_lines(path):
+    """Lines of a file, last first, reading it from the end in blocks"""
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        rest = b''
+        while pos > 0:
+            step = min(READ_BLOCK, pos)
+            pos -= step
+            f.seek(pos)
+            lines = (f.read(step) + rest).split(b'\n')
+            rest = lines.pop(0) # May be cut, finish it with the previous block
+            for line in reversed(lines):
+                if line.strip(): yield line
+        if rest.strip(): yield rest
+
+
+class ConnectionLog:
+    def __init__(self, path, max_bytes=MAX_BYTES, max_age=MAX_AGE, keep=KEEP, compress=True):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = timedelta(days=max_age)
+        self.keep = keep
+        self.compress = compress
+        self.lock = threading.Lock()
+        self.version = 0 # Bumped by every append (HTTP validators)
+        self.size = os.path.getsize(path) if os.path.exists(path) else 0
+        self.started = self._first_time()
+
+    def _first_time(self):
+        """logged_at of the current file's first entry"""
+        if not self.size: return None
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return datetime.fromisoformat(json.loads(f.readline())['logged_at'])
+        except Exception:
+            return datetime.now()
+
+    def append(self, entry):
+        now = datetime.now()
+        record = {**entry, 'logged_at': now.isoformat()}
+        line = (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8')
+        with self.lock:
+            if self.size and (self.size + len(line) > self.max_bytes or now - self.started > self.max_age):
+                self._rotate(now)
+            with open(self.path, 'ab') as f:
+                f.write(line)
+            self.size += len(line)
+            self.version += 1
+            if self.started is None: self.started = now
+        return record
+
+    def _archive_pattern(self):
+        base, ext = os.path.splitext(self.path)
+        return f"{base}.*{ext}*"
+
+    def _rotate(self, now):
+        base, ext = os.path.splitext(self.path)
+        target = f"{base}.{now.strftime('%Y%m%d-%H%M%S-%f')}{ext}"
+        try:
+            if self.compress:
+                with open(self.path, 'rb') as src, gzip.open(target + '.gz', 'wb') as dst:
+                    shutil.copyfileobj(src, dst)
+                os.remove(self.path)
+            else:
+                os.replace(self.path, target)
+        except OSError as e:
+            log.error("Connection log rotation failed: %s", e)
+            return
+        self.size, self.started = 0, None
+        for old in self._archives()[self.keep:]:
+            try: os.remove(old)
+            except OSError: pass
+
+    def _archives(self):
+        """Rotated files, newest first (the timestamp in the name sorts)"""
+        return sorted(glob.glob(self._archive_pattern()), reverse=True)
+
+    def _iter_newest_first(self):
+        with self.lock:
+            files = ([self.path] if os.path.exists(self.path) else []) + self._archives()
+        for path in files:
+            try:
+                if path.endswith('.gz'):
+                    with gzip.open(path, 'rb') as f:
+                        lines = [line for line in f.read().split(b'\n') if line.strip()]
+                    lines.reverse()
+                else:
+                    lines = _reverse_lines(path)
+                for line in lines:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue # A line cut by a crash
+            except OSError:
+                continue # Rotated away while we were reading
+
+    def query(self, limit=100, since=None, until=None, type=None, target=None, cursor=None):
+        """Newest first. since/until are ISO times (until exclusive). cursor is
+        the (logged_at, n) returned with the previous page: entries are
+        skipped up to the n-th one logged at that time, so entries sharing the
+        page boundary's timestamp aren't lost. Returns (entries, next cursor
+        or None)."""
+        result = []
+        last = None
+        run_time, run_n = None, 0 # Position among entries with the same logged_at
+        for entry in self._iter_newest_first():
+            logged_at = entry.get('logged_at') or ''
+            if logged_at == run_time:
+                run_n += 1
+            else:
+                run_time, run_n = logged_at, 1
+            if until and logged_at >= until: continue
+            if cursor and (logged_at > cursor[0] or (logged_at == cursor[0] and run_n <= cursor[1])): continue
+            if since and logged_at < since: break
+            if type and entry.get('type') != type: continue
+            if target and entry.get('target') != target: continue
+            if len(result) == limit:
+                return result, last
+            result.append(entry)
+            last = (logged_at, run_n)
+        return result, None
+
+    def migrate_from_json(self, json_path):
+        """One-shot import of the old connection_logs.json array"""
+        if not os.path.exists(json_path):
+            return 0
+        try:
+            with open(json_path, 'r', encoding='utf-8') as f:
+                legacy = json.load(f)
+        except Exception as e:
+            log.warning("Legacy connection log read error: %s", e)
+            legacy = []
+        with self.lock, open(self.path, 'ab') as f:
+            for entry in legacy:
+                stamp = entry.get('end_time') or entry.get('time') or datetime.now().isoformat()
+                line = (json.dumps({**entry, 'logged_at': stamp}, ensure_ascii=False) + '\n').encode('utf-8')
+                f.write(line)
+                self.size += len(line)
+        self.started = self._first_time()
+        self.version += 1
+        try:
+            os.replace(json_path, json_path + '.migrated')
+        except OSError as e:
+            log.warning("Could not rename legacy connection log: %s", e)
+        log.info("Migrated %d connection log entries", len(legacy))
+        return len(legacy)
@@ -0,0 +1,98 @@
+"""Streaming parser for `adb shell content query` output.
+
+The tool prints one record per row as
+
+    Row: 0 _id=12, date=1700000000000, address=+905551112233, body=Hello, world
+
+and a body that contains newlines simply continues on the following lines,
+so rows are split on the `Row: N ` prefix rather than on line breaks. Values
+are cut at the `, <next column>=` marker of the column that follows in the
+projection, which keeps commas and `, body=` inside the last column intact.
+"""
+import re
+from functools import lru_cache
+
+ROW_START = re.compile(r'Row: \d+ ')
+
+
+@lru_cache(maxsize=16)
+def _row_pattern(columns):
+    """One precompiled pattern per projection; every value but the last stops
+    at the marker of the next column, the last one runs to the end."""
+    parts = [f"{re.escape(c)}=(.*?)" for c in columns[:-1]]
+    parts.append(f"{re.escape(columns[-1])}=(.*)")
+    return re.compile(", ".join(parts), re.DOTALL)
+
+
+def parse_row(text, columns):
+    """Splits the text after `Row: N ` into {column: value} for the given
+    projection. Returns {} for a row that doesn't match it, `NULL` becomes None."""
+    match = _row_pattern(tuple(columns)).match(text)
+    if not match:
+        return {}
+    return {c: (None if v == 'NULL' else v) for c, v in zip(columns, match.groups())}
+
+
+class RowParser:
+    """Push-style form of iter_rows for sources that aren't plain iterables
+    (an asyncio stream): feed() one line at a time, it returns the row the
+    line completed or None; finish() returns the last row."""
+
+    def __init__(self, columns):
+        self.columns = tuple(columns)
+        self.pattern = _row_pattern(self.columns)
+        self.current = None
+
+    def _build(self, parts):
+        match = self.pattern.match(parts[0] if len(parts) == 1 else "\n".join(parts))
+        if not match:
+            return {}
+        return {c: (None if v == 'NULL' else v) for c, v in zip(self.columns, match.groups())}
+
+    def feed(self, line):
+        line = line.rstrip('\r\n')
+        start = ROW_START.match(line) if line.startswith('Row: ') else None
+        if start:
+            done = self._build(self.current) if self.current is not None else None
+            self.current = [line[start.end():]]
+            return done
+        if self.current is not None:
+            self.current.append(line)
+        # Anything before the first row ("No result found." etc.) is ignored
+        return None
+
+    def finish(self):
+        current, self.current = self.current, None
+        return self._build(current) if current is not None else None
+
+
+def iter_rows(lines, columns):
+    """Yields one dict per row from an iterable of output lines (with or
+    without trailing newlines), as soon as the next row starts."""
+    parser = RowParser(columns)
+    feed = parser.feed
+    for line in lines:
+        row = feed(line)
+        if row is not None:
+            yield row
+    row = parser.finish()
+    if row is not None:
+        yield row
+
+
+async def aiter_rows(lines, columns):
+    """iter_rows for an async iterable of lines (ADBShellSession.stream)"""
+    parser = RowParser(columns)
+    async for line in lines:
+        row = parser.feed(line)
+        if row is not None:
+            yield row
+    row = parser.finish()
+    if row is not None:
+        yield row
+
+
+def iter_stdout(stream, encoding='utf-8'):
+    """Decodes a binary Popen stdout line by line without reading it all"""
+    for raw in iter(stream.readline, b''):
+        yield raw.decode(encoding, errors='ignore')
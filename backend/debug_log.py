@@ -0,0 +1,156 @@
+"""Debug log (sms_debug.txt) for the desktop app.
+
+Modules log through `logging.getLogger(__name__)`. Records are put on a
+queue and written by a background listener (the desktop app also routes
+stdout/stderr there, see capture_output()), so a request or a sync never
+waits on the disk. The file rotates at MAX_BYTES. A message repeated over
+and over (a phone that keeps timing out) is let through RATE_BURST times
+per RATE_WINDOW; the rest are counted and the count is logged with the
+next one that gets through.
+
+Levels come from config.json: `log_level` for everything and
+`log_levels` ({"adb_manager": "DEBUG", ...}) per module. Both can be
+changed at runtime through /api/config.
+"""
+import atexit
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+
+LOG_FORMAT = '%(asctime)s %(levelname)-7s %(name)s: %(message)s'
+MAX_BYTES = 2 * 1024 * 1024
+BACKUP_COUNT = 3
+RATE_WINDOW = 60.0 # Seconds
+RATE_BURST = 5 # Identical messages let through per window
+RATE_KEYS = 1000 # Distinct messages tracked before the table is reset
+
+_listener = None
+_configured = set() # Loggers that got a level from log_levels
+
+
+class RateLimitFilter(logging.Filter):
+    def __init__(self, window=RATE_WINDOW, burst=RATE_BURST):
+        super().__init__()
+        self.window = window
+        self.burst = burst
+        self.seen = {} # (logger, level, message) -> [window start, count, suppressed]
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        # The formatted text: one template logs many different messages
+        try:
+            message = record.getMessage()
+        except Exception:
+            message = str(record.msg) # Bad args; the handler reports those itself
+        key = (record.name, record.levelno, message)
+        now = time.monotonic()
+        with self.lock:
+            entry = self.seen.get(key)
+            if entry is None or now - entry[0] >= self.window:
+                suppressed = entry[2] if entry else 0
+                if len(self.seen) >= RATE_KEYS: self.seen.clear()
+                self.seen[key] = [now, 1, 0]
+                if suppressed:
+                    record.msg = f"{message} (+{suppressed} identical messages suppressed)"
+                    record.args = None
+                return True
+            entry[1] += 1
+            if entry[1] <= self.burst:
+                return True
+            entry[2] += 1
+            return False
+
+
+class _StreamToLog:
+    """Stands in for sys.stdout/sys.stderr, so output of libraries that
+    print (and tracebacks) still ends up in the log, through the queue"""
+
+    def __init__(self, logger, level):
+        self.logger = logger
+        self.level = level
+        self.buffer = ''
+        self.lock = threading.Lock()
+
+    def write(self, message):
+        with self.lock:
+            self.buffer += message
+            lines = self.buffer.split('\n')
+            self.buffer = lines.pop()
+        for line in lines:
+            if line.strip(): self.logger.log(self.level, '%s', line.rstrip())
+        return len(message)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+
+def setup(path, level='INFO', levels=None):
+    """Starts the background writer and routes the root logger to it"""
+    global _listener
+    if _listener: return
+    handlers = []
+    try:
+        file_handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=MAX_BYTES, backupCount=BACKUP_COUNT, encoding='utf-8', delay=True)
+        file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        handlers.append(file_handler)
+    except OSError as e:
+        if sys.__stderr__ is not None: sys.__stderr__.write(f"Debug log unavailable: {e}\n")
+    if sys.__stdout__ is not None: # None in the windowed exe
+        console = logging.StreamHandler(sys.__stdout__)
+        console.setFormatter(logging.Formatter(LOG_FORMAT))
+        handlers.append(console)
+
+    # A failing handler would report to sys.stderr, i.e. back into this log
+    logging.raiseExceptions = False
+    records = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(records)
+    queue_handler.addFilter(RateLimitFilter())
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    _listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown)
+    apply_levels(level, levels)
+
+
+def capture_output():
+    """Routes stdout and stderr into the log too (the desktop app, which
+    has no console; importing app.py leaves them alone)"""
+    if not isinstance(sys.stdout, _StreamToLog):
+        sys.stdout = _StreamToLog(logging.getLogger('stdout'), logging.INFO)
+        sys.stderr = _StreamToLog(logging.getLogger('stderr'), logging.ERROR)
+
+
+def apply_levels(level='INFO', levels=None):
+    """Sets the global level and per-module overrides; unknown level names
+    are skipped. Modules dropped from `levels` go back to the global level."""
+    root = logging.getLogger()
+    try:
+        root.setLevel(str(level or 'INFO').upper())
+    except ValueError:
+        logging.getLogger(__name__).warning("Unknown log level %r", level)
+    wanted = dict(levels or {})
+    for name in _configured - set(wanted):
+        logging.getLogger(name).setLevel(logging.NOTSET)
+    _configured.clear()
+    for name, module_level in wanted.items():
+        try:
+            logging.getLogger(name).setLevel(str(module_level).upper())
+            _configured.add(name)
+        except (TypeError, ValueError):
+            logging.getLogger(__name__).warning("Unknown log level %r for %s", module_level, name)
+
+
+def shutdown():
+    """Writes out whatever is still queued (os._exit skips atexit handlers)"""
+    global _listener
+    if _listener:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,91 @@
+import hashlib
+import math
+import threading
+
+from sms_store import normalize_sender
+
+
+def dedupe_key(device, sender, timestamp, body):
+    """Stable identity of a message: the same SMS seen again on the same
+    device hashes the same, while a repeated text (e.g. the same OTP wording
+    on another day) does not."""
+    raw = "\x1f".join((str(device or ''), normalize_sender(sender), str(timestamp or ''), body or ''))
+    return hashlib.blake2b(raw.encode('utf-8'), digest_size=16).hexdigest()
+
+
+class BloomFilter:
+    """Fixed-size bit array answering "definitely new" vs "maybe seen"."""
+
+    def __init__(self, capacity, error_rate=0.001):
+        self.capacity = max(1, capacity)
+        self.size = max(8, int(-self.capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        # Keys are already hex digests, derive k positions by double hashing
+        h1 = int(key[:16], 16)
+        h2 = int(key[16:32], 16) | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, key):
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+
+class Deduper:
+    """Content-hash index of stored messages with a Bloom filter in front.
+
+    The filter answers most lookups for new rows without touching the index;
+    it never forgets, so removals only leave false positives behind and the
+    filter is rebuilt from the index once it is over capacity.
+    """
+
+    def __init__(self, capacity=100000, error_rate=0.001):
+        self.initial_capacity = capacity
+        self.error_rate = error_rate
+        self.index = {} # dedupe key -> sms id
+        self.lock = threading.Lock()
+        self.bloom = BloomFilter(capacity, error_rate)
+        self.bloom_skips = 0
+
+    def _rebuild(self, capacity):
+        self.bloom = BloomFilter(capacity, self.error_rate)
+        for key in self.index:
+            self.bloom.add(key)
+
+    def contains(self, key):
+        with self.lock:
+            if key not in self.bloom:
+                self.bloom_skips += 1
+                return False
+            return key in self.index
+
+    def add(self, key, sms_id):
+        with self.lock:
+            self.index[key] = sms_id
+            self.bloom.add(key)
+            if self.bloom.count > self.bloom.capacity:
+                self._rebuild(max(self.initial_capacity, len(self.index) * 2))
+
+    def get(self, key):
+        """Id of the message stored under key, or None"""
+        with self.lock:
+            return self.index.get(key)
+
+    def remove(self, key):
+        with self.lock:
+            self.index.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.index.clear()
+            self._rebuild(self.initial_capacity)
+
+    def __len__(self):
+        return len(self.index)
@@ -0,0 +1,288 @@
+"""Keeps several phones syncing at once, ADB and WiFi mixed.
+
+Every connected device is a task on the SyncEngine's event loop (plus a
+push task for WiFi phones). At most max_workers polls run at the same time,
+a device only waits for its own poll to finish, so a slow or hung phone
+never delays the others. How long a device waits between polls is up to
+the shared PollScheduler (activity, errors, window visibility, battery);
+poll starts are spaced STAGGER apart so devices don't all hit the storage
+writer in the same instant.
+
+Rows go to the shared IngestQueue; a poll waits for its batch to be stored
+before it moves the device's cursor, but never for another device's rows.
+
+The public methods are called from Flask threads and block until the loop
+has done the work; disconnecting cancels the device's tasks right away.
+"""
+import asyncio
+import logging
+import threading
+import time
+from datetime import datetime
+
+import adb_manager
+import wifi_syncer
+from adb_manager import ADBSyncer, list_devices
+from adb_shell import ADBShellPool
+from poll_scheduler import PollScheduler
+from sync_engine import SyncEngine
+from wifi_syncer import WiFiSyncer
+
+log = logging.getLogger(__name__)
+
+MAX_WORKERS = 8
+STAGGER = 0.05 # Minimum gap between two poll starts
+
+class Device:
+    def __init__(self, kind, target, syncer):
+        self.kind = kind # 'adb' or 'wifi'
+        self.target = target # Serial or IP, also the 'device' tag on its messages
+        self.syncer = syncer
+        self.connected_at = datetime.now().isoformat()
+        self.removed = False
+        self.tasks = []
+        self.wake = asyncio.Event() # Poll now instead of at next_due
+        self.in_flight = False
+        self.next_due = None
+        self.initial = True # Until the first import finished (no notifications)
+        self.polls = 0
+        self.messages = 0
+        self.error_count = 0
+        self.last_error = None
+        self.last_success = None # time.time() of the last good poll
+        self.last_poll_ms = None
+
+    def status(self):
+        now = time.time()
+        status = {
+            'device': self.target,
+            'type': self.kind,
+            'active': not self.removed,
+            'connected_at': self.connected_at,
+            'syncing': self.in_flight,
+            'initial_sync': self.initial,
+            'polls': self.polls,
+            'messages': self.messages,
+            'errors': self.error_count,
+            'last_error': self.last_error,
+            'last_success': datetime.fromtimestamp(self.last_success).isoformat() if self.last_success else None,
+            # Seconds since the device was last known to be in sync
+            'lag': round(now - self.last_success, 1) if self.last_success else None,
+            'last_poll_ms': self.last_poll_ms,
+            'next_poll_in': round(max(0.0, self.next_due - time.monotonic()), 1) if self.next_due and not self.in_flight else None
+        }
+        if self.kind == 'wifi':
+            status['push'] = self.syncer.push_active
+        else:
+            status['phone_blocked'] = len(self.syncer.device_blocked)
+        status['battery'] = self.syncer.battery
+        return status
+
+class DeviceManager:
+    def __init__(self, app_context, ingest_queue, state_store=None, max_workers=MAX_WORKERS, engine=None, scheduler=None):
+        self.app_context = app_context
+        self.ingest = ingest_queue # submit(rows, final=..., initial=...) -> Future
+        self.state_store = state_store
+        self.engine = engine or SyncEngine() # Started with the first device
+        self.scheduler = scheduler or PollScheduler()
+        self.devices = {} # target -> Device, in connect order; only changed on the loop
+        self.devices_lock = threading.Lock() # Held for changes, and by readers on other threads
+        self.slots = asyncio.Semaphore(max(1, int(max_workers))) # Polls running at once
+        self.start_lock = asyncio.Lock()
+        self.last_start = 0.0
+        self.shell_pool = ADBShellPool() # Shared, one persistent shell per serial
+
+    # --- PUBLIC (any thread) ---
+
+    def add_adb(self, serial, full_resync=False, poll_interval=None):
+        """Starts syncing a USB device, returns (device, created)"""
+        return self.engine.start().call(self._add_adb(serial, full_resync, poll_interval))
+
+    def add_wifi(self, ip):
+        """Starts syncing a phone over WiFi, returns (device, created)"""
+        return self.engine.start().call(self._add_wifi(ip))
+
+    def remove(self, target):
+        """Stops one device, returns it (or None if it wasn't connected)"""
+        if self.engine.loop is None: return None # Nothing was ever connected
+        return self.engine.call(self._remove(target))
+
+    def remove_all(self):
+        if self.engine.loop is None: return []
+        return self.engine.call(self._remove_all())
+
+    def get(self, target):
+        with self.devices_lock:
+            return self.devices.get(target)
+
+    def connected(self):
+        """Snapshot of the devices; the loop may be adding or removing one"""
+        with self.devices_lock:
+            return list(self.devices.values())
+
+    def get_status(self):
+        statuses = []
+        for device in self.connected():
+            status = device.status()
+            status['schedule'] = self.scheduler.describe(device.target)
+            statuses.append(status)
+        return statuses
+
+    def set_visible(self, visible, client='window', ttl=None):
+        """A UI client shown or hidden (see PollScheduler.set_visible); the
+        app becoming visible polls every device right away"""
+        if self.scheduler.set_visible(visible, client, ttl) and visible:
+            for device in self.connected():
+                self.engine.call_soon(device.wake.set)
+
+    def refresh_blocklists(self, serial=None):
+        """Drops the cached phone-side blocked numbers (one device or all ADB
+        devices) and polls right away so they are re-read. Returns the serials."""
+        refreshed = []
+        for device in self.connected():
+            if device.kind != 'adb' or (serial and device.target != serial): continue
+            device.syncer.invalidate_blocked()
+            self.engine.call_soon(device.wake.set)
+            refreshed.append(device.target)
+        return refreshed
+
+    def list_adb_devices(self):
+        return list_devices()
+
+    def get_adb_metrics(self):
+        return self.shell_pool.get_metrics()
+
+    def reset_cursors(self):
+        """Forget every device's sync cursor so the next connect re-imports it"""
+        if self.state_store:
+            self.state_store.delete_meta(adb_manager.CURSOR_KEY, prefix=True)
+            self.state_store.delete_meta(wifi_syncer.CURSOR_KEY, prefix=True)
+
+    def close(self):
+        if self.engine.loop is None: return # Never started
+        try:
+            self.engine.call(self._close())
+        except Exception as e:
+            log.warning("Device shutdown: %s", e)
+        self.engine.stop()
+
+    # --- LOOP SIDE ---
+
+    def _deliver(self, device):
+        """Per-device save callback: counts rows, drops late batches from a
+        device that was disconnected mid-poll and waits for the ingest queue"""
+        async def callback(rows, final=True):
+            if device.removed: return
+            device.messages += len(rows)
+            initial = device.initial
+            if final: device.initial = False
+            await asyncio.wrap_future(self.ingest.submit(rows, final=final, initial=initial))
+        return callback
+
+    async def _add_adb(self, serial, full_resync, poll_interval):
+        device = self.devices.get(serial)
+        if device and device.kind == 'adb':
+            if poll_interval: device.syncer.poll_interval = poll_interval
+            if full_resync: device.syncer.full_resync = True
+            device.wake.set()
+            return device, False
+        await self._remove(serial)
+        syncer = ADBSyncer(self.app_context, None, state_store=self.state_store, shell_pool=self.shell_pool)
+        device = Device('adb', serial, syncer)
+        syncer.save_callback = self._deliver(device)
+        if self.state_store:
+            syncer.on_blocked_changed = self.state_store.set_device_blocked
+        syncer.attach(serial, full_resync=full_resync, poll_interval=poll_interval)
+        self._start(device)
+        log.info("ADB sync started for %s", serial)
+        return device, True
+
+    async def _add_wifi(self, ip):
+        device = self.devices.get(ip)
+        if device and device.kind == 'wifi':
+            device.wake.set()
+            return device, False
+        await self._remove(ip)
+        device = Device('wifi', ip, None)
+        device.syncer = WiFiSyncer(self.app_context, self._deliver(device), state_store=self.state_store)
+        device.syncer.attach(ip)
+        self._start(device)
+        device.tasks.append(asyncio.create_task(device.syncer.push_loop(), name=f"push:{ip}"))
+        log.info("WiFi Sync started for %s", ip)
+        return device, True
+
+    def _start(self, device):
+        with self.devices_lock:
+            self.devices[device.target] = device
+        device.tasks.append(asyncio.create_task(self._device_loop(device), name=f"sync:{device.target}"))
+
+    async def _remove(self, target):
+        with self.devices_lock:
+            device = self.devices.pop(target, None)
+        if not device: return None
+        device.removed = True
+        for task in device.tasks:
+            task.cancel()
+        # Cancellation lands at the next await; the shell/HTTP cleanup runs there
+        await asyncio.gather(*device.tasks, return_exceptions=True)
+        if device.kind == 'adb':
+            await self.shell_pool.aclose(device.target)
+            if self.state_store: self.state_store.set_device_blocked(device.target, ())
+        device.syncer.stop_sync()
+        self.scheduler.forget(target)
+        return device
+
+    async def _remove_all(self):
+        return [await self._remove(device.target) for device in self.connected()]
+
+    async def _close(self):
+        await self._remove_all()
+        await self.shell_pool.aclose_all()
+
+    async def _device_loop(self, device):
+        while True:
+            delay = await self._poll(device)
+            device.next_due = time.monotonic() + delay
+            try:
+                await asyncio.wait_for(device.wake.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+            device.wake.clear()
+
+    async def _stagger(self):
+        async with self.start_lock:
+            wait = self.last_start + STAGGER - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self.last_start = time.monotonic()
+
+    async def _poll(self, device):
+        """Runs one poll, returns the delay until the next one"""
+        async with self.slots:
+            await self._stagger()
+            device.in_flight = True
+            started = time.monotonic()
+            # The first import isn't activity, it's history
+            messages_before = None if device.initial else device.messages
+            try:
+                await device.syncer.poll_once()
+                device.error_count = 0
+                device.last_error = None
+                device.last_success = time.time()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                device.error_count += 1
+                device.last_error = str(e)
+                log.warning("Sync Error (%s): %s", device.target, e)
+            finally:
+                device.in_flight = False
+                device.polls += 1
+                device.last_poll_ms = round((time.monotonic() - started) * 1000, 1)
+
+        return self.scheduler.next_delay(
+            device.target, device.syncer.poll_delay(),
+            new_messages=device.messages - messages_before if messages_before is not None else 0,
+            error_count=device.error_count,
+            battery=device.syncer.battery,
+            push=getattr(device.syncer, 'push_active', False))
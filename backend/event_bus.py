@@ -0,0 +1,49 @@
+import threading
+from collections import deque
+
+
+class EventBus:
+    """In-process publish/subscribe for change events.
+
+    Every event gets a monotonically increasing id and the most recent ones
+    are kept in a ring buffer, so a reconnecting subscriber can ask for
+    everything after the last id it saw instead of refetching the inbox.
+    """
+
+    def __init__(self, history=1000):
+        self.events = deque(maxlen=history)
+        self.last_id = 0
+        self.closed = False
+        self.cond = threading.Condition()
+
+    def publish(self, event_type, data=None):
+        with self.cond:
+            self.last_id += 1
+            self.events.append({'id': self.last_id, 'type': event_type, 'data': data or {}})
+            self.cond.notify_all()
+            return self.last_id
+
+    def since(self, last_id):
+        """Events newer than last_id, or None if some of them were already
+        dropped from the buffer (the caller has to do a full refresh)."""
+        with self.cond:
+            return self._since(last_id)
+
+    def _since(self, last_id):
+        if last_id >= self.last_id:
+            return []
+        if self.events and last_id < self.events[0]['id'] - 1:
+            return None
+        return [e for e in self.events if e['id'] > last_id]
+
+    def wait(self, last_id, timeout=15):
+        """Blocks until there is something newer than last_id or timeout passes"""
+        with self.cond:
+            self.cond.wait_for(lambda: self.closed or self.last_id > last_id, timeout=timeout)
+            return self._since(last_id)
+
+    def close(self):
+        """Wakes every waiting subscriber for good (server shutdown)"""
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
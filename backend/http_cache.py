@@ -0,0 +1,123 @@
+"""Conditional GETs and prebuilt bodies for the polled read endpoints.
+
+A response is cached per path + query string, together with the version
+of the data it was built from (AppState.version, ConnectionLog.version).
+The ETag is derived from that version alone, so a client polling with
+If-None-Match gets a 304 without the payload being built or even looked
+up. When the version moves, the JSON is serialized once and every poller
+gets the same bytes. Bodies over MIN_COMPRESS bytes are compressed once
+per encoding: brotli if the module is installed, gzip otherwise.
+
+The cache is bounded by MAX_ENTRIES and by MAX_BYTES of bodies in all
+(oldest used go first); a body over a quarter of MAX_BYTES isn't kept.
+Responses that are big by nature (the whole inbox without a limit) are
+built per request and not kept at all (store=False).
+Query args must be validated before respond(): a matching If-None-Match
+returns 304 without build() ever running.
+"""
+import gzip
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from flask import Response, current_app, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MAX_ENTRIES = 256 # Distinct path + query strings kept
+MAX_BYTES = 32 * 1024 * 1024 # Bodies and their compressed copies, all entries together
+MIN_COMPRESS = 1024 # Bytes; smaller bodies are sent as is
+GZIP_LEVEL = 6
+
+
+def _compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, GZIP_LEVEL)
+
+
+class ResponseCache:
+    def __init__(self, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict() # key -> {'version', 'body', encoding: bytes}
+        self.size = 0 # Bytes of every body in entries
+        self.lock = threading.Lock()
+        self.epoch = os.urandom(4).hex() # Tags from before a restart never match
+
+    def _etag(self, key, version, encoding=None):
+        digest = hashlib.blake2b(repr((self.epoch, key, version)).encode(), digest_size=8).hexdigest()
+        return f'"{digest}-{encoding}"' if encoding else f'"{digest}"'
+
+    def _encoding(self, size):
+        if size < MIN_COMPRESS: return None
+        accepted = request.accept_encodings
+        if brotli is not None and accepted['br']: return 'br'
+        if accepted['gzip']: return 'gzip'
+        return None
+
+    @staticmethod
+    def _entry_size(entry):
+        return sum(len(v) for v in entry.values() if isinstance(v, bytes))
+
+    def _evict(self):
+        """Drops the least recently used entries until within bounds (lock held)"""
+        while self.entries and (len(self.entries) > self.max_entries or self.size > self.max_bytes):
+            _, entry = self.entries.popitem(last=False)
+            self.size -= self._entry_size(entry)
+
+    def respond(self, version, build, store=True):
+        """The response to the current GET: 304 if the client has `version`
+        already, else build()'s value as JSON (built once per version, or
+        every time with store=False)"""
+        key = request.full_path
+        base = self._etag(key, version)
+        if request.if_none_match:
+            # Any encoding of this version will do, the content is the same
+            tags = {base} | {self._etag(key, version, e) for e in ('gzip', 'br')}
+            if any(request.if_none_match.contains_weak(tag.strip('"')) for tag in tags):
+                return self._headers(Response(status=304), base)
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry['version'] == version:
+                self.entries.move_to_end(key)
+            else:
+                entry = None
+        if entry is None:
+            entry = {'version': version, 'body': current_app.json.dumps(build()).encode('utf-8')}
+            if store and len(entry['body']) <= self.max_bytes // 4:
+                with self.lock:
+                    old = self.entries.pop(key, None)
+                    if old is not None: self.size -= self._entry_size(old)
+                    self.entries[key] = entry
+                    self.size += len(entry['body'])
+                    self._evict()
+
+        body = entry['body']
+        encoding = self._encoding(len(body))
+        if encoding:
+            encoded = entry.get(encoding)
+            if encoded is None:
+                encoded = _compress(body, encoding)
+                with self.lock:
+                    if self.entries.get(key) is entry: # Not evicted or replaced meanwhile
+                        entry[encoding] = encoded
+                        self.size += len(encoded)
+                        self._evict()
+            response = Response(encoded, mimetype='application/json')
+            response.headers['Content-Encoding'] = encoding
+            return self._headers(response, self._etag(key, version, encoding))
+        return self._headers(Response(body, mimetype='application/json'), base)
+
+    @staticmethod
+    def _headers(response, etag):
+        response.headers['ETag'] = etag
+        # Cache, but ask every time (If-None-Match); the browser does it for fetch/XHR too
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['Vary'] = 'Accept-Encoding'
+        return response
@@ -0,0 +1,109 @@
+"""Small asyncio HTTP/1.1 client for the phone's SmsServer.
+
+Only what WiFiSyncer needs: GET with a query string, a keep-alive
+connection that is reopened when the phone drops it, Content-Length and
+chunked bodies, and a JSON helper. Every await in it is a cancellation
+point, so a stopped device tears its connection down immediately.
+"""
+import asyncio
+import json
+from urllib.parse import urlencode
+
+
+class HTTPError(Exception):
+    pass
+
+
+class HTTPResponse:
+    def __init__(self, status_code, headers, body):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = body
+
+    def json(self):
+        return json.loads(self.content.decode('utf-8'))
+
+
+class AsyncHTTPClient:
+    """One keep-alive connection to host:port, requests are serialized on it"""
+
+    def __init__(self, host, port, connect_timeout=3):
+        self.host = host
+        self.port = port
+        self.connect_timeout = connect_timeout
+        self.reader = None
+        self.writer = None
+        self.lock = asyncio.Lock()
+
+    async def _connect(self):
+        self.close()
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), self.connect_timeout)
+
+    async def get(self, path, params=None, timeout=10):
+        if params:
+            path += '?' + urlencode(params)
+        request = (f"GET {path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\n"
+                   "Accept: application/json\r\nConnection: keep-alive\r\n\r\n").encode('ascii')
+        async with self.lock:
+            for attempt in range(2):
+                reused = self.writer is not None
+                try:
+                    if not reused:
+                        await self._connect()
+                    self.writer.write(request)
+                    await self.writer.drain()
+                    return await asyncio.wait_for(self._read_response(), timeout)
+                except (ConnectionError, asyncio.IncompleteReadError, HTTPError) as e:
+                    self.close()
+                    # A kept-alive connection the phone already closed: retry once on a fresh one
+                    if reused and attempt == 0: continue
+                    raise HTTPError(str(e) or type(e).__name__)
+                except BaseException:
+                    # Timeout or cancellation mid-response, the stream is out of sync
+                    self.close()
+                    raise
+
+    async def _read_response(self):
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise HTTPError("connection closed")
+        parts = status_line.decode('latin-1').split(None, 2)
+        if len(parts) < 2 or not parts[0].startswith('HTTP/'):
+            raise HTTPError(f"bad status line: {status_line!r}")
+        status = int(parts[1])
+
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            body = bytearray()
+            while True:
+                size = int((await self.reader.readline()).split(b';')[0].strip() or b'0', 16)
+                if size == 0:
+                    await self.reader.readline()
+                    break
+                body += await self.reader.readexactly(size)
+                await self.reader.readline()
+            body = bytes(body)
+        elif 'content-length' in headers:
+            body = await self.reader.readexactly(int(headers['content-length']))
+        else:
+            body = await self.reader.read()
+            headers['connection'] = 'close'
+
+        if headers.get('connection', '').lower() == 'close':
+            self.close()
+        return HTTPResponse(status, headers, body)
+
+    def close(self):
+        writer, self.writer, self.reader = self.writer, None, None
+        if writer:
+            try:
+                writer.close()
+            except Exception: pass
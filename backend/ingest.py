@@ -0,0 +1,182 @@
+"""Single-writer ingest queue.
+
+Syncers and the /api/sms/bulk endpoint submit batches from any thread; one
+worker drains whatever is queued (up to MAX_ROWS) and hands it to the
+handler in one call, so concurrent batches from several phones become one
+insert and one write-behind transaction instead of one each. Every
+submitter gets its own per-row results back through a Future.
+
+Also holds the streaming readers for bulk request bodies: a JSON array or
+NDJSON is decoded item by item from the request stream, so a 50k-message
+upload is validated and queued in chunks while it is still arriving.
+"""
+import json
+import logging
+import queue
+import threading
+from concurrent.futures import Future
+
+log = logging.getLogger(__name__)
+
+MAX_ROWS = 5000 # Rows handed to the handler at once
+READ_SIZE = 64 * 1024
+
+
+class IngestBatch:
+    def __init__(self, rows, options):
+        self.rows = rows
+        self.options = options # Passed through to the handler (device, initial, ...)
+        self.future = Future()
+
+
+class IngestQueue:
+    def __init__(self, handler, max_rows=MAX_ROWS):
+        """handler(batches) stores a list of IngestBatch and returns one list
+        of per-row results for each of them"""
+        self.handler = handler
+        self.max_rows = max_rows
+        self.queue = queue.Queue()
+        self.metrics = {'batches': 0, 'rows': 0, 'flushes': 0, 'max_coalesced': 0}
+        self.thread = threading.Thread(target=self._run, name='ingest', daemon=True)
+        self.thread.start()
+
+    def submit(self, rows, **options):
+        """Queues rows, returns a Future with their per-row results"""
+        batch = IngestBatch(list(rows), options)
+        self.queue.put(batch)
+        return batch.future
+
+    def ingest(self, rows, timeout=None, **options):
+        """submit() and wait"""
+        return self.submit(rows, **options).result(timeout)
+
+    def _run(self):
+        while True:
+            batch = self.queue.get()
+            if batch is None: return
+            batches, total = [batch], len(batch.rows)
+            # Whatever else is already waiting goes into the same transaction
+            while total < self.max_rows:
+                try:
+                    extra = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if extra is None:
+                    self.queue.put(None)
+                    break
+                batches.append(extra)
+                total += len(extra.rows)
+            try:
+                results = self.handler(batches)
+                for b, result in zip(batches, results):
+                    b.future.set_result(result)
+            except Exception as e:
+                if len(batches) == 1:
+                    log.error("Ingest Error: %s", e)
+                    batch.future.set_exception(e)
+                else:
+                    # One bad batch must not fail the others it was coalesced with
+                    log.warning("Ingest Error: %s, retrying the %d batches one by one", e, len(batches))
+                    for b in batches:
+                        self._run_one(b)
+            self.metrics['batches'] += len(batches)
+            self.metrics['rows'] += total
+            self.metrics['flushes'] += 1
+            self.metrics['max_coalesced'] = max(self.metrics['max_coalesced'], len(batches))
+
+    def _run_one(self, batch):
+        try:
+            batch.future.set_result(self.handler([batch])[0])
+        except Exception as e:
+            log.error("Ingest Error: %s", e)
+            batch.future.set_exception(e)
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join(timeout=5)
+
+
+def iter_json_items(stream, read_size=READ_SIZE):
+    """Yields the elements of a top-level JSON array (or a single object)
+    from a binary stream without loading the whole body"""
+    decoder = json.JSONDecoder()
+    buf = ''
+    pos = 0
+    raw = b''
+    eof = False
+
+    def fill():
+        nonlocal buf, pos, raw, eof
+        chunk = stream.read(read_size)
+        if not chunk:
+            eof = True
+            return False
+        raw += chunk
+        # Keep a partial UTF-8 sequence for the next read
+        try:
+            text = raw.decode('utf-8')
+            raw = b''
+        except UnicodeDecodeError as e:
+            if e.start < len(raw) - 3: raise ValueError("Body is not valid UTF-8")
+            text, raw = raw[:e.start].decode('utf-8'), raw[e.start:]
+        buf = buf[pos:] + text
+        pos = 0
+        return True
+
+    def skip_ws():
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in ' \t\r\n':
+                pos += 1
+            if pos < len(buf) or not fill():
+                return
+
+    skip_ws()
+    if pos >= len(buf):
+        return
+    if buf[pos] == '{':
+        # A single object instead of an array
+        while not eof: fill()
+        yield decoder.raw_decode(buf, pos)[0]
+        return
+    if buf[pos] != '[':
+        raise ValueError("Expected a JSON array")
+    pos += 1
+    first = True
+    while True:
+        skip_ws()
+        if pos >= len(buf):
+            raise ValueError("Unterminated JSON array")
+        if buf[pos] == ']' and first:
+            return
+        first = False
+        while True:
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+            except ValueError:
+                if not fill():
+                    raise ValueError("Malformed JSON item")
+                continue
+            # A number cut at the chunk edge ("12" of "125", "1" of "1.5") decodes
+            # fine; only trust a scalar once a delimiter follows it
+            if not isinstance(item, (dict, list, str)) \
+                    and buf[end:end + 1] not in (' ', '\t', '\r', '\n', ',', ']') and fill():
+                continue
+            break
+        pos = end
+        yield item
+        skip_ws()
+        if pos < len(buf) and buf[pos] == ',':
+            pos += 1
+        elif pos < len(buf) and buf[pos] == ']':
+            return
+        else:
+            raise ValueError("Expected ',' or ']' in JSON array")
+
+
+def iter_ndjson_items(stream):
+    """One JSON value per line"""
+    for line in stream:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
@@ -0,0 +1,216 @@
+"""Desktop notifications for new messages.
+
+Everything runs on one worker thread, so a flood of messages never turns
+into a flood of threads, toasts or sound processes:
+
+- messages are collected until none has arrived for DEBOUNCE seconds (at
+  most MAX_DELAY after the first one), then shown as a single toast,
+  "New SMS from X" or "5 new messages from X, Y"
+- a sender gets at most SENDER_LIMIT toasts per SENDER_WINDOW seconds;
+  past that its messages are only counted (they are still in the inbox)
+- during quiet hours (config.json `quiet_hours`, e.g. {"start": "23:00",
+  "end": "08:00"}) nothing is shown or played
+- the ringtone is opened once and replayed, instead of a PowerShell
+  process per sound
+"""
+import ctypes
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+log = logging.getLogger(__name__)
+
+DEBOUNCE = 1.5 # Seconds of silence that end a burst
+MAX_DELAY = 5.0 # A steady stream is still shown this often
+SENDER_LIMIT = 3 # Toasts per sender...
+SENDER_WINDOW = 60.0 # ...per this many seconds
+TITLE_SENDERS = 2 # Senders named in a coalesced toast's title
+PREVIEW_LENGTH = 50
+
+
+class SoundPlayer:
+    """Plays the ringtone through one MCI device (winmm), opened on first
+    use and rewound for every play. Falls back to the system beep."""
+
+    ALIAS = 'sms_ringtone'
+
+    def __init__(self, path):
+        self.path = path
+        self.opened = False
+        try:
+            self.winmm = ctypes.windll.winmm
+        except AttributeError: # Not Windows
+            self.winmm = None
+
+    def _mci(self, command):
+        return self.winmm.mciSendStringW(command, None, 0, None)
+
+    def play(self):
+        if self.winmm is not None and os.path.exists(self.path):
+            if not self.opened:
+                self.opened = self._mci(f'open "{self.path}" type mpegvideo alias {self.ALIAS}') == 0
+            if self.opened and self._mci(f'play {self.ALIAS} from 0') == 0:
+                return
+            log.debug("Ringtone playback failed, using default beep.")
+        try:
+            import winsound
+            winsound.MessageBeep()
+        except (ImportError, RuntimeError):
+            pass
+
+    def close(self):
+        if self.opened:
+            self._mci(f'close {self.ALIAS}')
+            self.opened = False
+
+
+def _minutes(value):
+    hours, _, minutes = str(value).partition(':')
+    return int(hours) * 60 + int(minutes or 0)
+
+
+def in_quiet_hours(quiet_hours, now=None):
+    """True if now falls in {"start": "HH:MM", "end": "HH:MM"} (may wrap midnight)"""
+    if not quiet_hours:
+        return False
+    try:
+        start, end = _minutes(quiet_hours['start']), _minutes(quiet_hours['end'])
+    except (KeyError, TypeError, ValueError):
+        log.warning("Ignoring invalid quiet_hours: %r", quiet_hours)
+        return False
+    now = now or datetime.now()
+    current = now.hour * 60 + now.minute
+    if start <= end:
+        return start <= current < end
+    return current >= start or current < end
+
+
+def summarize(messages):
+    """(title, body) of one toast for a list of messages, newest last"""
+    latest = messages[-1]
+    if len(messages) == 1:
+        return f"New SMS from {latest['sender']}", latest['message'][:PREVIEW_LENGTH]
+    senders = list(dict.fromkeys(m['sender'] for m in reversed(messages)))
+    names = ', '.join(senders[:TITLE_SENDERS])
+    if len(senders) > TITLE_SENDERS:
+        names += f" +{len(senders) - TITLE_SENDERS}"
+    body = latest['message'][:PREVIEW_LENGTH]
+    if len(senders) > 1:
+        body = f"{latest['sender']}: {body}"
+    return f"{len(messages)} new messages from {names}", body
+
+
+class NotificationDispatcher:
+    """show(title, message) and the sound player are only called from the
+    worker thread; notify() just queues and returns."""
+
+    def __init__(self, show, player, get_config):
+        self.show = show
+        self.player = player
+        self.get_config = get_config
+        self.queue = queue.SimpleQueue()
+        self.sent = {} # sender -> deque of recent toast times
+        self.metrics = {'received': 0, 'shown': 0, 'rate_limited': 0, 'quiet': 0}
+        self.thread = threading.Thread(target=self._run, name='notifier', daemon=True)
+        self.thread.start()
+
+    def notify(self, messages):
+        """Queues new messages (dicts with sender and message)"""
+        for sms in messages:
+            self.queue.put(('sms', sms))
+
+    def notify_now(self, title, message):
+        """A toast and sound right away, e.g. the settings' test button"""
+        self.queue.put(('direct', (title, message)))
+
+    def close(self, timeout=2):
+        self.queue.put(None)
+        self.thread.join(timeout)
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            if item[0] == 'direct':
+                self._deliver(*item[1], self.get_config())
+                continue
+            burst, closed = self._collect(item[1])
+            self._dispatch(burst)
+            if closed:
+                break
+        self.player.close()
+
+    def _collect(self, first):
+        """The burst that starts with first; (messages, close requested)"""
+        burst, deferred = [first], []
+        deadline = time.monotonic() + MAX_DELAY
+        closed = False
+        while True:
+            wait = min(DEBOUNCE, deadline - time.monotonic())
+            if wait <= 0:
+                break
+            try:
+                item = self.queue.get(timeout=wait)
+            except queue.Empty:
+                break
+            if item is None:
+                closed = True
+                break
+            if item[0] == 'direct':
+                deferred.append(item) # Shown after this burst
+                continue
+            burst.append(item[1])
+        for item in deferred:
+            self.queue.put(item)
+        return burst, closed
+
+    def _dispatch(self, burst):
+        self.metrics['received'] += len(burst)
+        config = self.get_config()
+        if in_quiet_hours(config.get('quiet_hours')):
+            self.metrics['quiet'] += len(burst)
+            log.debug("Quiet hours, %d messages not announced", len(burst))
+            return
+        now = time.monotonic()
+        allowed, limited = [], 0
+        counted = set()
+        for sms in burst:
+            sender = sms['sender']
+            times = self.sent.setdefault(sender, deque())
+            if sender not in counted:
+                while times and now - times[0] >= SENDER_WINDOW:
+                    times.popleft()
+                if len(times) < SENDER_LIMIT:
+                    times.append(now)
+                    counted.add(sender)
+            if sender in counted:
+                allowed.append(sms)
+            else:
+                limited += 1
+        self.sent = {s: t for s, t in self.sent.items() if t}
+        if limited:
+            self.metrics['rate_limited'] += limited
+            log.debug("Rate limited %d notifications", limited)
+        if allowed:
+            self._deliver(*summarize(allowed), config)
+
+    def _deliver(self, title, message, config):
+        if config.get('sound_enabled', True):
+            try:
+                self.player.play()
+            except Exception as e:
+                log.warning("Sound Error: %s", e)
+        if config.get('notification_enabled', True):
+            log.debug("Triggering Notification: %s", title)
+            try:
+                self.show(title, message)
+                self.metrics['shown'] += 1
+            except Exception as e:
+                log.warning("Notification Error: %s", e)
+        else:
+            log.debug("Notification disabled in config.")
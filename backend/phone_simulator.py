@@ -0,0 +1,174 @@
+"""Stand-in for the Android app's SmsServer, so WiFi sync can be run and
+tested on a desktop without a phone.
+
+    python phone_simulator.py --port 8080 --seed 500 --rate 0.2
+
+Serves the same routes as SmsService.kt (`/sms` legacy and delta modes,
+`/sms/wait` long-poll) plus `POST /inject` with {"address", "body"} to
+simulate an incoming SMS. Connect to it from the app as `127.0.0.1:<port>`.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+DEFAULT_PAGE_SIZE = 200
+MAX_PAGE_SIZE = 1000
+LONG_POLL_MAX_SECONDS = 55
+
+
+class PhoneSimulator:
+    def __init__(self, host='127.0.0.1', port=8080):
+        self.host = host
+        self.port = port
+        self.inbox = [] # Rows in _id order, like content://sms/inbox
+        self.cond = threading.Condition()
+        self.server = None
+        self.thread = None
+        self.requests_served = 0
+        self.battery = {'level': 80, 'charging': False}
+
+    # --- INBOX ---
+
+    def add_sms(self, address, body, date=None):
+        with self.cond:
+            row = {
+                '_id': len(self.inbox) + 1,
+                'address': address,
+                'body': body,
+                'date': date if date is not None else int(time.time() * 1000)
+            }
+            self.inbox.append(row)
+            # What SmsReceiver/ContentObserver do on the phone
+            self.cond.notify_all()
+            return row
+
+    def seed(self, count):
+        now = int(time.time() * 1000)
+        for i in range(count):
+            self.add_sms(f"+90555{random.randint(0, 9999999):07d}", f"Seed message {i}", now - (count - i) * 60000)
+
+    def latest(self, limit=50):
+        with self.cond:
+            return sorted(self.inbox, key=lambda r: r['date'], reverse=True)[:limit]
+
+    def since(self, since, since_id, limit):
+        """Mirrors SmsService.readSmsSince"""
+        with self.cond:
+            if since_id is None:
+                rows = [r for r in self.inbox if r['date'] > since]
+            else:
+                rows = [r for r in self.inbox if r['date'] > since or (r['date'] == since and r['_id'] > since_id)]
+            rows.sort(key=lambda r: (r['date'], r['_id']))
+        page = rows[:limit]
+        last = page[-1] if page else None
+        return {
+            'messages': page,
+            'next_since': last['date'] if last else since,
+            'next_since_id': last['_id'] if last else (since_id or 0),
+            'has_more': len(rows) > limit,
+            'battery': dict(self.battery)
+        }
+
+    def wait(self, since, since_id, limit, timeout):
+        deadline = time.monotonic() + timeout
+        page = self.since(since, since_id, limit)
+        while not page['messages']:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0: break
+            with self.cond:
+                self.cond.wait(remaining)
+            page = self.since(since, since_id, limit)
+        return page
+
+    # --- HTTP ---
+
+    def start(self):
+        simulator = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1' # keep-alive, like NanoHTTPD
+            disable_nagle_algorithm = True # headers and body go out as separate writes
+
+            def log_message(self, fmt, *args):
+                pass
+
+            def _send(self, status, payload, content_type='application/json'):
+                body = payload if isinstance(payload, bytes) else json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                try:
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass # Client gave up on a long-poll
+
+            def do_GET(self):
+                simulator.requests_served += 1
+                url = urlparse(self.path)
+                params = {k: v[0] for k, v in parse_qs(url.query).items()}
+                try:
+                    since = int(params['since']) if 'since' in params else None
+                    since_id = int(params['since_id']) if 'since_id' in params else None
+                    limit = max(1, min(int(params.get('limit', DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE))
+                    timeout = max(1, min(int(params.get('timeout', 25)), LONG_POLL_MAX_SECONDS))
+                except ValueError:
+                    return self._send(400, b'Bad Request', 'text/plain')
+
+                if url.path == '/sms':
+                    if since is None:
+                        return self._send(200, simulator.latest())
+                    return self._send(200, simulator.since(since, since_id, limit))
+                if url.path == '/sms/wait':
+                    return self._send(200, simulator.wait(since or 0, since_id, limit, timeout))
+                if url.path == '/':
+                    return self._send(200, b'<html><body><h1>SMS Server Simulator</h1></body></html>', 'text/html')
+                self._send(404, b'Not Found', 'text/plain')
+
+            def do_POST(self):
+                if urlparse(self.path).path != '/inject':
+                    return self._send(404, b'Not Found', 'text/plain')
+                length = int(self.headers.get('Content-Length') or 0)
+                data = json.loads(self.rfile.read(length) or b'{}')
+                row = simulator.add_sms(data.get('address', 'Unknown'), data.get('body', ''), data.get('date'))
+                self._send(201, row)
+
+        self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fake SmsServer for WiFi sync testing')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--seed', type=int, default=0, help='messages already in the inbox')
+    parser.add_argument('--rate', type=float, default=0.0, help='new messages per second')
+    args = parser.parse_args()
+
+    sim = PhoneSimulator(args.host, args.port).start()
+    sim.seed(args.seed)
+    print(f"Phone simulator on http://{args.host}:{sim.port} ({args.seed} seeded messages)")
+    try:
+        while True:
+            if args.rate > 0:
+                time.sleep(random.expovariate(args.rate))
+                row = sim.add_sms(f"+90555{random.randint(0, 99):07d}", f"Doğrulama kodunuz: {random.randint(100000, 999999)}")
+                print(f"New SMS #{row['_id']} from {row['address']}")
+            else:
+                time.sleep(1)
+    except KeyboardInterrupt:
+        sim.stop()
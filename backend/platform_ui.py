@@ -0,0 +1,145 @@
+"""What the core (app.py) needs from the desktop: toasts and the window.
+
+HeadlessUI is the default and only logs. DesktopUI (pywebview window,
+pystray tray icon, win11toast) imports those libraries when it starts, so
+app.py imports fast and works on a machine that doesn't have them.
+"""
+import importlib.util
+import logging
+import os
+import threading
+
+import startup_report
+
+log = logging.getLogger(__name__)
+
+DESKTOP_MODULES = ('webview', 'pystray', 'PIL')
+
+
+def desktop_available():
+    """True if the window and tray libraries are installed (checked without importing them)"""
+    return all(importlib.util.find_spec(name) is not None for name in DESKTOP_MODULES)
+
+
+class HeadlessUI:
+    name = 'headless'
+
+    def notify(self, title, message):
+        log.info("Notification: %s - %s", title, message)
+
+    def status(self):
+        return {'mode': self.name}
+
+
+class DesktopUI(HeadlessUI):
+    """Tray icon plus a pywebview window on `url`. on_visible(bool) is told
+    when the window is shown or hidden, shutdown() runs on tray Exit."""
+
+    name = 'desktop'
+
+    def __init__(self, url, icon_path, on_visible, shutdown):
+        self.url = url
+        self.icon_path = icon_path
+        self.on_visible = on_visible
+        self.shutdown = shutdown
+        self.window = None
+        self.tray_icon = None
+        self.toast = None # win11toast.toast, imported on the first fallback toast
+
+    # --- NOTIFICATION ---
+
+    def notify(self, title, message):
+        # 1. Try Tray Notification first (Most reliable for tray apps)
+        if self.tray_icon:
+            try:
+                log.debug("Attempting Tray Notification...")
+                self.tray_icon.notify(message, title)
+                return
+            except Exception as e:
+                log.warning("Tray notification failed: %s", e)
+        else:
+            log.debug("Tray icon not initialized, skipping tray notify.")
+
+        # 2. Fallback to win11toast; it waits for the toast, and whatever
+        # arrives meanwhile is coalesced into the next one
+        log.debug("Attempting Win11Toast Notification...")
+        if self.toast is None:
+            with startup_report.phase('import win11toast'):
+                from win11toast import toast
+            self.toast = toast
+        icon_abs = os.path.abspath(self.icon_path) if os.path.exists(self.icon_path) else None
+        self.toast(
+            title,
+            message,
+            icon=icon_abs,
+            duration='short',
+            app_id='SMS Sync',
+            on_click=self.restore_window
+        )
+        log.debug("Win11Toast sent.")
+
+    # --- TRAY & WINDOW MANAGEMENT ---
+
+    def restore_window(self, *args):
+        self.on_visible(True)
+        if self.window:
+            if self.window.minimized:
+                self.window.restore()
+            self.window.show()
+
+    def _setup_tray(self):
+        try:
+            with startup_report.phase('import pystray'):
+                import pystray
+                from PIL import Image
+            if os.path.exists(self.icon_path):
+                image = Image.open(self.icon_path)
+            else:
+                # Fallback (create a colored square)
+                image = Image.new('RGB', (64, 64), color = (73, 109, 137))
+
+            def on_exit(icon, item):
+                icon.stop()
+                self.shutdown() # os._exit skips atexit handlers
+                if self.window: self.window.destroy()
+                os._exit(0) # Force kill
+
+            def on_open(icon, item):
+                self.restore_window()
+
+            menu = pystray.Menu(
+                pystray.MenuItem('Open', on_open, default=True),
+                pystray.MenuItem('Exit', on_exit)
+            )
+
+            self.tray_icon = pystray.Icon("SMS Sync", image, "SMS Sync", menu)
+            startup_report.milestone('tray ready')
+            self.tray_icon.run()
+        except Exception as e:
+            log.error("Tray Error: %s", e)
+
+    def _on_closing(self):
+        # This is called when user clicks X
+        # We want to minimize to tray instead of closing
+        log.info("Minimizing to tray...")
+        self.window.hide()
+        self.on_visible(False) # Nobody is looking, let idle phones poll slowly
+        return False # returning False cancels the close event in pywebview
+
+    def run(self):
+        """Blocks in the GUI loop; call from the main thread (pywebview needs it)"""
+        # pystray run() blocks too, so the tray gets its own thread
+        threading.Thread(target=self._setup_tray, name='tray', daemon=True).start()
+
+        with startup_report.phase('import webview'):
+            import webview
+        self.window = webview.create_window('SMS Sync', self.url, width=1200, height=800)
+        self.window.events.closing += self._on_closing
+        self.window.events.minimized += lambda: self.on_visible(False)
+        self.window.events.restored += lambda: self.on_visible(True)
+        self.window.events.shown += lambda: self.on_visible(True)
+        startup_report.milestone('window created')
+        webview.start(debug=True)
+
+    def status(self):
+        return {'mode': self.name, 'tray': self.tray_icon is not None, 'window': self.window is not None}
@@ -0,0 +1,135 @@
+"""Adaptive poll intervals, shared by every syncer.
+
+Each device starts at its syncer's base interval (adb_poll_interval, or the
+WiFi reconciler's 2 s / 30 s) and moves from there:
+
+- new messages, or one in the last BURST_WINDOW seconds: poll at the
+  configured minimum so a burst (OTP, a conversation) is picked up almost
+  in real time (not for a WiFi phone whose push channel already is)
+- quiet polls: the interval grows by IDLE_GROWTH per poll, up to 2x base
+  while the window (or any browser tab with the UI) is shown and up to the
+  configured maximum while all of them are hidden
+- a device that gets more than BUSY_RATE messages a minute on average
+  stays at its base interval
+- errors: full-jitter exponential backoff between base and the maximum
+- phone on battery below LOW_BATTERY percent: idle intervals are doubled
+
+Bounds come from config.json (poll_min_interval / poll_max_interval).
+"""
+import math
+import random
+import threading
+import time
+
+from sync_engine import backoff_delay
+
+DEFAULT_MIN_INTERVAL = 1.0
+DEFAULT_MAX_INTERVAL = 60.0
+BURST_WINDOW = 30.0 # Seconds after a message during which we poll at the minimum
+IDLE_GROWTH = 1.5
+VISIBLE_STRETCH = 2.0 # Idle ceiling while the window is shown, times base
+RATE_WINDOW = 300.0 # Seconds the arrival-rate average looks back
+BUSY_RATE = 1.0 # Messages per minute
+LOW_BATTERY = 20
+LOW_BATTERY_FACTOR = 2.0
+JITTER = 0.1 # +-10% so devices with the same interval drift apart
+CLIENT_TTL = 90.0 # Seconds a browser tab's visibility report counts for
+
+class _Activity:
+    def __init__(self, base):
+        self.interval = base
+        self.rate = 0.0 # Messages per minute, exponentially averaged
+        self.last_arrival = None
+        self.last_update = time.monotonic()
+        self.mode = 'base'
+
+class PollScheduler:
+    def __init__(self, min_interval=DEFAULT_MIN_INTERVAL, max_interval=DEFAULT_MAX_INTERVAL):
+        self.min_interval = DEFAULT_MIN_INTERVAL
+        self.max_interval = DEFAULT_MAX_INTERVAL
+        self.configure(min_interval, max_interval)
+        self.visible = True
+        self.clients = {} # UI client id -> (visible, expiry or None)
+        self.activity = {} # device -> _Activity
+        self.lock = threading.Lock()
+
+    def configure(self, min_interval=None, max_interval=None):
+        """Applies the config.json bounds; bad values keep the current ones"""
+        try:
+            if min_interval is not None: self.min_interval = max(0.2, float(min_interval))
+            if max_interval is not None: self.max_interval = float(max_interval)
+        except (TypeError, ValueError):
+            pass
+        self.max_interval = max(self.max_interval, self.min_interval)
+
+    def set_visible(self, visible, client='window', ttl=None):
+        """A UI client (the desktop window, a browser tab) was shown or
+        hidden. The app counts as visible while any client is, or while none
+        reports; a client with a ttl is forgotten unless it reports again
+        within ttl seconds. Returns True if the app's visibility changed."""
+        now = time.monotonic()
+        with self.lock:
+            before = self._visible(now)
+            self.clients[client] = (bool(visible), now + ttl if ttl else None)
+            changed = self._visible(now) != before
+            if changed and self.visible:
+                # Coming back to the window: don't wait out a long idle interval
+                for activity in self.activity.values():
+                    activity.interval = 0.0
+        return changed
+
+    def _visible(self, now):
+        """Updates self.visible from the clients that haven't expired (lock held)"""
+        if any(expiry is not None and expiry <= now for _, expiry in self.clients.values()):
+            self.clients = {c: v for c, v in self.clients.items() if v[1] is None or v[1] > now}
+        self.visible = not self.clients or any(visible for visible, _ in self.clients.values())
+        return self.visible
+
+    def forget(self, device):
+        with self.lock:
+            self.activity.pop(device, None)
+
+    def next_delay(self, device, base, new_messages=0, error_count=0, battery=None, push=False):
+        """Seconds until the device's next poll. battery is the phone's
+        {'level': percent, 'charging': bool} or None; push means new messages
+        arrive on their own and polling only reconciles."""
+        now = time.monotonic()
+        with self.lock:
+            a = self.activity.get(device)
+            if a is None:
+                a = self.activity[device] = _Activity(base)
+
+            # Arrival rate, averaged over roughly RATE_WINDOW seconds
+            dt = max(now - a.last_update, 1e-3)
+            alpha = 1 - math.exp(-dt / RATE_WINDOW)
+            a.rate += alpha * (new_messages * 60.0 / dt - a.rate)
+            a.last_update = now
+            if new_messages:
+                a.last_arrival = now
+
+            low_battery = bool(battery) and not battery.get('charging') \
+                and (battery.get('level') or 100) <= LOW_BATTERY
+
+            if error_count:
+                a.mode = 'backoff'
+                delay = backoff_delay(error_count, base=max(base, self.min_interval), cap=self.max_interval)
+            elif not push and a.last_arrival is not None and now - a.last_arrival < BURST_WINDOW:
+                a.mode = 'burst'
+                a.interval = base
+                delay = self.min_interval
+            else:
+                ceiling = self.max_interval if not self._visible(now) else min(self.max_interval, base * VISIBLE_STRETCH)
+                if a.rate > BUSY_RATE:
+                    ceiling = min(ceiling, base)
+                a.interval = min(max(ceiling, base), max(base, a.interval * IDLE_GROWTH))
+                a.mode = 'idle' if a.interval > base else 'base'
+                delay = a.interval
+                if low_battery: delay *= LOW_BATTERY_FACTOR
+
+            delay = min(max(delay, self.min_interval), self.max_interval)
+        return delay * random.uniform(1 - JITTER, 1 + JITTER)
+
+    def describe(self, device):
+        a = self.activity.get(device)
+        if a is None: return {}
+        return {'mode': a.mode, 'rate_per_min': round(a.rate, 2)}
@@ -0,0 +1,174 @@
+import math
+import re
+import unicodedata
+from bisect import bisect_left, insort
+
+from sms_store import normalize_sender
+
+# Turkish dotted/dotless i both fold to plain i, so "ISTANBUL", "İstanbul"
+# and "istanbul" all meet. The Turkish letters are mapped directly, anything
+# else that is still not ASCII goes through Unicode decomposition.
+_TR_FOLD = str.maketrans({'İ': 'i', 'I': 'i', 'ı': 'i', 'ç': 'c', 'Ç': 'c', 'ğ': 'g', 'Ğ': 'g',
+                          'ö': 'o', 'Ö': 'o', 'ş': 's', 'Ş': 's', 'ü': 'u', 'Ü': 'u',
+                          'â': 'a', 'Â': 'a', 'î': 'i', 'Î': 'i', 'û': 'u', 'Û': 'u'})
+_TOKEN_RE = re.compile(r'\w+')
+MIN_PREFIX = 2 # Shorter query terms only match whole words
+MAX_EXPANSIONS = 500 # Words one prefix may expand to
+PREFIX_WEIGHT = 0.7 # A prefix hit counts less than the whole word
+SENDER_BOOST = 1.5
+
+
+def fold(text):
+    """Lowercase, Turkish-aware, without diacritics: "ŞEKER Çığ" -> "seker cig" """
+    text = (text or '').translate(_TR_FOLD).lower()
+    if text.isascii(): return text
+    text = unicodedata.normalize('NFKD', text)
+    return ''.join(c for c in text if not unicodedata.combining(c))
+
+
+_fold_cache = {} # Raw word -> folded; SMS vocabulary repeats a lot
+FOLD_CACHE_SIZE = 200000
+
+
+def _fold_word(word):
+    folded = _fold_cache.get(word)
+    if folded is None:
+        if len(_fold_cache) >= FOLD_CACHE_SIZE: _fold_cache.clear()
+        folded = _fold_cache[word] = fold(word)
+    return folded
+
+
+def tokenize(text):
+    get = _fold_cache.get
+    return [get(word) or _fold_word(word) for word in _TOKEN_RE.findall(text or '')]
+
+
+def _sender_terms(sender):
+    terms = set(tokenize(sender))
+    digits = normalize_sender(sender)
+    if digits: terms.add(digits) # "+90 555 123" is also found as 90555123
+    return terms
+
+
+def _document_terms(sender, message, sender_terms=None):
+    terms = set(tokenize(message))
+    terms.update(sender_terms if sender_terms is not None else _sender_terms(sender))
+    return terms
+
+
+class SearchIndex:
+    """In-memory inverted index over sender and body.
+
+    Maintained by AppState next to its other indexes, so every insert and
+    delete updates it in place. Words are kept in a sorted list as well,
+    which makes a prefix ("4821" of an OTP "482193") a bisect away.
+    Not thread-safe on its own; AppState calls it under its lock.
+    """
+
+    def __init__(self):
+        self.postings = {} # folded word -> set of sms ids
+        self.words = [] # Sorted keys of postings
+        self.documents = 0
+
+    def add(self, sms_id, sender, message):
+        new_words = []
+        for term in _document_terms(sender, message):
+            ids = self.postings.get(term)
+            if ids is None:
+                ids = self.postings[term] = set()
+                new_words.append(term)
+            ids.add(sms_id)
+        self.documents += 1
+        self._add_words(new_words)
+
+    def add_many(self, rows):
+        """add() for a batch of (sms_id, sender, message)"""
+        new_words = []
+        senders = {} # Most of a batch comes from a few senders
+        for sms_id, sender, message in rows:
+            sender_terms = senders.get(sender)
+            if sender_terms is None:
+                sender_terms = senders[sender] = _sender_terms(sender)
+            for term in _document_terms(sender, message, sender_terms):
+                ids = self.postings.get(term)
+                if ids is None:
+                    ids = self.postings[term] = set()
+                    new_words.append(term)
+                ids.add(sms_id)
+            self.documents += 1
+        self._add_words(new_words)
+
+    def _add_words(self, new_words):
+        if len(new_words) * 16 >= len(self.words):
+            self.words.extend(new_words)
+            self.words.sort()
+        else:
+            for word in new_words: insort(self.words, word)
+
+    def remove(self, sms_id, sender, message):
+        for term in _document_terms(sender, message):
+            ids = self.postings.get(term)
+            if ids is None: continue
+            ids.discard(sms_id)
+            if not ids:
+                del self.postings[term]
+                i = bisect_left(self.words, term)
+                if i < len(self.words) and self.words[i] == term:
+                    del self.words[i]
+        self.documents = max(0, self.documents - 1)
+
+    def clear(self):
+        self.postings.clear()
+        self.words = []
+        self.documents = 0
+
+    def _expand(self, term):
+        """Indexed words the query term matches, with their weight"""
+        matches = []
+        if term in self.postings:
+            matches.append((term, 1.0))
+        if len(term) >= MIN_PREFIX:
+            i = bisect_left(self.words, term)
+            while i < len(self.words) and len(matches) < MAX_EXPANSIONS and self.words[i].startswith(term):
+                if self.words[i] != term:
+                    matches.append((self.words[i], PREFIX_WEIGHT))
+                i += 1
+        return matches
+
+    def search(self, query):
+        """Returns {sms_id: score} for messages matching every query term
+        (as a whole word or a word prefix). Rarer words score higher."""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms: return {}
+
+        expanded = []
+        for term in terms:
+            matches = self._expand(term)
+            if not matches: return {}
+            expanded.append(matches)
+
+        # Intersect starting from the most selective term
+        candidates = None
+        for matches in sorted(expanded, key=lambda m: sum(len(self.postings[w]) for w, _ in m)):
+            ids = set().union(*(self.postings[w] for w, _ in matches))
+            candidates = ids if candidates is None else candidates & ids
+            if not candidates: return {}
+
+        scores = dict.fromkeys(candidates, 0.0)
+        n = max(self.documents, 1)
+        for matches in expanded:
+            best = {}
+            for word, weight in matches:
+                ids = self.postings[word]
+                score = weight * math.log(1 + n / len(ids))
+                for sms_id in ids & candidates:
+                    if score > best.get(sms_id, 0.0):
+                        best[sms_id] = score
+            for sms_id, score in best.items():
+                scores[sms_id] += score
+        return scores
+
+    def sender_matches(self, query, sender):
+        """True if every query term is in the sender, for ranking"""
+        folded = fold(sender)
+        return all(term in folded for term in tokenize(query))
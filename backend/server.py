@@ -0,0 +1,82 @@
+"""Serves the API on waitress, a production WSGI server.
+
+Headless entry point (no window, no tray), e.g. a box that syncs the
+phones while several desktops read from it in a browser:
+
+    python server.py --host 0.0.0.0 --port 5001 --threads 16
+
+It is one process with a pool of threads: the store, the syncers and the
+event bus live in memory, and a second process would sync the phones on
+its own. Every open /api/events stream holds a thread, so keep --threads
+above the number of readers. The API has no authentication, only bind to
+a network you trust.
+
+SIGINT/SIGTERM close the listening socket, end the event streams, give
+running requests a moment, then stop the syncers and flush the storage.
+"""
+import argparse
+import logging
+import signal
+
+log = logging.getLogger(__name__)
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 5001
+DEFAULT_THREADS = 16
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="SMS Sync server")
+    parser.add_argument('--headless', action='store_true',
+                        help="no window or tray, just the API and the syncers")
+    parser.add_argument('--host', default=DEFAULT_HOST,
+                        help="bind address, 0.0.0.0 for every interface (default %(default)s)")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--threads', type=int, default=DEFAULT_THREADS,
+                        help="request worker threads (default %(default)s)")
+    return parser.parse_args(argv)
+
+
+def serve(app, host=DEFAULT_HOST, port=DEFAULT_PORT, threads=DEFAULT_THREADS,
+          stopping=None, stopped=None, signals=True):
+    """Blocks serving the Flask app. stopping() runs as soon as a stop is
+    requested (end long-lived responses), stopped() once requests are done.
+    signals=False when not on the main thread (the desktop app)."""
+    try:
+        from waitress.server import create_server
+    except ImportError:
+        log.warning("waitress is not installed, using the Flask development server")
+        app.run(host=host, port=port, debug=False, use_reloader=False, threaded=True)
+        return
+
+    server = create_server(app, host=host, port=port, threads=max(1, threads), ident='SMS Sync')
+    log.info("Serving on http://%s:%s with %d threads", host, port, max(1, threads))
+
+    if signals:
+        def stop(signum, frame):
+            log.info("Signal %s, shutting down...", signum)
+            if stopping: stopping()
+            raise SystemExit # Ends the accept loop; waitress then drains its workers
+
+        signal.signal(signal.SIGINT, stop)
+        signal.signal(signal.SIGTERM, stop)
+        if hasattr(signal, 'SIGBREAK'): # Ctrl+Break on Windows
+            signal.signal(signal.SIGBREAK, stop)
+
+    try:
+        server.run()
+    finally:
+        server.close()
+        if stopped: stopped()
+        log.info("Server stopped")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    import app as core
+    serve(core.app, args.host, args.port, args.threads,
+          stopping=core.event_bus.close, stopped=core.shutdown)
+
+
+if __name__ == '__main__':
+    main()
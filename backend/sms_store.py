@@ -0,0 +1,213 @@
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime
+
+log = logging.getLogger(__name__)
+
+
+def normalize_sender(s):
+    if not s: return ""
+    return re.sub(r'[^a-zA-Z0-9]', '', str(s)).lower()
+
+
+def normalize_timestamp(value):
+    """Epoch millis (Android's `date`, a number or a digit string) as the
+    local ISO string the ADB syncer stores, so every row sorts the same way
+    (indexes and cursors compare timestamps as strings). Anything else is
+    returned unchanged."""
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        return value
+    if isinstance(value, str) and not value.isdigit():
+        return value
+    millis = int(value)
+    if millis < 10 ** 11: # Not millis (1973 or earlier), leave it alone
+        return value
+    try:
+        return datetime.fromtimestamp(millis / 1000.0).isoformat()
+    except (OverflowError, OSError, ValueError):
+        return value
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sms (
+    id INTEGER PRIMARY KEY,
+    sender TEXT NOT NULL,
+    sender_norm TEXT NOT NULL,
+    message TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    read INTEGER NOT NULL DEFAULT 0,
+    device TEXT NOT NULL DEFAULT '',
+    dedupe_key TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_sms_timestamp ON sms(timestamp, id);
+CREATE INDEX IF NOT EXISTS idx_sms_sender_norm ON sms(sender_norm, timestamp, id);
+CREATE INDEX IF NOT EXISTS idx_sms_read ON sms(read, timestamp, id);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def _row_to_dict(row):
+    return {
+        'id': row[0],
+        'sender': row[1],
+        'message': row[2],
+        'timestamp': row[3],
+        'read': bool(row[4]),
+        'device': row[5]
+    }
+
+
+class SQLiteSMSStore:
+    """SQLite (WAL) storage behind AppState: read once at startup
+    (load_all, load_meta), then written to in batches by its write-behind
+    flush (apply_changes). Each thread gets its own connection; writes are
+    serialized by a lock.
+
+    Messages are plain dicts: id, sender, message, timestamp, read, device,
+    and their `dedupe_key` (see dedupe.py).
+    """
+
+    COLUMNS = "id, sender, message, timestamp, read, device"
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        # Databases created before device/dedupe_key existed
+        columns = {r[1] for r in conn.execute("PRAGMA table_info(sms)")}
+        if 'device' not in columns:
+            conn.execute("ALTER TABLE sms ADD COLUMN device TEXT NOT NULL DEFAULT ''")
+        if 'dedupe_key' not in columns:
+            conn.execute("ALTER TABLE sms ADD COLUMN dedupe_key TEXT")
+        conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_sms_dedupe ON sms(dedupe_key)")
+        conn.commit()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def load_all(self):
+        rows = self._conn().execute(f"SELECT {self.COLUMNS}, dedupe_key FROM sms")
+        return [{**_row_to_dict(r), 'dedupe_key': r[6]} for r in rows]
+
+    def load_meta(self):
+        return {k: json.loads(v) for k, v in self._conn().execute("SELECT key, value FROM meta")}
+
+    # Upsert on the id only: a row whose dedupe_key belongs to another id
+    # fails instead of REPLACE silently deleting that other message
+    UPSERT = ("INSERT INTO sms (id, sender, sender_norm, message, timestamp, read, device, dedupe_key) "
+              "VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT(id) DO UPDATE SET "
+              "sender = excluded.sender, sender_norm = excluded.sender_norm, message = excluded.message, "
+              "timestamp = excluded.timestamp, read = excluded.read, device = excluded.device, "
+              "dedupe_key = excluded.dedupe_key")
+
+    @staticmethod
+    def _upsert_values(r):
+        return (r['id'], r['sender'], normalize_sender(r['sender']), r['message'],
+                r['timestamp'], int(bool(r.get('read'))), r.get('device') or '', r.get('dedupe_key'))
+
+    def apply_changes(self, upserts=(), deletes=(), clear=False, meta_set=None, meta_delete=()):
+        """Writes everything in one transaction and returns [] or, if some
+        rows can't be stored (constraint, bad value), commits the rest and
+        returns those as [(id, error)]. Raises on database errors
+        (locked, disk full...), with nothing written."""
+        with self._write_lock:
+            conn = self._conn()
+            try:
+                with conn:
+                    self._apply(conn, deletes, clear, meta_set, meta_delete)
+                    if upserts:
+                        conn.executemany(self.UPSERT, [self._upsert_values(r) for r in upserts])
+                return []
+            except sqlite3.OperationalError:
+                raise
+            except Exception as e:
+                log.warning("Batch write failed (%s), writing the %d rows one by one", e, len(upserts))
+
+            # A failed statement only undoes itself, the transaction goes on
+            rejected = []
+            with conn:
+                self._apply(conn, deletes, clear, meta_set, meta_delete)
+                for r in upserts:
+                    try:
+                        conn.execute(self.UPSERT, self._upsert_values(r))
+                    except sqlite3.OperationalError:
+                        raise
+                    except Exception as e:
+                        rejected.append((r.get('id'), e))
+            return rejected
+
+    @staticmethod
+    def _apply(conn, deletes, clear, meta_set, meta_delete):
+        if clear:
+            conn.execute("DELETE FROM sms")
+        if deletes:
+            conn.executemany("DELETE FROM sms WHERE id = ?", [(i,) for i in deletes])
+        if meta_delete:
+            conn.executemany("DELETE FROM meta WHERE key = ?", [(k,) for k in meta_delete])
+        if meta_set:
+            conn.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                             [(k, json.dumps(v)) for k, v in meta_set.items()])
+
+    def get_meta(self, key, default=None):
+        row = self._conn().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def migrate_from_json(self, json_path):
+        """One-shot import of the legacy sms_storage.json. The file is renamed
+        afterwards so the import never runs twice."""
+        if not os.path.exists(json_path) or self.get_meta('json_migrated'):
+            return 0
+        try:
+            with open(json_path, 'r', encoding='utf-8') as f:
+                legacy = json.load(f)
+        except Exception as e:
+            log.warning("Legacy storage read error: %s", e)
+            legacy = []
+
+        imported = 0
+        with self._write_lock:
+            conn = self._conn()
+            with conn:
+                for s in legacy:
+                    sender = (s.get('sender') or '').strip()
+                    values = (sender, normalize_sender(sender), s.get('message') or '',
+                              s.get('timestamp') or '', int(bool(s.get('read'))))
+                    try:
+                        conn.execute(
+                            "INSERT INTO sms (id, sender, sender_norm, message, timestamp, read) VALUES (?, ?, ?, ?, ?, ?)",
+                            (s.get('id'),) + values)
+                    except sqlite3.IntegrityError:
+                        # Old ids were len(list)+1 and could collide after deletes
+                        conn.execute(
+                            "INSERT INTO sms (sender, sender_norm, message, timestamp, read) VALUES (?, ?, ?, ?, ?)",
+                            values)
+                    imported += 1
+                conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('json_migrated', 'true')")
+
+        try:
+            os.replace(json_path, json_path + '.migrated')
+        except OSError as e:
+            log.warning("Could not rename legacy storage: %s", e)
+        log.info("Migrated %d messages from %s", imported, json_path)
+        return imported
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
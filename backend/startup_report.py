@@ -0,0 +1,121 @@
+"""Startup timing, served at /api/debug/startup.
+
+install() is the first thing app.py does; from then until finish() every
+module imported on that thread is timed like `python -X importtime` does
+(self time excludes the modules it imported, cumulative includes them).
+phase() times the other steps (loading the store, importing the window
+libraries...), milestone() records how long after install() something
+happened.
+"""
+import importlib.abc
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+_started = time.perf_counter()
+_thread = None
+_finder = None
+_stack = [] # Child import time of each import in progress
+_imports = [] # (name, self, cumulative, depth) in completion order
+_phases = [] # (name, seconds)
+_milestones = {} # name -> seconds since install()
+
+
+class _TimedLoader(importlib.abc.Loader):
+    """Wraps a module's loader; everything but loading goes to the original"""
+
+    def __init__(self, loader, name):
+        self.loader = loader
+        self.name = name
+        self.created = 0.0
+
+    def __getattr__(self, attr):
+        return getattr(self.loader, attr)
+
+    def create_module(self, spec):
+        start = time.perf_counter()
+        try:
+            create = getattr(self.loader, 'create_module', None)
+            return create(spec) if create else None
+        finally:
+            self.created = time.perf_counter() - start # dlopen of C extensions
+
+    def exec_module(self, module):
+        _stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            self.loader.exec_module(module)
+        finally:
+            total = time.perf_counter() - start + self.created
+            children = _stack.pop()
+            if _stack: _stack[-1] += total
+            _imports.append((self.name, total - children, total, len(_stack)))
+
+
+class _TimingFinder(importlib.abc.MetaPathFinder):
+    def find_spec(self, name, path, target=None):
+        if threading.get_ident() != _thread:
+            return None
+        for finder in sys.meta_path:
+            find = getattr(finder, 'find_spec', None)
+            if finder is self or find is None:
+                continue
+            spec = find(name, path, target)
+            if spec is None:
+                continue
+            if spec.loader is not None and hasattr(spec.loader, 'exec_module'):
+                spec.loader = _TimedLoader(spec.loader, name)
+            return spec
+        return None
+
+
+def install():
+    global _finder, _thread, _started
+    if _finder: return
+    _thread = threading.get_ident()
+    _started = time.perf_counter()
+    _finder = _TimingFinder()
+    sys.meta_path.insert(0, _finder)
+
+
+def finish(name='core ready'):
+    """Stops timing imports (later, lazy ones show up under their phase)"""
+    global _finder
+    if _finder in sys.meta_path:
+        sys.meta_path.remove(_finder)
+    _finder = None
+    milestone(name)
+
+
+def milestone(name):
+    _milestones[name] = time.perf_counter() - _started
+
+
+@contextmanager
+def phase(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _phases.append((name, time.perf_counter() - start))
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 2)
+
+
+def report(top=30):
+    """The slowest `top` imports (by cumulative time), phases and milestones, in ms"""
+    slowest = sorted(_imports, key=lambda i: i[2], reverse=True)[:top]
+    return {
+        'imports': {
+            'count': len(_imports),
+            'total_ms': _ms(sum(i[1] for i in _imports)),
+            'slowest': [{'module': name, 'self_ms': _ms(own), 'cumulative_ms': _ms(total), 'depth': depth}
+                        for name, own, total, depth in slowest]
+        },
+        'phases': [{'name': name, 'ms': _ms(seconds)} for name, seconds in _phases],
+        'milestones': {name: _ms(seconds) for name, seconds in _milestones.items()},
+        'modules_loaded': len(sys.modules)
+    }
@@ -0,0 +1,81 @@
+"""The asyncio core that drives all device I/O.
+
+One event loop runs on one background thread; every device is a task on
+it (adb through asyncio subprocesses, WiFi through http_client.py), so a
+stop is a task.cancel() that takes effect at the next await instead of at
+the end of a sleep. Flask handlers and the tray run on ordinary threads and
+reach the loop through call()/submit().
+
+Storing messages is blocking work (AppState, sounds, toasts); it is handed
+to the IngestQueue (ingest.py), whose single worker coalesces batches from
+all devices into one write instead of piling onto the store's lock at once.
+"""
+import asyncio
+import logging
+import random
+import threading
+
+log = logging.getLogger(__name__)
+
+
+def backoff_delay(attempt, base=1.0, cap=60.0):
+    """Full-jitter exponential backoff: uniform in [base, min(cap, base * 2^attempt)]"""
+    upper = min(cap, base * (2 ** max(0, attempt)))
+    return random.uniform(min(base, upper), upper)
+
+
+class SyncEngine:
+    def __init__(self):
+        self.loop = None
+        self.thread = None
+        self.ready = threading.Event()
+
+    def start(self):
+        if self.thread and self.thread.is_alive():
+            return self
+        self.ready.clear()
+        self.thread = threading.Thread(target=self._run, name='sync-engine', daemon=True)
+        self.thread.start()
+        self.ready.wait()
+        return self
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.ready.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.close()
+
+    def in_loop(self):
+        return threading.current_thread() is self.thread
+
+    def submit(self, coro):
+        """Schedules a coroutine from any thread, returns a concurrent Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def call(self, coro, timeout=10):
+        """Runs a coroutine on the loop and waits for its result (Flask side)"""
+        return self.submit(coro).result(timeout)
+
+    def call_soon(self, func, *args):
+        self.loop.call_soon_threadsafe(func, *args)
+
+    def stop(self, timeout=5):
+        """Cancels every task, waits for their cleanup and stops the loop"""
+        if not self.loop or not self.loop.is_running():
+            return
+
+        async def shutdown():
+            tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        try:
+            self.call(shutdown(), timeout=timeout)
+        except Exception as e:
+            log.warning("Sync engine shutdown: %s", e)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout=timeout)
@@ -0,0 +1,56 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# The backend modules import each other by name (app.py runs from backend/)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope='session')
+def app_module():
+    """app.py imported once, with its data files in a temporary directory"""
+    with tempfile.TemporaryDirectory() as data_dir:
+        os.environ['SMS_SYNC_DATA_DIR'] = data_dir
+        import app
+        yield app
+        app.shutdown()
+
+
+@pytest.fixture
+def make_app_state(tmp_path):
+    """Opens an AppState on a store in tmp_path; call again to reopen it
+    (a restart). Everything opened is closed after the test."""
+    from app_state import AppState
+    from sms_store import SQLiteSMSStore
+    opened = []
+
+    def make(migrate=False):
+        store = SQLiteSMSStore(str(tmp_path / 'sms.db'))
+        if migrate:
+            store.migrate_from_json(str(tmp_path / 'sms_storage.json'))
+        state = AppState(store, str(tmp_path / 'config.json'), str(tmp_path / 'blocked.json'), {}, flush_delay=0.01)
+        state.load()
+        opened.append(state)
+        return state
+    yield make
+    for state in opened:
+        state.close()
+
+
+@pytest.fixture
+def app_state(make_app_state):
+    return make_app_state()
+
+
+@pytest.fixture
+def ingest(app_module, app_state, monkeypatch):
+    """app.ingest_batches: ingest(rows, **options) -> results. Runs on
+    app_state unless the test puts another one in app_module.state."""
+    from ingest import IngestBatch
+    monkeypatch.setattr(app_module, 'state', app_state)
+
+    def run(rows, **options):
+        return app_module.ingest_batches([IngestBatch(rows, options)])[0]
+    return run
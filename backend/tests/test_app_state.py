@@ -0,0 +1,86 @@
+import os
+import random
+import sqlite3
+
+import pytest
+
+from app_state import FLUSH_RETRIES
+from dedupe import dedupe_key
+from sms_store import normalize_sender
+
+
+def fill(state, count, seed=1):
+    rng = random.Random(seed)
+    rows = []
+    for n in range(count):
+        sender = rng.choice(['ANNE', 'BANKA', '+905551112233'])
+        timestamp = f'2024-01-{rng.randint(1, 28):02d}T{rng.randint(0, 23):02d}:00:00'
+        message = f'mesaj {n}'
+        rows.append({'sender': sender, 'message': message, 'timestamp': timestamp,
+                     'read': rng.random() < 0.5, 'dedupe_key': dedupe_key('', sender, timestamp, message)})
+    return state.insert_batch(rows)
+
+
+def expected(state, since_id, sender_norm=None, unread_only=False):
+    rows = [m for m in state.messages.values() if m['id'] > since_id
+            and (not sender_norm or normalize_sender(m['sender']) == sender_norm)
+            and not (unread_only and m['read'])]
+    return [m['id'] for m in sorted(rows, key=lambda m: (m['timestamp'], m['id']), reverse=True)]
+
+
+@pytest.mark.parametrize('since_id', [0, 150, 290, 300])
+def test_since_id_matches_full_scan(app_state, since_id):
+    fill(app_state, 300)
+    app_state.delete_ids(range(280, 286))
+    for sender_norm, unread_only in [(None, False), ('BANKA', False), (None, True), ('905551112233', True)]:
+        page = app_state.page(since_id=since_id, sender_norm=sender_norm, unread_only=unread_only)
+        assert [m['id'] for m in page] == expected(app_state, since_id, sender_norm, unread_only)
+        assert [m['id'] for m in app_state.page(limit=3, since_id=since_id, sender_norm=sender_norm)] \
+            == expected(app_state, since_id, sender_norm)[:3]
+
+
+def test_since_id_after_clear(app_state):
+    fill(app_state, 10)
+    app_state.clear()
+    assert app_state.page(since_id=0) == []
+    ids = [m['id'] for m in fill(app_state, 5, seed=2)]
+    assert sorted(m['id'] for m in app_state.page(since_id=ids[2])) == ids[3:]
+
+
+def stored_ids(state):
+    return sorted(sms['id'] for sms in state.store.load_all())
+
+
+def row(message, key=None, **extra):
+    return {'sender': 'ANNE', 'message': message, 'timestamp': '2024-01-01T10:00:00',
+            'read': False, 'dedupe_key': key or dedupe_key('', 'ANNE', '2024-01-01T10:00:00', message), **extra}
+
+
+def test_bad_rows_are_dropped_and_the_rest_is_stored(app_state):
+    first, = app_state.insert_batch([row('bir')])
+    app_state.flush()
+    # Same dedupe_key as a stored message, and a value SQLite can't bind
+    clash, bad, good = app_state.insert_batch([row('iki', key=app_state.messages[first['id']]['dedupe_key']),
+                                           row('uc', device={'bad': 1}), row('dort')])
+    app_state.set_meta('cursor', 5)
+    assert app_state.flush() is None
+    assert stored_ids(app_state) == [first['id'], good['id']]
+    assert app_state.store.get_meta('cursor') == 5
+    assert not app_state._dirty_ids # Not retried
+
+
+def test_database_errors_are_retried_a_limited_number_of_times(app_state, monkeypatch):
+    def locked(**changes):
+        raise sqlite3.OperationalError('database is locked')
+    monkeypatch.setattr(app_state.store, 'apply_changes', locked)
+    app_state.insert_batch([row('bir')])
+    app_state.add_blocked('SPAM')
+    for attempt in range(FLUSH_RETRIES):
+        with pytest.raises(sqlite3.OperationalError):
+            app_state.flush()
+        assert app_state._dirty_ids
+    # The JSON files don't wait for the database
+    assert os.path.exists(app_state.blocked_file)
+    with pytest.raises(sqlite3.OperationalError):
+        app_state.flush()
+    assert not app_state._dirty_ids
@@ -0,0 +1,50 @@
+import json
+
+import pytest
+
+from blocklist import Blocklist, BlocklistError
+
+
+def test_inline_flags_next_to_other_regexes():
+    blocklist = Blocklist(['re:(?i)spam', r're:^TR\d+$', 're:(?x) pro mo  # comment'])
+    assert blocklist.matches('SPAMMER')
+    assert blocklist.matches('TR123')
+    assert blocklist.matches('promo')
+    assert not blocklist.matches('Annem')
+
+
+def test_misplaced_global_flag_is_rejected():
+    assert Blocklist.validate('re:(?i)spam') == 're:(?i)spam'
+    with pytest.raises(BlocklistError):
+        Blocklist.validate('re:spam(?i)')
+
+
+def test_bad_rule_in_file_is_skipped():
+    blocklist = Blocklist(['re:spam(?i)', 're:(?i)promo', '+905551112233'])
+    assert blocklist.matches('PROMO')
+    assert blocklist.matches('+90 555 111 22 33')
+    assert 're:spam(?i)' not in blocklist.rules
+
+
+def test_add_inline_flag_rule_survives_restart(make_app_state):
+    s = make_app_state()
+    s.add_blocked(r're:^TR\d+$')
+    s.add_blocked('re:(?i)spam')
+    s.add_blocked('kampanya*')
+    assert s.blocklist.matches('SPAM') and s.blocklist.matches('kampanyaci')
+    s.close()
+
+    s = make_app_state()
+    assert s.blocked == {r're:^TR\d+$', 're:(?i)spam', 'kampanya*'}
+    assert s.blocklist.matches('Spam')
+    s.close()
+
+
+def test_rejected_rule_leaves_state_untouched(make_app_state, tmp_path):
+    s = make_app_state()
+    s.add_blocked('re:(?i)spam')
+    with pytest.raises(BlocklistError):
+        s.add_blocked('re:spam(?i)')
+    assert s.blocked == {'re:(?i)spam'}
+    s.close()
+    assert json.loads((tmp_path / 'blocked.json').read_text()) == ['re:(?i)spam']
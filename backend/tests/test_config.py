@@ -0,0 +1,38 @@
+import pytest
+
+
+@pytest.fixture
+def client(app_module, app_state, monkeypatch):
+    monkeypatch.setattr(app_module, 'state', app_state)
+    return app_module.app.test_client()
+
+
+@pytest.mark.parametrize('config', [
+    {'poll_min_interval': 'abc'},
+    {'poll_min_interval': '2'},
+    {'poll_max_interval': None},
+    {'adb_poll_interval': 0},
+    {'adb_poll_interval': float('nan')},
+    {'max_sync_workers': 2.5},
+    {'max_sync_workers': True},
+    {'max_sync_workers': 1e9},
+    {'poll_min_interval': 30, 'poll_max_interval': 10},
+    ['poll_min_interval', 1],
+])
+def test_bad_settings_get_400_and_change_nothing(client, app_state, config):
+    before = app_state.get_config()
+    response = client.post('/api/config', json=config)
+    assert response.status_code == 400 and response.get_json()['error']
+    assert app_state.get_config() == before
+
+
+def test_good_settings_are_saved(client, app_module, app_state, monkeypatch):
+    for bound in ('min_interval', 'max_interval'): # Restored after the test
+        monkeypatch.setattr(app_module.poll_scheduler, bound, getattr(app_module.poll_scheduler, bound))
+    response = client.post('/api/config', json={'poll_min_interval': 2, 'poll_max_interval': 30.5,
+                                                'max_sync_workers': 4.0, 'sound_enabled': False})
+    assert response.status_code == 200
+    config = app_state.get_config()
+    assert (config['poll_min_interval'], config['poll_max_interval']) == (2.0, 30.5)
+    assert config['max_sync_workers'] == 4 and isinstance(config['max_sync_workers'], int)
+    assert app_module.poll_scheduler.min_interval == 2.0
@@ -0,0 +1,42 @@
+import json
+
+import pytest
+
+from connection_log import ConnectionLog
+
+
+@pytest.fixture
+def connection_log(tmp_path):
+    path = tmp_path / 'connection_logs.jsonl'
+    # Reconnect storms log several entries within the same microsecond
+    times = ['2024-01-01T10:00:00'] * 4 + ['2024-01-01T10:00:01'] * 5 + ['2024-01-01T10:00:02']
+    with open(path, 'w', encoding='utf-8') as f:
+        for n, logged_at in enumerate(times):
+            f.write(json.dumps({'n': n, 'type': 'wifi' if n % 2 else 'adb', 'logged_at': logged_at}) + '\n')
+    return ConnectionLog(str(path), compress=False)
+
+
+def pages(log, limit, **filters):
+    cursor, seen = None, []
+    while True:
+        entries, cursor = log.query(limit=limit, cursor=cursor, **filters)
+        seen.extend(e['n'] for e in entries)
+        if cursor is None:
+            return seen
+
+
+@pytest.mark.parametrize('limit', [1, 2, 3, 4, 100])
+def test_pages_dont_skip_entries_sharing_a_timestamp(connection_log, limit):
+    assert pages(connection_log, limit) == list(range(9, -1, -1))
+    assert pages(connection_log, limit, type='wifi') == [9, 7, 5, 3, 1]
+
+
+def test_logs_route(app_module, connection_log, monkeypatch):
+    monkeypatch.setattr(app_module, 'connection_log', connection_log)
+    client = app_module.app.test_client()
+    first = client.get('/api/logs?limit=3').get_json()
+    assert [e['n'] for e in first['logs']] == [9, 8, 7]
+    rest = client.get('/api/logs', query_string={'limit': 100, 'cursor': first['next_cursor']}).get_json()
+    assert [e['n'] for e in rest['logs']] == list(range(6, -1, -1)) and rest['next_cursor'] is None
+    assert client.get('/api/logs?limit=abc').status_code == 400
+    assert client.get('/api/logs?cursor=2024-01-01T10:00:00').status_code == 400
@@ -0,0 +1,24 @@
+import logging
+
+from debug_log import RateLimitFilter
+
+
+def record(msg, *args):
+    return logging.LogRecord('sync', logging.INFO, __file__, 1, msg, args, None)
+
+
+def test_same_template_with_other_args_is_not_suppressed():
+    limiter = RateLimitFilter(window=60, burst=2)
+    assert all(limiter.filter(record("Synced %d new messages from %s", n, 'R58M')) for n in range(10))
+
+
+def test_repeats_are_suppressed_and_counted():
+    limiter = RateLimitFilter(window=60, burst=2)
+    results = [limiter.filter(record("Device %s offline", 'R58M')) for _ in range(5)]
+    assert results == [True, True, False, False, False]
+    assert limiter.filter(record("Device %s offline", 'other'))
+
+    limiter.window = 0 # The next one starts a new window and reports the dropped ones
+    again = record("Device %s offline", 'R58M')
+    assert limiter.filter(again)
+    assert again.getMessage() == "Device R58M offline (+3 identical messages suppressed)"
@@ -0,0 +1,40 @@
+import json
+
+
+def resync(ingest, device, rows):
+    """A full resync of rows (sender, timestamp, message) through app.ingest_batches"""
+    results = ingest([{'sender': s, 'timestamp': t, 'message': m, 'device': device} for s, t, m in rows],
+                     initial=True)
+    return [r['status'] for r in results]
+
+
+def test_migrated_rows_are_not_stored_again_on_resync(tmp_path, make_app_state, ingest, app_module, monkeypatch):
+    rows = [('+905551112233', '2024-01-01T10:00:00', 'Merhaba'),
+            ('BANKA', '2024-01-02T11:30:00', 'Kod: 1234')]
+    legacy = [{'id': i + 1, 'sender': s, 'timestamp': t, 'message': m, 'read': True}
+              for i, (s, t, m) in enumerate(rows)]
+    (tmp_path / 'sms_storage.json').write_text(json.dumps(legacy), encoding='utf-8')
+
+    state = make_app_state(migrate=True)
+    monkeypatch.setattr(app_module, 'state', state)
+    assert len(state.messages) == 2 and not state.sender_unread
+    assert resync(ingest, 'R58M123', rows) == ['duplicate', 'duplicate']
+    assert len(state.messages) == 2 and not state.sender_unread
+    assert {sms['device'] for sms in state.messages.values()} == {'R58M123'}
+    state.close()
+
+    # Re-keyed to the device for good: the next resync is a plain duplicate
+    state = make_app_state(migrate=True)
+    monkeypatch.setattr(app_module, 'state', state)
+    assert resync(ingest, 'R58M123', rows + [('BANKA', '2024-01-03T09:00:00', 'Yeni')]) \
+        == ['duplicate', 'duplicate', 'inserted']
+    assert len(state.messages) == 3
+
+
+def test_legacy_row_is_claimed_by_one_device_only(ingest, app_state):
+    row = ('ANNE', '2024-01-01T10:00:00', 'Aksam yemege gel')
+    assert resync(ingest, '', [row]) == ['inserted']
+    assert resync(ingest, 'phone-a', [row]) == ['duplicate']
+    # Another phone with the same SMS keeps its own copy, as for any other row
+    assert resync(ingest, 'phone-b', [row]) == ['inserted']
+    assert sorted(sms['device'] for sms in app_state.messages.values()) == ['phone-a', 'phone-b']
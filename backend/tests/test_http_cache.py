@@ -0,0 +1,36 @@
+import pytest
+
+from dedupe import dedupe_key
+
+
+@pytest.fixture
+def client(app_module, app_state, monkeypatch):
+    monkeypatch.setattr(app_module, 'state', app_state)
+    app_state.insert_batch([{'sender': 'ANNE', 'message': f'mesaj {n}', 'timestamp': f'2024-01-01T10:00:{n:02d}',
+                             'dedupe_key': dedupe_key('', 'ANNE', str(n), 'x')} for n in range(30)])
+    return app_module.app.test_client()
+
+
+def test_malformed_args_get_400_even_with_a_matching_etag(client):
+    etag = client.get('/api/sms?limit=5').headers['ETag']
+    assert client.get('/api/sms?limit=5', headers={'If-None-Match': etag}).status_code == 304
+    for query in ('limit=abc', 'before=nope', 'after=2024|x', 'since_id=1.5'):
+        response = client.get(f'/api/sms?{query}', headers={'If-None-Match': etag})
+        assert response.status_code == 400, query
+    assert client.get('/api/conversations?offset=x').status_code == 400
+
+
+def test_cache_is_bounded_by_bytes(client, app_module, monkeypatch):
+    cache = app_module.response_cache
+    monkeypatch.setattr(cache, 'entries', type(cache.entries)())
+    monkeypatch.setattr(cache, 'size', 0)
+    monkeypatch.setattr(cache, 'max_bytes', 8000)
+    for limit in range(1, 30):
+        assert client.get(f'/api/sms?limit={limit}').status_code == 200
+        assert cache.size <= cache.max_bytes
+    assert cache.size == sum(cache._entry_size(e) for e in cache.entries.values())
+    assert len(cache.entries) < 29
+
+    # The whole inbox is served but not kept
+    assert len(client.get('/api/sms').json['sms_list']) == 30
+    assert not any(key.startswith('/api/sms?') and 'limit' not in key for key in cache.entries)
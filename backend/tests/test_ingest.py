@@ -0,0 +1,48 @@
+import threading
+
+import pytest
+
+from dedupe import dedupe_key
+from ingest import IngestQueue
+
+
+def test_bad_syncer_rows_are_reported_invalid(ingest, app_state):
+    results = ingest([
+        {'sender': None, 'message': 'x', 'timestamp': '2024-01-01T10:00:00', 'device': 'R58M'},
+        {'message': 'no sender', 'timestamp': '2024-01-01T10:00:00', 'device': 'R58M'},
+        {'sender': 'ANNE', 'message': None, 'timestamp': '2024-01-01T10:00:00', 'device': 'R58M'},
+        {'sender': 'ANNE', 'message': 'Merhaba', 'timestamp': '2024-01-01T10:00:00', 'device': 'R58M'},
+    ], initial=True)
+    assert [r['status'] for r in results] == ['invalid', 'invalid', 'invalid', 'inserted']
+    assert len(app_state.messages) == 1
+
+
+def test_failing_batch_does_not_fail_the_others():
+    gate = threading.Event()
+
+    def handler(batches):
+        if any(b.options.get('gate') for b in batches):
+            gate.wait(5) # Holds the worker so the next three are coalesced
+        if any(b.options.get('poison') for b in batches):
+            raise ValueError('bad batch')
+        return [[len(b.rows)] for b in batches]
+
+    queue = IngestQueue(handler)
+    queue.submit([0], gate=True)
+    futures = [queue.submit([1, 2]), queue.submit([3], poison=True), queue.submit([4])]
+    gate.set()
+    assert futures[0].result(5) == [2]
+    with pytest.raises(ValueError):
+        futures[1].result(5)
+    assert futures[2].result(5) == [1]
+    assert queue.metrics['max_coalesced'] >= 3
+    queue.close()
+
+
+def test_rows_without_timestamp_are_hashed_as_stored(ingest, app_state):
+    for timestamp in (None, ''):
+        row = {'sender': 'ANNE', 'message': 'Tamam', 'timestamp': timestamp, 'device': 'R58M'}
+        assert ingest([row], initial=True)[0]['status'] == 'inserted'
+    for sms in app_state.messages.values():
+        assert sms['timestamp']
+        assert sms['dedupe_key'] == dedupe_key('R58M', 'ANNE', sms['timestamp'], 'Tamam')
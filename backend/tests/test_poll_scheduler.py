@@ -0,0 +1,32 @@
+import time
+
+from poll_scheduler import PollScheduler
+
+
+def test_visible_while_any_client_is():
+    scheduler = PollScheduler()
+    assert scheduler.set_visible(True, 'tab:a', ttl=60) is False
+    assert scheduler.set_visible(False, 'tab:b', ttl=60) is False
+    assert scheduler.visible # The last report doesn't win
+    assert scheduler.set_visible(False, 'tab:a', ttl=60) is True
+    assert not scheduler.visible
+    assert scheduler.set_visible(True, 'window') is True
+
+
+def test_clients_that_stop_reporting_expire():
+    scheduler = PollScheduler()
+    scheduler.set_visible(False, 'window')
+    scheduler.set_visible(True, 'tab:a', ttl=0.05)
+    assert scheduler.visible
+    time.sleep(0.06)
+    scheduler.next_delay('phone', base=5)
+    assert not scheduler.visible and 'tab:a' not in scheduler.clients
+
+
+def test_hidden_app_stretches_idle_polls():
+    scheduler = PollScheduler(min_interval=1, max_interval=60)
+    scheduler.set_visible(False, 'tab:a', ttl=60)
+    for _ in range(20): delay = scheduler.next_delay('phone', base=5)
+    assert delay > 5 * 2 * 1.1
+    assert scheduler.set_visible(True, 'tab:b', ttl=60)
+    assert scheduler.next_delay('phone', base=5) <= 5 * 1.1
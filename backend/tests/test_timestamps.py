@@ -0,0 +1,35 @@
+from datetime import datetime
+
+from dedupe import dedupe_key
+from sms_store import normalize_timestamp
+from wifi_syncer import WiFiSyncer
+
+MILLIS = 1792350066421
+ISO = datetime.fromtimestamp(MILLIS / 1000.0).isoformat()
+
+
+def test_epoch_millis_become_iso():
+    assert normalize_timestamp(MILLIS) == normalize_timestamp(str(MILLIS)) == ISO
+    for value in ('2026-10-18T10:00:00', '20240101', None, ''):
+        assert normalize_timestamp(value) == value
+
+
+def test_wifi_rows_sort_with_adb_rows():
+    rows = WiFiSyncer(None, None)._to_app_format(
+        [{'address': 'ANNE', 'body': 'x', 'date': MILLIS}, {'address': 'ANNE', 'body': 'y'}], '10.0.0.5')
+    assert [r['timestamp'] for r in rows] == [ISO, None]
+    assert sorted([rows[0]['timestamp'], '2026-01-01T09:00:00'])[0] == '2026-01-01T09:00:00'
+
+
+def test_stored_millis_are_converted_on_load(make_app_state):
+    state = make_app_state()
+    state.insert_batch([{'sender': 'ANNE', 'message': 'x', 'timestamp': str(MILLIS), 'device': '10.0.0.5',
+                         'dedupe_key': dedupe_key('10.0.0.5', 'ANNE', str(MILLIS), 'x')}])
+    state.close()
+
+    state = make_app_state()
+    sms, = state.messages.values()
+    assert sms['timestamp'] == ISO
+    assert state.exists(dedupe_key('10.0.0.5', 'ANNE', ISO, 'x'))
+    state.close()
+    assert make_app_state().store.load_all()[0]['timestamp'] == ISO
@@ -1,87 +1,185 @@
-import requests
-import time
-import threading
-from datetime import datetime
+import asyncio
+import logging
+
+from http_client import AsyncHTTPClient, HTTPError
+from sms_store import normalize_timestamp
+from sync_engine import backoff_delay
+
+log = logging.getLogger(__name__)
+
+CURSOR_KEY = 'wifi_cursor:'
+PAGE_SIZE = 200
+PHONE_PORT = 8080
+LONG_POLL_TIMEOUT = 25 # Seconds the phone holds /sms/wait open
+RECONCILE_INTERVAL = 30 # Poll interval while push is working
+REQUEST_TIMEOUT = 3 # Short timeout to keep UI responsive
 
 class WiFiSyncer:
-    def __init__(self, app_logger, on_sms_callback):
+    """Syncs one phone over WiFi. Runs on the sync engine's loop: poll_once()
+    is the reconciler pass DeviceManager schedules, push_loop() is a task of
+    its own, and cancelling them is how the device stops."""
+
+    def __init__(self, app_logger, on_sms_callback, state_store=None):
         self.active_ip = None
         self.is_running = False
-        self.stop_event = threading.Event()
         self.logger = app_logger
-        self.on_sms_received = on_sms_callback
-        self.thread = None
-
-    def start_sync(self, ip_address):
-        """Start syncing with a specific IP address."""
-        if self.is_running and self.active_ip == ip_address:
-            return  # Already syncing this IP
-        
-        # Stop existing sync if any
+        self.on_sms_received = on_sms_callback # Coroutine (rows, final=...)
+        self.state_store = state_store # Persists the per-phone (date, _id) cursor
+        self.cursors = {} # Used instead when there is no state_store
+        self.push_active = False
+        self.battery = None # {'level', 'charging'} if the phone app reports it
+        self.fetch_lock = asyncio.Lock() # Push and poll share the cursor
+        # Keep-alive connections to the phone instead of a new one per poll;
+        # the long-poll gets its own so it never blocks the reconciler
+        self.client = None
+        self.push_client = None
+
+    def attach(self, ip_address):
         self.stop_sync()
-        
         self.active_ip = ip_address
-        self.stop_event.clear()
+        host, port = self._host_port(ip_address)
+        self.client = AsyncHTTPClient(host, port)
+        self.push_client = AsyncHTTPClient(host, port)
         self.is_running = True
-        
-        self.thread = threading.Thread(target=self._sync_loop, daemon=True)
-        self.thread.start()
-        print(f"WiFi Sync started for {ip_address}")
 
     def stop_sync(self):
-        """Stop current sync process."""
+        """Drops the connections; the caller cancels the tasks"""
         self.is_running = False
-        self.stop_event.set()
-        if self.thread:
-            self.thread.join(timeout=2)
+        self.push_active = False
+        for client in (self.client, self.push_client):
+            if client: client.close()
         self.active_ip = None
 
     def get_status(self):
         return {
             "active": self.is_running,
             "device": f"WiFi ({self.active_ip})" if self.active_ip else None,
-            "type": "wifi"
+            "type": "wifi",
+            "push": self.push_active
         }
 
-    def _sync_loop(self):
-        error_count = 0
-        while not self.stop_event.is_set():
+    def _host_port(self, ip):
+        # Plain IPs use the phone app's port, "host:port" is for the simulator
+        if ':' in ip:
+            host, port = ip.rsplit(':', 1)
+            return host, int(port)
+        return ip, PHONE_PORT
+
+    def get_cursor(self, ip):
+        if not self.state_store: return self.cursors.get(ip)
+        return self.state_store.get_meta(CURSOR_KEY + ip)
+
+    def set_cursor(self, ip, cursor):
+        if self.state_store:
+            self.state_store.set_meta(CURSOR_KEY + ip, cursor)
+        else:
+            self.cursors[ip] = cursor
+
+    def reset_cursors(self):
+        """Forget every phone's cursor so the next connect re-imports its inbox"""
+        self.cursors.clear()
+        if self.state_store:
+            self.state_store.delete_meta(CURSOR_KEY, prefix=True)
+
+    def poll_delay(self):
+        """Seconds until the next reconcile pass"""
+        return RECONCILE_INTERVAL if self.push_active else 2
+
+    def _to_app_format(self, raw_list, ip):
+        sms_list = []
+        for item in raw_list:
+            # Android app sends 'date' as long (millis); stored as ISO like the
+            # ADB rows, only the cursor keeps the millis
+            sms_list.append({
+                'sender': item.get('address', 'Unknown'),
+                'message': item.get('body', ''),
+                'timestamp': normalize_timestamp(item.get('date')) or None,
+                'device': ip
+            })
+        return sms_list
+
+    async def _apply_page(self, ip, cursor, data):
+        """Stores one delta page and advances the cursor, returns the new cursor"""
+        has_more = data.get('has_more', False)
+        if isinstance(data.get('battery'), dict):
+            self.battery = data['battery']
+        await self.on_sms_received(self._to_app_format(data.get('messages', []), ip), final=not has_more)
+        new_cursor = {'date': data.get('next_since', cursor['date']), 'id': data.get('next_since_id', cursor['id'])}
+        # Never move backwards (a page may have been requested from an older cursor)
+        if (new_cursor['date'], new_cursor['id']) > (cursor['date'], cursor['id']):
+            self.set_cursor(ip, new_cursor)
+            return new_cursor
+        return cursor
+
+    async def poll_once(self):
+        """Pages through everything after the stored cursor, raises on failure"""
+        ip = self.active_ip
+        async with self.fetch_lock:
+            cursor = self.get_cursor(ip) or {'date': 0, 'id': 0}
+            while True:
+                response = await self.client.get("/sms", {
+                    'since': cursor['date'],
+                    'since_id': cursor['id'],
+                    'limit': PAGE_SIZE
+                }, timeout=REQUEST_TIMEOUT)
+                if response.status_code != 200:
+                    raise HTTPError(f"WiFi Error: {response.status_code}")
+
+                data = response.json()
+                if isinstance(data, list):
+                    # Older phone app without the delta API: latest 50 only
+                    await self.on_sms_received(self._to_app_format(data, ip))
+                    return
+
+                cursor = await self._apply_page(ip, cursor, data)
+                if not data.get('has_more', False):
+                    return
+
+    async def push_loop(self):
+        """Holds a long-poll open against the phone's /sms/wait so new messages
+        arrive as soon as SmsReceiver fires. The reconciler keeps running
+        slowly and takes over if push is unavailable."""
+        ip = self.active_ip
+        drained = False
+        errors = 0
+        while True:
             try:
-                url = f"http://{self.active_ip}:8080/sms"
-                # Short timeout to keep UI responsive
-                response = requests.get(url, timeout=3)
-                
-                if response.status_code == 200:
-                    raw_data = response.json()
-                    # Convert to app format
-                    sms_list = []
-                    for item in raw_data:
-                        # Android app sends 'date' as long (millis)
-                        # We need 'timestamp' as ISO string or something parseable
-                        ts_val = item.get('date', 0)
-                        
-                        sms_list.append({
-                            'sender': item.get('address', 'Unknown'),
-                            'message': item.get('body', ''),
-                            # Backend expects 'timestamp' key. 
-                            # If it's millis, passing it as is works if frontend parses it,
-                            # but let's be safe and pass as string
-                            'timestamp': str(ts_val) 
-                        })
-                    
-                    if sms_list:
-                        # Send to main app logic
-                        self.on_sms_received(sms_list)
-                        error_count = 0
-                else:
-                    print(f"WiFi Error: {response.status_code}")
-                    error_count += 1
-            
-            except Exception as e:
-                print(f"WiFi Connection Error: {e}")
-                error_count += 1
-            
-            # If too many errors, maybe pause longer?
-            sleep_time = 5 if error_count > 3 else 2
-            time.sleep(sleep_time)
+                if not drained:
+                    # Catch up on the backlog first so the long-poll doesn't
+                    # race the pager over the same pages
+                    await self.poll_once()
+                    drained = self.push_active = True
+                    continue
+                cursor = self.get_cursor(ip) or {'date': 0, 'id': 0}
+                response = await self.push_client.get("/sms/wait", {
+                    'since': cursor['date'],
+                    'since_id': cursor['id'],
+                    'limit': PAGE_SIZE,
+                    'timeout': LONG_POLL_TIMEOUT
+                }, timeout=LONG_POLL_TIMEOUT + 10)
+                if response.status_code == 404:
+                    log.info("Phone has no /sms/wait, staying on polling")
+                    self.push_active = False
+                    return
+                if response.status_code != 200:
+                    raise HTTPError(f"status {response.status_code}")
 
+                data = response.json()
+                self.push_active = True
+                errors = 0
+                async with self.fetch_lock:
+                    # The reconciler may have moved the cursor meanwhile; the
+                    # dedupe key makes re-applying a page harmless
+                    current = self.get_cursor(ip) or cursor
+                    await self._apply_page(ip, current, data)
+                if data.get('has_more'):
+                    # Let the regular pager drain the backlog right away
+                    await self.poll_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if self.push_active:
+                    log.warning("WiFi push error: %s", e)
+                self.push_active = False
+                errors += 1
+                await asyncio.sleep(backoff_delay(errors, base=2, cap=30))
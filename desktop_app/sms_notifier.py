@@ -7,8 +7,8 @@ from plyer import notification
 import threading
 
 # API ayarları
-API_URL = "http://localhost:5000"
-CHECK_INTERVAL = 2  # Saniye cinsinden kontrol aralığı
+API_URL = "http://localhost:5001"
+CHECK_INTERVAL = 2  # Olay akışı koparsa yeniden bağlanmadan önce beklenecek süre
 
 # Son kontrol edilen SMS ID'sini sakla
 LAST_CHECKED_FILE = 'last_checked.json'
@@ -78,16 +78,59 @@ def check_new_sms():
         print(f"Hata: {str(e)}")
         return False
 
+def listen_events():
+    """/api/events akışını dinle, yeni SMS geldiği anda bildirim göster"""
+    last_event_id = None
+    headers = {}
+    while True:
+        if last_event_id:
+            headers['Last-Event-ID'] = last_event_id
+        try:
+            with requests.get(f"{API_URL}/api/events", headers=headers, stream=True, timeout=(5, 60)) as response:
+                response.raise_for_status()
+                event_type, data_lines = None, []
+                for line in response.iter_lines(decode_unicode=True):
+                    if line is None:
+                        continue
+                    if line.startswith('id:'):
+                        last_event_id = line[3:].strip()
+                    elif line.startswith('event:'):
+                        event_type = line[6:].strip()
+                    elif line.startswith('data:'):
+                        data_lines.append(line[5:].strip())
+                    elif line == '':
+                        if event_type == 'sms' and data_lines:
+                            handle_sms_event(json.loads("\n".join(data_lines)))
+                        elif event_type == 'resync':
+                            # Kaçırılan olaylar tamponda yok, listeyi bir kez tara
+                            check_new_sms()
+                        event_type, data_lines = None, []
+        except requests.exceptions.ConnectionError:
+            print("API'ye bağlanılamıyor. Backend çalışıyor mu?")
+        except Exception as e:
+            print(f"Olay akışı hatası: {str(e)}")
+        time.sleep(CHECK_INTERVAL)
+
+def handle_sms_event(data):
+    """'sms' olayındaki yeni mesajlar için bildirim göster"""
+    last_checked_id = load_last_checked()
+    newest_id = last_checked_id
+    for sms in data.get('messages', []):
+        if sms['id'] > last_checked_id:
+            show_notification(sms['sender'], sms['message'])
+            newest_id = max(newest_id, sms['id'])
+    if newest_id > last_checked_id:
+        save_last_checked(newest_id)
+
 def main_loop():
-    """Ana döngü - sürekli kontrol et"""
+    """Ana döngü - olay akışını dinle"""
     print("SMS Bildirici başlatıldı...")
     print(f"API: {API_URL}")
-    print(f"Kontrol aralığı: {CHECK_INTERVAL} saniye")
     print("Çıkmak için Ctrl+C basın\n")
     
-    while True:
-        check_new_sms()
-        time.sleep(CHECK_INTERVAL)
+    # Başlangıçta kaçırılanları yakala, sonra anlık olayları bekle
+    check_new_sms()
+    listen_events()
 
 if __name__ == '__main__':
     try:
@@ -62,18 +62,91 @@ function App() {
   const [showSettingsModal, setShowSettingsModal] = useState(false);
   const [appConfig, setAppConfig] = useState({ sound_enabled: true, notification_enabled: true });
 
+  const PAGE_SIZE = 200;
+  const fetchGeneration = useRef(0);
+  // Cursors of the loaded window: newest (for after= deltas) and oldest (next older page)
+  const newestCursor = useRef(null);
+  const olderCursor = useRef(null);
+  const loadingOlder = useRef(false);
+
+  const fetchStatus = async () => {
+    const status = await api.getStatus();
+    setSyncStatus(status);
+  };
+
+  // Newest page only; older history is loaded as the lists are scrolled
   const fetchData = async () => {
     setLoading(true);
-    const data = await api.getMessages();
-    setMessages(data);
+    const generation = ++fetchGeneration.current;
+    const page = await api.getMessagesPage({ limit: PAGE_SIZE });
+    if (generation !== fetchGeneration.current) return;
+    setMessages(page.sms_list || []);
+    newestCursor.current = page.newest_cursor || null;
+    olderCursor.current = page.next_cursor || null;
     setLoading(false);
     setLastRefreshed(new Date());
+    await fetchStatus();
+  };
 
-    // Also check status
-    const status = await api.getStatus();
-    setSyncStatus(status);
+  // Only what arrived after the newest loaded message (safety net for missed events)
+  const fetchNewer = async () => {
+    if (!newestCursor.current) return fetchData();
+    const generation = fetchGeneration.current;
+    let page;
+    do {
+      page = await api.getMessagesPage({ limit: PAGE_SIZE, after: newestCursor.current });
+      if (generation !== fetchGeneration.current) return;
+      const newer = page.sms_list || [];
+      setMessages(prev => {
+        const known = new Set(prev.map(m => m.id));
+        return [...newer.filter(m => !known.has(m.id)), ...prev];
+      });
+      if (page.newest_cursor) newestCursor.current = page.newest_cursor;
+    } while ((page.sms_list || []).length === PAGE_SIZE);
+    setLastRefreshed(new Date());
+    await fetchStatus();
+  };
+
+  const loadOlder = async () => {
+    if (!olderCursor.current || loadingOlder.current) return false;
+    loadingOlder.current = true;
+    const generation = fetchGeneration.current;
+    try {
+      const page = await api.getMessagesPage({ limit: PAGE_SIZE, before: olderCursor.current });
+      if (generation !== fetchGeneration.current) return false;
+      const older = page.sms_list || [];
+      setMessages(prev => {
+        const known = new Set(prev.map(m => m.id));
+        return [...prev, ...older.filter(m => !known.has(m.id))];
+      });
+      olderCursor.current = page.next_cursor || null;
+      return older.length > 0;
+    } finally {
+      loadingOlder.current = false;
+    }
   };
 
+  const SCROLL_MARGIN = 200; // px from the end of a list that loads the next older page
+
+  const onListScroll = (e) => {
+    const el = e.currentTarget;
+    if (el.scrollHeight - el.scrollTop - el.clientHeight < SCROLL_MARGIN) loadOlder();
+  };
+
+  // Chat reads oldest on top: near the top loads older, keeping the view where it was
+  const onChatScroll = async (e) => {
+    const el = e.currentTarget;
+    if (el.scrollTop > SCROLL_MARGIN) return;
+    const height = el.scrollHeight;
+    if (await loadOlder()) {
+      requestAnimationFrame(() => { el.scrollTop += el.scrollHeight - height; });
+    }
+  };
+
+  // Several phones can sync at once; the status lists each of them
+  const isConnected = (serial) =>
+    (syncStatus.devices || []).some(d => d.device === serial);
+
   const fetchDevices = async () => {
     const list = await api.getDevices();
     setDevices(list);
@@ -96,8 +169,8 @@ function App() {
   };
 
   const openLogs = async () => {
-    const logData = await api.getLogs();
-    setLogs(logData.reverse()); // Show newest first
+    const logData = await api.getLogs({ limit: 200 });
+    setLogs(logData); // Already newest first
     setShowLogsModal(true);
   };
 
@@ -126,8 +199,41 @@ function App() {
 
   useEffect(() => {
     fetchData();
-    const interval = setInterval(fetchData, 5000); // Poll every 5s
-    return () => clearInterval(interval);
+    // Pushed changes instead of polling; slow interval only as a safety net
+    const unsubscribe = api.subscribeEvents({
+      sms: ({ messages: incoming = [] }) => {
+        setMessages(prev => {
+          const known = new Set(prev.map(m => m.id));
+          return [...incoming.filter(m => !known.has(m.id)).reverse(), ...prev];
+        });
+        setLastRefreshed(new Date());
+      },
+      read: ({ ids = [], read = true }) => {
+        const readIds = new Set(ids);
+        setMessages(prev => prev.map(m => readIds.has(m.id) ? { ...m, read } : m));
+      },
+      delete: ({ ids = [] }) => {
+        const deleted = new Set(ids);
+        setMessages(prev => prev.filter(m => !deleted.has(m.id)));
+      },
+      block: fetchData,
+      clear: fetchData,
+      status: fetchStatus,
+      resync: fetchData, // Events were missed, deletes and read flags included
+    });
+    const interval = setInterval(fetchNewer, 60000);
+    // Hidden tab: phones may poll slowly (once no other tab or window is shown);
+    // visible again: poll them right away. Repeated so the backend knows the tab is still open
+    const onVisibility = () => api.setVisibility(document.visibilityState === 'visible');
+    onVisibility();
+    const heartbeat = setInterval(onVisibility, 30000);
+    document.addEventListener('visibilitychange', onVisibility);
+    return () => {
+      unsubscribe();
+      clearInterval(interval);
+      clearInterval(heartbeat);
+      document.removeEventListener('visibilitychange', onVisibility);
+    };
   }, []);
 
   // Show modal if not connected and no messages (first run)
@@ -226,10 +332,32 @@ function App() {
   }, [conversations]);
 
 
-  const filteredConversations = conversations.filter(c =>
-    c.sender.toLowerCase().includes(searchTerm.toLowerCase()) ||
-    c.lastMessage.message.toLowerCase().includes(searchTerm.toLowerCase())
-  );
+  // Search runs on the backend index over the whole history, not only the
+  // pages loaded so far; senders with a hit are listed best match first
+  const [searchHits, setSearchHits] = useState(null);
+  useEffect(() => {
+    const query = searchTerm.trim();
+    if (!query) {
+      setSearchHits(null);
+      return;
+    }
+    let cancelled = false;
+    const timer = setTimeout(async () => {
+      const result = await api.search({ q: query, limit: 500 });
+      if (cancelled) return;
+      const order = new Map();
+      (result.sms_list || []).forEach(msg => {
+        if (!order.has(msg.sender)) order.set(msg.sender, order.size);
+      });
+      setSearchHits(order);
+    }, 250);
+    return () => { cancelled = true; clearTimeout(timer); };
+  }, [searchTerm]);
+
+  const filteredConversations = searchHits
+    ? conversations.filter(c => searchHits.has(c.sender))
+      .sort((a, b) => searchHits.get(a.sender) - searchHits.get(b.sender))
+    : conversations;
 
   const activeConversation = selectedSender ? conversations.find(c => c.sender === selectedSender) : null;
 
@@ -327,15 +455,15 @@ function App() {
                           </div>
                           <button
                             onClick={() => handleConnect(dev.serial, false)}
-                            disabled={syncStatus.active && syncStatus.device === dev.serial}
+                            disabled={isConnected(dev.serial)}
                             className={cn(
                               "px-3 py-1.5 rounded-md text-sm font-medium transition-all",
-                              syncStatus.active && syncStatus.device === dev.serial
+                              isConnected(dev.serial)
                                 ? "bg-green-500/10 text-green-500 cursor-default"
                                 : "bg-primary text-primary-foreground hover:bg-primary/90"
                             )}
                           >
-                            {syncStatus.active && syncStatus.device === dev.serial ? 'Bağlı' : 'Bağlan'}
+                            {isConnected(dev.serial) ? 'Bağlı' : 'Bağlan'}
                           </button>
                         </div>
                       ))}
@@ -356,6 +484,9 @@ function App() {
                       <span>
                         {syncStatus.type === 'wifi' ? 'Wi-Fi Senkronizasyon: ' : 'USB Senkronizasyon: '}
                         <span className="text-foreground font-medium">{syncStatus.device}</span>
+                        {syncStatus.devices?.length > 1 && (
+                          <span> (+{syncStatus.devices.length - 1} cihaz daha)</span>
+                        )}
                       </span>
                     </>
                   ) : (
@@ -563,7 +694,7 @@ function App() {
           </div>
 
           {/* List */}
-          <div className="flex-1 overflow-y-auto">
+          <div className="flex-1 overflow-y-auto" onScroll={onListScroll}>
             {conversations.length === 0 && !loading && (
               <div className="flex flex-col items-center justify-center h-48 text-muted-foreground p-4 text-center">
                 <p className="mb-2">Görüntülenecek mesaj yok.</p>
@@ -653,7 +784,7 @@ function App() {
               </div>
 
               {/* Messages */}
-              <div ref={chatContainerRef} className="flex-1 overflow-y-auto p-4 space-y-4 bg-muted/5 relative scroll-smooth">
+              <div ref={chatContainerRef} onScroll={onChatScroll} className="flex-1 overflow-y-auto p-4 space-y-4 bg-muted/5 relative scroll-smooth">
                 {activeConversation?.messages.map((msg) => (
                   <div key={msg.id} className="flex flex-col gap-1 items-start">
                     <div className="max-w-[70%] bg-card border border-border p-3 rounded-2xl border-l-4 border-l-primary shadow-sm">
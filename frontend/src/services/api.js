@@ -1,8 +1,12 @@
 import axios from 'axios';
 
-// Ensure we point to the correct port 5001 where the new backend runs
-// Using absolute URL to avoid any relative path ambiguity in hybrid mode
-const API_URL = 'http://127.0.0.1:5001/api';
+// The built UI is served by the backend itself (desktop window or a headless
+// server other desktops open in a browser), so it talks to whichever host
+// served it; the Vite dev server still points at the local backend on 5001
+const API_URL = import.meta.env.DEV ? 'http://127.0.0.1:5001/api' : '/api';
+
+// Identifies this tab to the backend (visibility is tracked per tab)
+const CLIENT_ID = (globalThis.crypto?.randomUUID?.() || Math.random().toString(36).slice(2));
 
 export const api = {
     // Devices
@@ -47,6 +51,42 @@ export const api = {
         }
     },
 
+    // Get one page of SMS: { sms_list, next_cursor, newest_cursor }
+    // params: limit, before, after, sender, unread_only, since_id
+    getMessagesPage: async (params = {}) => {
+        try {
+            const response = await axios.get(`${API_URL}/sms`, { params });
+            return response.data;
+        } catch (error) {
+            console.error("Error fetching messages:", error);
+            return { sms_list: [], next_cursor: null };
+        }
+    },
+
+    // One summary per sender, latest first: { total, conversations, next_offset }
+    // each { sender, sender_norm, count, unread, last_message }; params: limit, offset, unread_only
+    getConversations: async (params = {}) => {
+        try {
+            const response = await axios.get(`${API_URL}/conversations`, { params });
+            return response.data;
+        } catch (error) {
+            console.error("Error fetching conversations:", error);
+            return { total: 0, conversations: [] };
+        }
+    },
+
+    // Full-text search over the whole history: { total, sms_list, next_offset }
+    // params: q, limit, offset, sender
+    search: async (params = {}) => {
+        try {
+            const response = await axios.get(`${API_URL}/search`, { params });
+            return response.data;
+        } catch (error) {
+            console.error("Error searching:", error);
+            return { total: 0, sms_list: [] };
+        }
+    },
+
     // Get unread count or messages
     getUnread: async () => {
         try {
@@ -69,6 +109,29 @@ export const api = {
         }
     },
 
+    // Many at once, one request and one 'read' event:
+    // { ids } | { sender, before } | { all: true }, read: false to mark unread
+    markManyRead: async (selection) => {
+        try {
+            const response = await axios.post(`${API_URL}/sms/read`, selection);
+            return response.data;
+        } catch (error) {
+            console.error("Error marking read:", error);
+            return { success: false };
+        }
+    },
+
+    // { ids } | { sender } | { after, before } (timestamps), one 'delete' event
+    deleteMessages: async (selection) => {
+        try {
+            const response = await axios.post(`${API_URL}/sms/delete`, selection);
+            return response.data;
+        } catch (error) {
+            console.error("Error deleting messages:", error);
+            return { success: false };
+        }
+    },
+
     // Stats
     getStats: async () => {
         try {
@@ -91,6 +154,27 @@ export const api = {
         }
     },
 
+    getBlocked: async () => {
+        try {
+            const response = await axios.get(`${API_URL}/blocked`);
+            return response.data.rules || [];
+        } catch (error) {
+            console.error("Error fetching blocked senders:", error);
+            return [];
+        }
+    },
+
+    // rules: one rule or a list
+    unblock: async (rules) => {
+        try {
+            const response = await axios.post(`${API_URL}/unblock`, { rules: [].concat(rules) });
+            return response.data;
+        } catch (error) {
+            console.error("Error unblocking:", error);
+            return { success: false };
+        }
+    },
+
     // Disconnect
     disconnect: async () => {
         try {
@@ -102,10 +186,11 @@ export const api = {
         }
     },
 
-    // Get Connection Logs
-    getLogs: async () => {
+    // Get Connection Logs, newest first
+    // params: limit, since, until, type, target
+    getLogs: async (params = {}) => {
         try {
-            const response = await axios.get(`${API_URL}/logs`);
+            const response = await axios.get(`${API_URL}/logs`, { params });
             return response.data.logs || [];
         } catch (error) {
             console.error("Error fetching logs:", error);
@@ -135,6 +220,32 @@ export const api = {
         }
     },
 
+    // Live change feed (Server-Sent Events). EventSource reconnects on its own
+    // and sends Last-Event-ID, so only missed events are replayed.
+    subscribeEvents: (handlers) => {
+        const source = new EventSource(`${API_URL}/events`);
+        Object.entries(handlers).forEach(([type, handler]) => {
+            source.addEventListener(type, (e) => {
+                try {
+                    handler(JSON.parse(e.data || '{}'));
+                } catch (error) {
+                    console.error(`Error handling ${type} event:`, error);
+                }
+            });
+        });
+        return () => source.close();
+    },
+
+    // Tell the backend whether the page is visible (adaptive poll intervals)
+    // Per tab; repeat it well within the backend's CLIENT_TTL (90 s) or the tab is forgotten
+    setVisibility: async (visible) => {
+        try {
+            await axios.post(`${API_URL}/ui/visibility`, { visible, client: CLIENT_ID });
+        } catch (error) {
+            console.error("Error reporting visibility:", error);
+        }
+    },
+
     // Save Config
     saveConfig: async (config) => {
         try {